@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Optional
+
+import yaml
+
+from cache_dir import get_cache_dir
+
+ASSERTIONS_CACHE_DIR_NAME = "assertions"
+ASSERTIONS_CACHE_FILE_NAME = "parsed-assertions.json"
+# bump when the format of the cached entries changes
+ASSERTIONS_CACHE_VERSION = 2
+
+# libyaml bindings are an order of magnitude faster than the pure python parser, but might be missing
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+logger = logging.getLogger(__name__)
+
+
+def _validate(file: str, ass: dict) -> None:
+    if not isinstance(ass, dict) or "metadata" not in ass or "kind" not in ass:
+        msg = f"Expected object declared in the '{file}' has to have the 'metadata' and 'kind' properties."
+        logger.error(msg)
+        raise Exception(msg)
+    if "name" not in ass["metadata"]:
+        msg = f"Expected object declared in the '{file}' has to have 'name' property in the 'metadata' section."
+        logger.error(msg)
+        raise Exception(msg)
+
+
+def _json_round_trips(value: Any) -> bool:
+    # JSON turns keys like '1' or 'true' into strings and has no dates or sets, such files aren't cached
+    if isinstance(value, dict):
+        return all(
+            isinstance(k, str) and _json_round_trips(v) for k, v in value.items()
+        )
+    if isinstance(value, list):
+        return all(_json_round_trips(v) for v in value)
+    return value is None or isinstance(value, (str, int, float))
+
+
+def parse_assertions(file: str, content: bytes) -> list[dict]:
+    documents = yaml.load_all(content, Loader=YamlLoader)  # nosec B506 - safe loader
+    assertions = [a for a in documents if a is not None]
+    for ass in assertions:
+        _validate(file, ass)
+    return assertions
+
+
+class AssertionsCache:
+    # Keeps parsed assertion files on disk. An entry is reused as long as the file's mtime didn't change or,
+    # if it did, its content hash is still the same.
+
+    def __init__(self, cache_dir: Optional[str] = None) -> None:
+        self._cache_file = os.path.join(
+            cache_dir or get_cache_dir(ASSERTIONS_CACHE_DIR_NAME),
+            ASSERTIONS_CACHE_FILE_NAME,
+        )
+        self._entries: dict[str, dict] = {}
+        # the files loaded since the cache was opened
+        self._loaded: set[str] = set()
+        self._dirty = False
+        try:
+            with open(self._cache_file) as f:
+                data = json.load(f)
+            if data.get("version") == ASSERTIONS_CACHE_VERSION:
+                self._entries = data["entries"]
+        except (OSError, ValueError):
+            pass
+
+    def load(self, path: str) -> list[dict]:
+        abs_path = os.path.abspath(path)
+        self._loaded.add(abs_path)
+        mtime = os.stat(abs_path).st_mtime_ns
+        entry = self._entries.get(abs_path)
+        if entry is not None and entry["mtime"] == mtime:
+            return entry["assertions"]
+        with open(abs_path, "rb") as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if entry is not None and entry["sha256"] == digest:
+            entry["mtime"] = mtime
+            self._dirty = True
+            return entry["assertions"]
+        assertions = parse_assertions(path, content)
+        if not _json_round_trips(assertions):
+            return assertions
+        self._entries[abs_path] = {
+            "mtime": mtime,
+            "sha256": digest,
+            "assertions": assertions,
+        }
+        self._dirty = True
+        return assertions
+
+    def prune(self, assertions_dir: str) -> None:
+        # Drops the entries of files in 'assertions_dir' that weren't loaded, they were removed or renamed, and
+        # of files that don't exist anymore anywhere else.
+        root = os.path.join(os.path.abspath(assertions_dir), "")
+        stale = [
+            path
+            for path in self._entries
+            if path not in self._loaded
+            and (path.startswith(root) or not os.path.exists(path))
+        ]
+        for path in stale:
+            del self._entries[path]
+        self._dirty |= bool(stale)
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        tmp_file = f"{self._cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(
+                {"version": ASSERTIONS_CACHE_VERSION, "entries": self._entries}, f
+            )
+        os.replace(tmp_file, self._cache_file)
+        self._dirty = False
+
+
+def load_assertions(
+    assertions_dir: str, cache: Optional[AssertionsCache] = None
+) -> dict[str, list[dict]]:
+    # Returns all the expected objects from the '.yaml' files in 'assertions_dir', already validated.
+    cache = cache or AssertionsCache()
+    assertions = {}
+    for dir_path, _, filenames in sorted(os.walk(assertions_dir)):
+        for file in sorted(filenames):
+            rel_path = str(os.path.join(dir_path, file))
+            if os.path.splitext(file)[1] != ".yaml":
+                logger.debug(
+                    f"Ignoring file '{rel_path}' in '{assertions_dir}' as it's not a file or it"
+                    f" doesn't have a '.yaml' extension."
+                )
+                continue
+            assertions[rel_path] = cache.load(rel_path)
+    cache.prune(assertions_dir)
+    cache.save()
+    return assertions
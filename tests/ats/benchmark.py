@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+import argparse
+import cProfile
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess  # nosec B404 - only used to run the tools of this repository
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple, Optional
+
+from assertion_loader import AssertionsCache, load_assertions
+from cache_dir import GITOPS_CACHE_DIR_ENV_VAR_NAME
+from kustomization_index import KustomizationIndex
+from schema_validation import GITOPS_SCHEMA_DIR_ENV_VAR_NAME, get_schema_dir
+from synthetic_repo import ASSERTIONS_DIR, RepoSize, SyntheticRepoGenerator
+
+TOOLS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "tools"
+)
+DEFAULT_SIZES = "1x1x4,2x4x8,4x8x16"
+DEFAULT_REPEAT = 3
+# a benchmark regresses when its median is slower than the baseline by this ratio and at least by the delta,
+# so the noise of very short benchmarks doesn't count
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_MIN_DELTA_SEC = 0.05
+RESULTS_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+class Benchmark(NamedTuple):
+    name: str
+    # gets the root of the generated repository and a cache directory, which is empty for cold runs and kept
+    # from the previous run for the warm ones
+    run: Callable[[str, str], None]
+    # runs in this process, so it can be profiled
+    in_process: bool
+    required_tools: tuple[str, ...] = ()
+
+
+def _discovery(repo_root: str, cache_dir: str) -> None:
+    KustomizationIndex(repo_root, cache_dir=cache_dir).load()
+
+
+def _assertions(repo_root: str, cache_dir: str) -> None:
+    load_assertions(os.path.join(repo_root, ASSERTIONS_DIR), AssertionsCache(cache_dir))
+
+
+def _run_tool(repo_root: str, cache_dir: str, *args: str) -> None:
+    run_res = subprocess.run(  # nosec B603 - runs the tools of this repository only
+        list(args),
+        cwd=repo_root,
+        # schemas are downloaded once, cold runs shouldn't measure the network
+        env=os.environ
+        | {
+            GITOPS_CACHE_DIR_ENV_VAR_NAME: cache_dir,
+            GITOPS_SCHEMA_DIR_ENV_VAR_NAME: get_schema_dir(),
+        },
+        capture_output=True,
+        text=True,
+    )
+    if run_res.returncode != 0:
+        msg = f"'{' '.join(args)}' failed: '{run_res.stderr}'"
+        logger.error(msg)
+        raise Exception(msg)
+
+
+def _fake_flux_build(repo_root: str, cache_dir: str) -> None:
+    # the first workload cluster is the first kustomization with a postBuild section
+    kustomization = next(
+        k
+        for k in KustomizationIndex(repo_root, cache_dir=cache_dir).load()
+        if k.post_build
+    )
+    _run_tool(
+        repo_root,
+        cache_dir,
+        os.path.join(TOOLS_DIR, "fake-flux"),
+        "build",
+        f"{kustomization.name}:{kustomization.namespace}",
+        "--use-kustomize",
+    )
+
+
+def _test_all_ff_validate(repo_root: str, cache_dir: str) -> None:
+    _run_tool(
+        repo_root,
+        cache_dir,
+        os.path.join(TOOLS_DIR, "test-all-ff"),
+        "validate",
+        "--parallel",
+    )
+
+
+BENCHMARKS = [
+    Benchmark("discovery", _discovery, True),
+    Benchmark("assertions", _assertions, True),
+    Benchmark("fake-flux-build", _fake_flux_build, False, ("kustomize", "yq")),
+    Benchmark("test-all-ff-validate", _test_all_ff_validate, False, ("kustomize",)),
+]
+
+
+def _summary(runs: list[float]) -> dict:
+    return {"median": statistics.median(runs), "min": min(runs), "runs": runs}
+
+
+class BenchmarkRunner:
+    # Times each benchmark on generated repositories of the given sizes, with an empty cache ('cold') and with
+    # the cache left by the previous run ('warm'). In-process benchmarks can also be profiled with cProfile.
+
+    def __init__(
+        self,
+        source_root: str,
+        repeat: int,
+        profile_dir: Optional[str] = None,
+        selected: Optional[list[str]] = None,
+    ) -> None:
+        self._generator = SyntheticRepoGenerator(source_root)
+        self._repeat = repeat
+        self._profile_dir = profile_dir
+        self._benchmarks = [b for b in BENCHMARKS if not selected or b.name in selected]
+
+    def _time(self, benchmark: Benchmark, repo_root: str, work_dir: str) -> dict:
+        cold, warm = [], []
+        for i in range(self._repeat):
+            cache_dir = os.path.join(work_dir, f"cache-{benchmark.name}-{i}")
+            os.makedirs(cache_dir)
+            start = time.perf_counter()
+            benchmark.run(repo_root, cache_dir)
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            benchmark.run(repo_root, cache_dir)
+            warm.append(time.perf_counter() - start)
+        return {
+            f"{benchmark.name}-cold": _summary(cold),
+            f"{benchmark.name}-warm": _summary(warm),
+        }
+
+    def _profile(
+        self, benchmark: Benchmark, size: RepoSize, repo_root: str, work_dir: str
+    ) -> None:
+        if not self._profile_dir or not benchmark.in_process:
+            return
+        os.makedirs(self._profile_dir, exist_ok=True)
+        profile_file = os.path.join(
+            self._profile_dir, f"{size}-{benchmark.name}-cold.prof"
+        )
+        cache_dir = os.path.join(work_dir, f"profile-{benchmark.name}")
+        os.makedirs(cache_dir)
+        profiler = cProfile.Profile()
+        profiler.runcall(benchmark.run, repo_root, cache_dir)
+        profiler.dump_stats(profile_file)
+        logger.info(f"Profile of '{benchmark.name}' saved to '{profile_file}'.")
+
+    def run_size(self, size: RepoSize) -> dict:
+        results: dict[str, dict] = {}
+        with tempfile.TemporaryDirectory() as work_dir:
+            repo_root = os.path.join(work_dir, "repo")
+            self._generator.generate(repo_root, size)
+            for benchmark in self._benchmarks:
+                missing = [t for t in benchmark.required_tools if not shutil.which(t)]
+                if missing:
+                    logger.warning(
+                        f"Skipping '{benchmark.name}', missing tools: {missing}."
+                    )
+                    continue
+                logger.info(f"Running '{benchmark.name}' on a {size} repository.")
+                results |= self._time(benchmark, repo_root, work_dir)
+                self._profile(benchmark, size, repo_root, work_dir)
+        return results
+
+    def run(self, sizes: list[RepoSize]) -> dict:
+        return {
+            "version": RESULTS_VERSION,
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": {str(size): self.run_size(size) for size in sizes},
+        }
+
+
+class Comparison(NamedTuple):
+    size: str
+    benchmark: str
+    median: float
+    baseline: Optional[float]
+    regressed: bool
+
+
+def compare(
+    results: dict, baseline: dict, threshold: float, min_delta_sec: float
+) -> list[Comparison]:
+    comparisons = []
+    for size, benchmarks in results["results"].items():
+        for name, summary in benchmarks.items():
+            base = baseline["results"].get(size, {}).get(name)
+            base_median = base["median"] if base else None
+            regressed = (
+                base_median is not None
+                and summary["median"] > base_median * (1 + threshold)
+                and summary["median"] - base_median > min_delta_sec
+            )
+            comparisons.append(
+                Comparison(size, name, summary["median"], base_median, regressed)
+            )
+    return comparisons
+
+
+def print_comparisons(comparisons: list[Comparison]) -> None:
+    print(f"{'SIZE':<12}{'BENCHMARK':<28}{'MEDIAN':>10}{'BASELINE':>10}{'CHANGE':>11}")
+    for c in comparisons:
+        baseline = f"{c.baseline:9.3f}s" if c.baseline is not None else f"{'-':>10}"
+        change = (
+            f"{(c.median / c.baseline - 1) * 100:+10.1f}%"
+            if c.baseline
+            else f"{'-':>11}"
+        )
+        flag = "  REGRESSION" if c.regressed else ""
+        print(f"{c.size:<12}{c.benchmark:<28}{c.median:9.3f}s{baseline}{change}{flag}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks discovery, rendering, validation and assertion loading on generated repositories."
+    )
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help=f"comma separated repository sizes, as NxMxK (default: {DEFAULT_SIZES})",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=DEFAULT_REPEAT, help="runs of each benchmark"
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="append",
+        choices=[b.name for b in BENCHMARKS],
+        help="benchmark to run; can be repeated (default: all)",
+    )
+    parser.add_argument("--root", default="../..", help="source repository root")
+    parser.add_argument("--output", help="file to save the results to, as JSON")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--min-delta", type=float, default=DEFAULT_MIN_DELTA_SEC)
+    parser.add_argument(
+        "--profile-dir", help="save cProfile stats of the in-process benchmarks there"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    sizes = [RepoSize.parse(s) for s in args.sizes.split(",")]
+    results = BenchmarkRunner(
+        args.root, args.repeat, args.profile_dir, args.benchmark
+    ).run(sizes)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    baseline: dict = {"results": {}}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    comparisons = compare(results, baseline, args.threshold, args.min_delta)
+    print_comparisons(comparisons)
+    return 1 if any(c.regressed for c in comparisons) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
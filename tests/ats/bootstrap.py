@@ -0,0 +1,125 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterator, NamedTuple, Optional
+
+from tracing import STEP_CATEGORY, tracer
+
+logger = logging.getLogger(__name__)
+
+
+class BootstrapStep(NamedTuple):
+    # 'setup' is a generator function, like a pytest fixture: the code before its only 'yield' installs the step
+    # and the yielded value is its result, the code after it is the teardown
+    name: str
+    setup: Callable[[], Iterator[Any]]
+    requires: tuple[str, ...] = ()
+
+
+class BootstrapScheduler:
+    # Runs the steps needed to prepare the test cluster on a pool of threads, starting each step as soon as all
+    # the steps it requires are done. Most of the steps just wait on a subprocess or on the API server, so the
+    # whole bootstrap takes about as long as its longest chain of dependent steps.
+
+    def __init__(
+        self, steps: list[BootstrapStep], workers: Optional[int] = None
+    ) -> None:
+        self._steps = {s.name: s for s in steps}
+        self._workers = workers or max(len(steps), 1)
+        self._validate()
+        # generators of the steps that are set up, in the order they finished, for the teardown
+        self._started: list[tuple[str, Iterator[Any]]] = []
+        self.results: dict[str, Any] = {}
+        self.durations: dict[str, float] = {}
+
+    def _validate(self) -> None:
+        for step in self._steps.values():
+            unknown = [r for r in step.requires if r not in self._steps]
+            if unknown:
+                msg = f"Bootstrap step '{step.name}' requires unknown steps: {unknown}."
+                logger.error(msg)
+                raise Exception(msg)
+        visiting: set[str] = set()
+        visited: set[str] = set()
+
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                msg = f"Bootstrap steps have a dependency cycle through '{name}'."
+                logger.error(msg)
+                raise Exception(msg)
+            visiting.add(name)
+            for required in self._steps[name].requires:
+                visit(required)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self._steps:
+            visit(name)
+
+    def _run_step(self, step: BootstrapStep) -> tuple[Iterator[Any], Any]:
+        start = time.monotonic()
+        logger.info(f"Bootstrap step '{step.name}' started.")
+        generator = step.setup()
+        result = next(generator)
+        self.durations[step.name] = time.monotonic() - start
+        tracer.record(step.name, STEP_CATEGORY, start, self.durations[step.name])
+        logger.info(
+            f"Bootstrap step '{step.name}' done in {self.durations[step.name]:.1f}s."
+        )
+        return generator, result
+
+    def _ready(self, pending: set[str]) -> list[BootstrapStep]:
+        return [
+            self._steps[name]
+            for name in sorted(pending)
+            if all(r in self.results for r in self._steps[name].requires)
+        ]
+
+    def run(self) -> dict[str, Any]:
+        pending = set(self._steps)
+        running: dict[Future, str] = {}
+        errors: list[str] = []
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            while pending or running:
+                # after a failure, only the steps already running are waited for
+                if not errors:
+                    for step in self._ready(pending):
+                        pending.discard(step.name)
+                        running[executor.submit(self._run_step, step)] = step.name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        generator, result = future.result()
+                    except Exception as e:
+                        logger.error(f"Bootstrap step '{name}' failed: {e}")
+                        errors.append(name)
+                        continue
+                    self._started.append((name, generator))
+                    self.results[name] = result
+        if errors:
+            self.teardown()
+            raise Exception(f"Bootstrap failed in steps: {', '.join(errors)}")
+        return self.results
+
+    def teardown(self) -> None:
+        errors = []
+        while self._started:
+            name, generator = self._started.pop()
+            try:
+                with tracer.span(f"teardown {name}", STEP_CATEGORY):
+                    next(generator)
+            except StopIteration:
+                continue
+            except Exception as e:
+                logger.error(f"Teardown of bootstrap step '{name}' failed: {e}")
+                errors.append(name)
+                continue
+            logger.error(f"Bootstrap step '{name}' yielded more than once.")
+            errors.append(name)
+        if errors:
+            raise Exception(f"Teardown failed in bootstrap steps: {', '.join(errors)}")
@@ -0,0 +1,163 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
+
+import pykube
+import yaml
+from pykube.objects import APIObject, NamespacedAPIObject
+
+from rest_mapper import RestMapper
+from tracing import STEP_CATEGORY, tracer
+
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+FIELD_MANAGER = "gitops-ats"
+APPLY_PATCH_CONTENT_TYPE = "application/apply-patch+yaml"
+MERGE_PATCH_CONTENT_TYPE = "application/merge-patch+json"
+RECONCILE_REQUESTED_AT_ANNOTATION = "reconcile.fluxcd.io/requestedAt"
+DELETE_TIMEOUT_SEC = 180
+DELETE_POLL_INTERVAL_SEC = 2
+
+logger = logging.getLogger(__name__)
+
+
+def load_manifests(paths: Iterable[str]) -> list[dict]:
+    objects = []
+    for path in paths:
+        with open(path) as f:
+            for doc in yaml.load_all(f, Loader=YamlLoader):  # nosec B506 - safe loader
+                if isinstance(doc, dict) and "kind" in doc:
+                    objects.append(doc)
+    return objects
+
+
+def _object_name(obj: dict) -> str:
+    meta = obj["metadata"]
+    namespace = meta.get("namespace")
+    name = f"{namespace}/{meta['name']}" if namespace else meta["name"]
+    return f"{obj['kind']} '{name}'"
+
+
+class BulkApplier:
+    # Applies, reconciles and deletes a set of objects through a single client session, sending the requests
+    # for all the objects concurrently instead of starting a 'kubectl' process for each manifest. Objects are
+    # applied with server-side apply, so the result is the same as with 'kubectl apply --server-side'.
+
+    def __init__(
+        self, kube_client: pykube.HTTPClient, rest_mapper: RestMapper, workers: int
+    ) -> None:
+        self._kube_client = kube_client
+        self._rest_mapper = rest_mapper
+        self._workers = workers
+
+    def _api_object(self, obj: dict) -> APIObject:
+        # Namespaced objects without a namespace go to the one of the kube config context, like with 'kubectl'.
+        # It's set explicitly, so it doesn't depend on what the pykube version falls back to.
+        obj_class = self._rest_mapper.api_object_class(obj["apiVersion"], obj["kind"])
+        metadata = obj.get("metadata") or {}
+        if issubclass(obj_class, NamespacedAPIObject) and not metadata.get("namespace"):
+            namespace = self._kube_client.config.namespace
+            obj = {**obj, "metadata": {**metadata, "namespace": namespace}}
+        return obj_class(self._kube_client, obj)
+
+    def _run_all(
+        self, func: Callable[[dict], Optional[str]], objects: list[dict], action: str
+    ) -> None:
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            errors = [e for e in executor.map(func, objects) if e]
+        if errors:
+            msg = f"Failed to {action} objects:\n" + "\n".join(errors)
+            logger.error(msg)
+            raise Exception(msg)
+
+    def _patch(
+        self, obj: dict, data: str, content_type: str, params: dict
+    ) -> Optional[str]:
+        api_object = self._api_object(obj)
+        resp = self._kube_client.patch(
+            **api_object.api_kwargs(params=params),
+            data=data,
+            headers={"Content-Type": content_type},
+        )
+        if resp.ok:
+            return None
+        return f"{_object_name(obj)}: {resp.status_code} {resp.text}"
+
+    def _apply_one(self, obj: dict) -> Optional[str]:
+        return self._patch(
+            obj,
+            json.dumps(obj),
+            APPLY_PATCH_CONTENT_TYPE,
+            {"fieldManager": FIELD_MANAGER, "force": "true"},
+        )
+
+    def apply(self, objects: list[dict]) -> None:
+        logger.debug(f"Applying {len(objects)} objects with server-side apply.")
+        with tracer.span("server-side apply", STEP_CATEGORY, objects=len(objects)):
+            self._run_all(self._apply_one, objects, "apply")
+
+    def request_reconcile(self, objects: list[dict]) -> None:
+        # flux reconciles an object right away when this annotation changes, instead of waiting for its interval
+        requested_at = datetime.now(timezone.utc).isoformat()
+        patch = json.dumps(
+            {
+                "metadata": {
+                    "annotations": {RECONCILE_REQUESTED_AT_ANNOTATION: requested_at}
+                }
+            }
+        )
+        with tracer.span("request reconcile", STEP_CATEGORY, objects=len(objects)):
+            self._run_all(
+                lambda obj: self._patch(obj, patch, MERGE_PATCH_CONTENT_TYPE, {}),
+                objects,
+                "request reconciliation of",
+            )
+
+    def _get(self, obj: dict) -> Optional[dict]:
+        api_object = self._api_object(obj)
+        resp = self._kube_client.get(**api_object.api_kwargs())
+        if resp.status_code == 404:
+            return None
+        self._kube_client.raise_for_status(resp)
+        return resp.json()
+
+    def _wait_for_deletion(self, obj: dict, timeout_sec: float) -> Optional[dict]:
+        deadline = time.monotonic() + timeout_sec
+        while True:
+            current = self._get(obj)
+            if current is None or time.monotonic() > deadline:
+                return current
+            time.sleep(DELETE_POLL_INTERVAL_SEC)
+
+    def _delete_one(self, obj: dict, timeout_sec: float) -> Optional[str]:
+        api_object = self._api_object(obj)
+        resp = self._kube_client.delete(
+            **api_object.api_kwargs(params={"propagationPolicy": "Background"})
+        )
+        if resp.status_code == 404:
+            return None
+        if not resp.ok:
+            return f"{_object_name(obj)}: {resp.status_code} {resp.text}"
+        # controllers holding finalizers, like kustomize-controller pruning what a Kustomization applied, are
+        # given the time to finish their work. Objects stuck after that are reported, not freed from their
+        # finalizers: that would hide a stuck controller and leave what it cleans up behind.
+        current = self._wait_for_deletion(obj, timeout_sec)
+        if current is None:
+            return None
+        finalizers = current["metadata"].get("finalizers") or []
+        return (
+            f"{_object_name(obj)}: still terminating after {timeout_sec}s, waiting for finalizers "
+            f"{finalizers}"
+        )
+
+    def delete(
+        self, objects: list[dict], timeout_sec: float = DELETE_TIMEOUT_SEC
+    ) -> None:
+        logger.debug(f"Deleting {len(objects)} objects.")
+        with tracer.span("delete", STEP_CATEGORY, objects=len(objects)):
+            self._run_all(
+                lambda obj: self._delete_one(obj, timeout_sec), objects, "delete"
+            )
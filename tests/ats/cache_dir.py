@@ -0,0 +1,14 @@
+import os
+
+GITOPS_CACHE_DIR_ENV_VAR_NAME = "GITOPS_CACHE_DIR"
+
+
+def get_cache_dir(name: str) -> str:
+    # All the on-disk caches live under a single directory, so CI can restore and save them in one go.
+    base_dir = os.getenv(GITOPS_CACHE_DIR_ENV_VAR_NAME)
+    if not base_dir:
+        xdg_cache_home = os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        base_dir = os.path.join(xdg_cache_home, "gitops-template")
+    cache_dir = os.path.join(base_dir, name)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
@@ -3,15 +3,41 @@ import logging
 import os
 import shutil
 import subprocess  # nosec B404 - we need to invoke processes
-from typing import Iterable, Any
+from functools import partial
+from typing import Iterable, Any, Iterator
 
 import pykube
 import pytest
 import validators
+import yaml
 from pykube import Secret
+from pykube.http import KubernetesHTTPAdapter
 from pytest_helm_charts.clusters import Cluster
 from pytest_helm_charts.flux.git_repository import GitRepositoryFactoryFunc
-from pytest_helm_charts.giantswarm_app_platform.app import AppFactoryFunc, ConfiguredApp
+from pytest_helm_charts.giantswarm_app_platform.app import (
+    AppCR,
+    AppFactoryFunc,
+    ConfiguredApp,
+    create_app,
+    wait_for_apps_to_run,
+)
+from pytest_helm_charts.giantswarm_app_platform.catalog import (
+    CatalogCR,
+    make_catalog_obj,
+)
+
+from bootstrap import BootstrapScheduler, BootstrapStep
+from bulk_apply import BulkApplier, load_manifests
+from kustomization_index import KustomizationIndex
+from rendered_objects import RenderedObjects
+from sops_decrypt import SopsDecryptor, master_key_from_env
+from rest_mapper import RestMapper
+from tracing import (
+    GITOPS_TRACE_FILE_ENV_VAR_NAME,
+    TRACE_PLUGIN_NAME,
+    TracePlugin,
+)
+from warm_cluster import WarmCluster, fingerprint
 
 FLUX_GIT_REPO_NAME = "your-repo"
 
@@ -25,11 +51,29 @@ FLUX_NAMESPACE_NAME = "default"
 FLUX_DEPLOYMENTS_READY_TIMEOUT_SEC = 180
 CLUSTER_CTL_URL = "https://github.com/kubernetes-sigs/cluster-api/releases/"
 APPTESTCTL_URL = "https://github.com/giantswarm/apptestctl/releases"
-GS_CRDS_URLS = [
-    "https://raw.githubusercontent.com/giantswarm/apiextensions/master/helm/crds-common/templates/"
-    + "security.giantswarm.io_organizations.yaml"
-]
-GITOPS_TOP_DIR = "../../management-clusters"
+# vendored copies of CRDs from https://github.com/giantswarm/apiextensions/tree/master/helm/crds-common/templates
+GS_CRDS_DIR = os.path.join(os.path.dirname(__file__), "crds")
+FLUX_APP_NAME = "flux-app"
+FLUX_APP_CATALOG_NAME = "giantswarm"
+FLUX_APP_CATALOG_URL = "https://giantswarm.github.io/giantswarm-catalog/"
+FLUX_APP_READY_TIMEOUT_SEC = 60
+CAPI_CORE_NAMESPACE = "capi-system"
+CAPI_CORE_DEPLOYMENT_NAME = "capi-controller-manager"
+APP_PLATFORM_CRD_NAME = "apps.application.giantswarm.io"
+# bootstrap steps, also the names of the components remembered by the warm cluster mode
+WARM_GS_CRDS = "gs-crds"
+WARM_CAPI = "capi"
+WARM_APP_PLATFORM = "app-platform"
+WARM_FLUX_APP = "flux-app"
+INIT_NAMESPACES_STEP = "init-namespaces"
+GPG_MASTER_KEY_STEP = "gpg-master-key"
+GITOPS_REPO_ROOT = "../.."
+GITOPS_TOP_DIR_NAME = "management-clusters"
+DEFAULT_ASSERTIONS_CONCURRENCY = 8
+GITOPS_DRY_ATS_ENV_VAR_NAME = "GITOPS_DRY_ATS"
+DRY_MARKER_NAME = "dry"
+# tests of the tooling itself, they need neither a cluster nor rendered manifests and always run
+OFFLINE_MARKER_NAME = "offline"
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +85,8 @@ class GitOpsTestConfig:
     _GITOPS_MASTER_GPG_KEY_ENV_VAR_NAME = "GITOPS_MASTER_GPG_KEY"
     _FLUX_APP_VERSION = "GITOPS_FLUX_APP_VERSION"
     _IGNORED_OBJECTS = "GITOPS_IGNORED_OBJECTS"
+    _ASSERTIONS_CONCURRENCY = "GITOPS_ASSERTIONS_CONCURRENCY"
+    _WARM_CLUSTER = "GITOPS_WARM_CLUSTER"
 
     def __init__(self) -> None:
         env_var_namespaces = os.getenv(self._FLUX_INIT_NAMESPACES_ENV_VAR_NAME)
@@ -88,6 +134,78 @@ class GitOpsTestConfig:
         if ignored_objects:
             self.ignored_objects = ignored_objects.split(",")
 
+        assertions_concurrency = os.getenv(
+            self._ASSERTIONS_CONCURRENCY, str(DEFAULT_ASSERTIONS_CONCURRENCY)
+        )
+        if not assertions_concurrency.isdigit() or int(assertions_concurrency) < 1:
+            logger.error(
+                f"The '{self._ASSERTIONS_CONCURRENCY}' environment variable must be a positive integer"
+                f" [current value: '{assertions_concurrency}']."
+            )
+            raise Exception("malformed assertions concurrency")
+        self.assertions_concurrency = int(assertions_concurrency)
+
+        self.warm_cluster = os.getenv(self._WARM_CLUSTER, "").lower() in (
+            "1",
+            "true",
+            "yes",
+        )
+
+
+def is_dry_run() -> bool:
+    return os.getenv(GITOPS_DRY_ATS_ENV_VAR_NAME, "").lower() in ("1", "true", "yes")
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line(
+        "markers",
+        f"{DRY_MARKER_NAME}: runs against the rendered manifests instead of a cluster (enabled with "
+        f"{GITOPS_DRY_ATS_ENV_VAR_NAME})",
+    )
+    config.addinivalue_line(
+        "markers",
+        f"{OFFLINE_MARKER_NAME}: unit test of the test tooling, runs with and without a cluster",
+    )
+    trace_file = os.getenv(GITOPS_TRACE_FILE_ENV_VAR_NAME)
+    if trace_file:
+        config.pluginmanager.register(TracePlugin(trace_file), TRACE_PLUGIN_NAME)
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: list[pytest.Item]
+) -> None:
+    # Skipped at collection time, so the fixtures of the skipped tests, like the cluster ones, are never set up.
+    dry_run = is_dry_run()
+    skip_live = pytest.mark.skip(
+        reason=f"{GITOPS_DRY_ATS_ENV_VAR_NAME} is set, running without a cluster"
+    )
+    skip_dry = pytest.mark.skip(reason=f"{GITOPS_DRY_ATS_ENV_VAR_NAME} is not set")
+    for item in items:
+        if item.get_closest_marker(OFFLINE_MARKER_NAME) is not None:
+            continue
+        is_dry_test = item.get_closest_marker(DRY_MARKER_NAME) is not None
+        if dry_run and not is_dry_test:
+            item.add_marker(skip_live)
+        elif not dry_run and is_dry_test:
+            item.add_marker(skip_dry)
+
+
+def management_cluster_manifests() -> list[str]:
+    # the root Kustomization of each management cluster is declared in 'management-clusters/<MC>/<MC>.yaml'
+    index = KustomizationIndex(GITOPS_REPO_ROOT, [GITOPS_TOP_DIR_NAME]).load()
+    manifests = []
+    for kustomization in index:
+        path_parts = os.path.normpath(kustomization.file).split(os.sep)
+        if (
+            len(path_parts) == 3
+            and path_parts[0] == GITOPS_TOP_DIR_NAME
+            and path_parts[2] == path_parts[1] + ".yaml"
+        ):
+            manifests.append(
+                os.path.normpath(os.path.join(GITOPS_REPO_ROOT, kustomization.file))
+            )
+    return sorted(set(manifests))
+
 
 @pytest.fixture(scope="module")
 def gitops_test_config() -> GitOpsTestConfig:
@@ -95,32 +213,169 @@ def gitops_test_config() -> GitOpsTestConfig:
 
 
 @pytest.fixture(scope="module")
-def flux_app_deployment(
-    kube_cluster: Cluster,
-    app_factory: AppFactoryFunc,
-    gitops_test_config: GitOpsTestConfig,
-) -> ConfiguredApp:
-    logger.debug(
-        f"Deploying 'flux-app' in version '{gitops_test_config.flux_app_version}'."
-    )
-    return app_factory(
-        "flux-app",
-        gitops_test_config.flux_app_version,
-        "giantswarm",
-        FLUX_OBJECTS_NAMESPACE,
-        "https://giantswarm.github.io/giantswarm-catalog/",
+def rendered_objects() -> RenderedObjects:
+    # with the master key, Secrets are checked with their decrypted content, like the cluster gets them
+    master_key = master_key_from_env()
+    decryptor = SopsDecryptor(GITOPS_REPO_ROOT, [master_key]) if master_key else None
+    return RenderedObjects.render(GITOPS_REPO_ROOT, decryptor)
+
+
+@pytest.fixture(scope="module")
+def pooled_kube_client(
+    kube_cluster: Cluster, gitops_test_config: GitOpsTestConfig
+) -> Iterable[pykube.HTTPClient]:
+    # A single session shared by all the concurrent workers. The default connection pool of 'requests' keeps
+    # only 10 connections per host, so we size it to the number of workers to avoid reconnecting all the time.
+    client_config = kube_cluster.kube_client.config
+    http_adapter = KubernetesHTTPAdapter(
+        client_config,
+        pool_connections=1,
+        pool_maxsize=gitops_test_config.assertions_concurrency,
     )
+    client = pykube.HTTPClient(client_config, http_adapter=http_adapter)
+
+    yield client
+
+    client.session.close()
 
 
 @pytest.fixture(scope="module")
-def gs_crds(kube_cluster: Cluster) -> None:
-    logger.debug("Deploying Giant Swarm CRDs to the test cluster")
-    for crd in GS_CRDS_URLS:
-        kube_cluster.kubectl(f"apply -f {crd}")
+def rest_mapper(pooled_kube_client: pykube.HTTPClient) -> RestMapper:
+    mapper = RestMapper(pooled_kube_client)
+    mapper.load()
+    return mapper
 
 
 @pytest.fixture(scope="module")
-def capi_controllers(kube_config: str) -> Iterable[Any]:
+def warm_cluster(
+    kube_cluster: Cluster, gitops_test_config: GitOpsTestConfig
+) -> WarmCluster:
+    return WarmCluster(kube_cluster.kube_client, gitops_test_config.warm_cluster)
+
+
+def _crd_exists(kube_client: pykube.HTTPClient, name: str) -> bool:
+    return (
+        pykube.CustomResourceDefinition.objects(kube_client).get_or_none(name=name)
+        is not None
+    )
+
+
+def _tool_version(tool_path: str, *args: str) -> str:
+    run_res = subprocess.run(  # nosec B603 - only runs the tool's version command
+        [tool_path, *args], capture_output=True, text=True
+    )
+    return run_res.stdout.strip()
+
+
+def _get_flux_app(kube_client: pykube.HTTPClient) -> Any:
+    return (
+        AppCR.objects(kube_client)
+        .filter(namespace=FLUX_OBJECTS_NAMESPACE)
+        .get_or_none(name=FLUX_APP_NAME)
+    )
+
+
+def _deploy_kept_flux_app(
+    kube_client: pykube.HTTPClient, version: str
+) -> ConfiguredApp:
+    # 'app_factory' deletes what it created at teardown, so warm clusters deploy the app on their own
+    catalog = (
+        CatalogCR.objects(kube_client)
+        .filter(namespace=FLUX_OBJECTS_NAMESPACE)
+        .get_or_none(name=FLUX_APP_CATALOG_NAME)
+    )
+    if catalog is None:
+        make_catalog_obj(
+            kube_client,
+            FLUX_APP_CATALOG_NAME,
+            FLUX_OBJECTS_NAMESPACE,
+            FLUX_APP_CATALOG_URL,
+        ).create()
+    app = _get_flux_app(kube_client)
+    if app is None:
+        configured_app = create_app(
+            kube_client,
+            FLUX_APP_NAME,
+            version,
+            FLUX_APP_CATALOG_NAME,
+            FLUX_OBJECTS_NAMESPACE,
+            FLUX_OBJECTS_NAMESPACE,
+            FLUX_OBJECTS_NAMESPACE,
+        )
+    else:
+        app.obj["spec"]["version"] = version
+        app.update()
+        configured_app = ConfiguredApp(app, None)
+    wait_for_apps_to_run(
+        kube_client, [FLUX_APP_NAME], FLUX_OBJECTS_NAMESPACE, FLUX_APP_READY_TIMEOUT_SEC
+    )
+    return configured_app
+
+
+def deploy_flux_app(
+    kube_cluster: Cluster,
+    app_factory: AppFactoryFunc,
+    gitops_test_config: GitOpsTestConfig,
+    warm_cluster: WarmCluster,
+) -> Iterator[ConfiguredApp]:
+    version = gitops_test_config.flux_app_version
+    flux_app_fingerprint = fingerprint(FLUX_APP_NAME, version, FLUX_APP_CATALOG_URL)
+
+    def probe() -> bool:
+        app = _get_flux_app(kube_cluster.kube_client)
+        return app is not None and app.obj["spec"]["version"] == version
+
+    if warm_cluster.is_installed(WARM_FLUX_APP, flux_app_fingerprint, probe):
+        yield ConfiguredApp(_get_flux_app(kube_cluster.kube_client), None)
+        return
+
+    logger.debug(f"Deploying 'flux-app' in version '{version}'.")
+    if not warm_cluster.enabled:
+        # deleted by 'app_factory' at teardown
+        yield app_factory(
+            FLUX_APP_NAME,
+            version,
+            FLUX_APP_CATALOG_NAME,
+            FLUX_OBJECTS_NAMESPACE,
+            FLUX_APP_CATALOG_URL,
+        )
+        return
+    configured_app = _deploy_kept_flux_app(kube_cluster.kube_client, version)
+    warm_cluster.mark_installed(WARM_FLUX_APP, flux_app_fingerprint)
+    yield configured_app
+
+
+def install_gs_crds(kube_cluster: Cluster, warm_cluster: WarmCluster) -> Iterator[None]:
+    crd_files = sorted(
+        os.path.join(GS_CRDS_DIR, f)
+        for f in os.listdir(GS_CRDS_DIR)
+        if f.endswith(".yaml")
+    )
+    manifests = []
+    for crd_file in crd_files:
+        with open(crd_file) as f:
+            manifests.append(f.read())
+    crd_names = [
+        doc["metadata"]["name"]
+        for manifest in manifests
+        for doc in yaml.safe_load_all(manifest)
+        if doc
+    ]
+    crds_fingerprint = fingerprint(*manifests)
+
+    def probe() -> bool:
+        return all(_crd_exists(kube_cluster.kube_client, n) for n in crd_names)
+
+    if not warm_cluster.is_installed(WARM_GS_CRDS, crds_fingerprint, probe):
+        logger.debug("Deploying Giant Swarm CRDs to the test cluster")
+        kube_cluster.kubectl(f"apply -f {GS_CRDS_DIR}")
+        warm_cluster.mark_installed(WARM_GS_CRDS, crds_fingerprint)
+    yield None
+
+
+def install_capi_controllers(
+    kube_config: str, kube_cluster: Cluster, warm_cluster: WarmCluster
+) -> Iterator[None]:
     cluster_ctl_path = shutil.which("clusterctl")
 
     if not cluster_ctl_path:
@@ -132,6 +387,7 @@ def capi_controllers(kube_config: str) -> Iterable[Any]:
 
     logger.debug(f"Using '{cluster_ctl_path}' to bootstrap CAPI controllers")
     infra_providers = ",".join(":".join(p) for p in CLUSTER_CTL_PROVIDERS_MAP.items())
+    exp_machine_pool = "true"
     fake_secret = base64.b64encode(b"something")
     env_vars = os.environ | {
         "AWS_B64ENCODED_CREDENTIALS": fake_secret,
@@ -139,8 +395,34 @@ def capi_controllers(kube_config: str) -> Iterable[Any]:
         "AZURE_TENANT_ID_B64": fake_secret,
         "AZURE_CLIENT_ID_B64": fake_secret,
         "AZURE_CLIENT_SECRET_B64": fake_secret,
-        "EXP_MACHINE_POOL": "true",
+        "EXP_MACHINE_POOL": exp_machine_pool,
     }
+    capi_fingerprint = fingerprint(
+        _tool_version(cluster_ctl_path, "version", "-o", "short"),
+        infra_providers,
+        exp_machine_pool,
+    )
+
+    def probe() -> bool:
+        return (
+            pykube.Deployment.objects(kube_cluster.kube_client)
+            .filter(namespace=CAPI_CORE_NAMESPACE)
+            .get_or_none(name=CAPI_CORE_DEPLOYMENT_NAME)
+            is not None
+        )
+
+    if warm_cluster.is_installed(WARM_CAPI, capi_fingerprint, probe):
+        # kept for the next run as well, so there's no teardown
+        yield None
+        return
+
+    if warm_cluster.enabled and warm_cluster.installed_fingerprint(WARM_CAPI):
+        logger.debug(
+            "Removing CAPI controllers installed with a different configuration"
+        )
+        _delete_capi(cluster_ctl_path, kube_config, env_vars)
+        warm_cluster.forget(WARM_CAPI)
+
     run_res = subprocess.run(  # nosec B603 - no user provided config except of kube.config path
         [
             cluster_ctl_path,
@@ -158,12 +440,21 @@ def capi_controllers(kube_config: str) -> Iterable[Any]:
         )
         raise Exception("Cannot bootstrap CAPI")
 
+    if warm_cluster.enabled:
+        warm_cluster.mark_installed(WARM_CAPI, capi_fingerprint)
+        yield None
+        return
+
     yield None
 
+    _delete_capi(cluster_ctl_path, kube_config, env_vars)
+
+
+def _delete_capi(cluster_ctl_path: str, kube_config: str, env_vars: Any) -> None:
     run_res = subprocess.run(  # nosec B603 - no user provided config except of kube.config path
         [cluster_ctl_path, "delete", "--kubeconfig", kube_config, "--all"],
         capture_output=True,
-        env=env_vars,  # type: ignore # for some reason mypy thinks the type here is 'Dict[str, Sequence[object]]'
+        env=env_vars,
     )
     if run_res.returncode != 0:
         logger.error(
@@ -172,8 +463,9 @@ def capi_controllers(kube_config: str) -> Iterable[Any]:
         raise Exception("Cannot clean up CAPI")
 
 
-@pytest.fixture(scope="module")
-def app_platform_controllers(kube_config: str) -> None:
+def install_app_platform_controllers(
+    kube_config: str, kube_cluster: Cluster, warm_cluster: WarmCluster
+) -> Iterator[None]:
     apptestctl_path = shutil.which("apptestctl")
 
     if not apptestctl_path:
@@ -183,6 +475,15 @@ def app_platform_controllers(kube_config: str) -> None:
         )
         raise Exception("`apptestctl` not found")
 
+    app_platform_fingerprint = fingerprint(_tool_version(apptestctl_path, "version"))
+    if warm_cluster.is_installed(
+        WARM_APP_PLATFORM,
+        app_platform_fingerprint,
+        lambda: _crd_exists(kube_cluster.kube_client, APP_PLATFORM_CRD_NAME),
+    ):
+        yield None
+        return
+
     logger.debug(f"Using '{apptestctl_path}' to bootstrap app platform controllers")
     run_res = subprocess.run(  # nosec B603 - no user provided config except of kube.config path
         [
@@ -198,12 +499,13 @@ def app_platform_controllers(kube_config: str) -> None:
             f"Error bootstrapping app platform on test cluster: '{run_res.stderr}'"  # type: ignore
         )
         raise Exception("Cannot bootstrap app platform")
+    warm_cluster.mark_installed(WARM_APP_PLATFORM, app_platform_fingerprint)
+    yield None
 
 
-@pytest.fixture(scope="module")
 def init_namespaces(
     kube_cluster: Cluster, gitops_test_config: GitOpsTestConfig
-) -> Iterable[Any]:
+) -> Iterator[None]:
     created_namespaces: list[pykube.Namespace] = []
     created_cluster_role_bindings: list[pykube.ClusterRoleBinding] = []
     created_service_accounts: list[pykube.ServiceAccount] = []
@@ -256,7 +558,7 @@ def init_namespaces(
             crb.create()
             created_cluster_role_bindings.append(crb)
 
-    yield
+    yield None
 
     for sa in created_service_accounts:
         sa.delete()
@@ -266,10 +568,9 @@ def init_namespaces(
         crb.delete()
 
 
-@pytest.fixture(scope="module")
-def gpg_master_key(
+def create_gpg_master_key(
     kube_cluster: Cluster, gitops_test_config: GitOpsTestConfig
-) -> Iterable[Secret]:
+) -> Iterator[Secret]:
     # create the master gpg secret used to unlock all encrypted values
     gpg_master_key = pykube.Secret(
         kube_cluster.kube_client,
@@ -291,45 +592,94 @@ def gpg_master_key(
     gpg_master_key.delete()
 
 
+@pytest.fixture(scope="module")
+def gitops_bootstrap(
+    kube_config: str,
+    kube_cluster: Cluster,
+    app_factory: AppFactoryFunc,
+    gitops_test_config: GitOpsTestConfig,
+    warm_cluster: WarmCluster,
+) -> Iterable[dict[str, Any]]:
+    # only 'flux-app' really depends on another step: App CRs need the app platform to be installed
+    scheduler = BootstrapScheduler(
+        [
+            BootstrapStep(
+                WARM_GS_CRDS, partial(install_gs_crds, kube_cluster, warm_cluster)
+            ),
+            BootstrapStep(
+                WARM_CAPI,
+                partial(
+                    install_capi_controllers, kube_config, kube_cluster, warm_cluster
+                ),
+            ),
+            BootstrapStep(
+                WARM_APP_PLATFORM,
+                partial(
+                    install_app_platform_controllers,
+                    kube_config,
+                    kube_cluster,
+                    warm_cluster,
+                ),
+            ),
+            BootstrapStep(
+                INIT_NAMESPACES_STEP,
+                partial(init_namespaces, kube_cluster, gitops_test_config),
+            ),
+            BootstrapStep(
+                GPG_MASTER_KEY_STEP,
+                partial(create_gpg_master_key, kube_cluster, gitops_test_config),
+            ),
+            BootstrapStep(
+                WARM_FLUX_APP,
+                partial(
+                    deploy_flux_app,
+                    kube_cluster,
+                    app_factory,
+                    gitops_test_config,
+                    warm_cluster,
+                ),
+                requires=(WARM_APP_PLATFORM,),
+            ),
+        ]
+    )
+    yield scheduler.run()
+
+    scheduler.teardown()
+
+
 @pytest.fixture(scope="module")
 def gitops_environment(
-    gs_crds: None,
-    capi_controllers: None,
-    app_platform_controllers: None,
-    init_namespaces: Any,
-    gpg_master_key: Secret,
-    flux_app_deployment: ConfiguredApp,
+    gitops_bootstrap: dict[str, Any],
     flux_deployments: list[pykube.Deployment],
 ) -> ConfiguredApp:
-    return flux_app_deployment
+    return gitops_bootstrap[WARM_FLUX_APP]
 
 
 @pytest.fixture(scope="module")
 def gitops_deployment(
-    kube_cluster: Cluster,
     gitops_environment: ConfiguredApp,
     git_repository_factory: GitRepositoryFactoryFunc,
     gitops_test_config: GitOpsTestConfig,
+    pooled_kube_client: pykube.HTTPClient,
+    rest_mapper: RestMapper,
 ) -> Iterable[Any]:
-    git_repository_factory(
+    git_repository = git_repository_factory(
         FLUX_GIT_REPO_NAME,
         FLUX_OBJECTS_NAMESPACE,
         "60s",
         gitops_test_config.gitops_repo_url,
         gitops_test_config.gitops_repo_branch,
     )
-    applied_manifests: list[str] = []
-    for dir_entry in os.scandir(GITOPS_TOP_DIR):
-        if dir_entry.is_dir():
-            manifest_path = os.path.join(
-                GITOPS_TOP_DIR, dir_entry.name, dir_entry.name + ".yaml"
-            )
-            kube_cluster.kubectl(f"apply -f {manifest_path} --wait=true")
-            applied_manifests.append(manifest_path)
+    applier = BulkApplier(
+        pooled_kube_client, rest_mapper, gitops_test_config.assertions_concurrency
+    )
+    objects = load_manifests(management_cluster_manifests())
+    applier.apply(objects)
+    # don't wait for the intervals of the GitRepository and the Kustomizations to start reconciling them
+    applier.request_reconcile(
+        [git_repository.obj] + [o for o in objects if o["kind"] == "Kustomization"]
+    )
 
     yield None
 
-    for manifest_path in applied_manifests:
-        kube_cluster.kubectl(
-            f"delete -f {manifest_path} --wait=true", output_format="text"
-        )
+    applier.delete(objects)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+import os
+import subprocess  # nosec B404 - only runs git
+import sys
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from kustomization_index import (
+    FLUX_KUSTOMIZATION_KIND,
+    FluxKustomization,
+    KustomizationIndex,
+)
+from postbuild_substitution import RepoValuesResolver
+from render import KustomizeInputs, collect_kustomize_inputs
+
+logger = logging.getLogger(__name__)
+
+
+def kustomization_key(kustomization: FluxKustomization) -> tuple[str, str]:
+    return kustomization.namespace, kustomization.name
+
+
+class DependencyGraph:
+    # Maps every flux Kustomization to the files its build reaches: the file declaring it, resources, bases,
+    # patches, generator inputs, encrypted secrets and the ConfigMaps and Secrets of its 'substituteFrom'
+    # declared in the repository. The reverse mapping answers which Kustomizations have to be validated again
+    # after a set of files changed.
+
+    def __init__(
+        self,
+        repo_root: str = ".",
+        index: Optional[KustomizationIndex] = None,
+        values: Optional[RepoValuesResolver] = None,
+    ) -> None:
+        self._repo_root = os.path.abspath(repo_root)
+        self._index = index or KustomizationIndex(repo_root).load()
+        self._values = values or RepoValuesResolver(self._repo_root)
+        # keyed by (namespace, name) of the Kustomization
+        self.inputs: dict[tuple[str, str], set[str]] = {}
+        # why the inputs of a Kustomization couldn't be listed, its inputs are only the files declaring it then
+        self.errors: dict[tuple[str, str], str] = {}
+        self._dependents: dict[str, set[tuple[str, str]]] = defaultdict(set)
+        self._scanned_dirs: dict[str, set[tuple[str, str]]] = defaultdict(set)
+
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(path, self._repo_root)
+
+    def build(self) -> "DependencyGraph":
+        for kustomization in self._index:
+            key = kustomization_key(kustomization)
+            path = os.path.join(self._repo_root, kustomization.path)
+            try:
+                inputs = collect_kustomize_inputs(path)
+            except Exception as err:
+                # like a 'spec.path' that doesn't exist: it's built from its declaring file only, until the path
+                # shows up
+                logger.warning(
+                    f"Can't list the inputs of Kustomization '{key[0]}/{key[1]}': {err}"
+                )
+                self.errors[key] = str(err)
+                inputs = KustomizeInputs(set(), {path}, {path})
+            files = {self._rel(f) for f in inputs.files}
+            files.add(os.path.normpath(kustomization.file))
+            for ref in kustomization.post_build.get("substituteFrom") or []:
+                values_file = self._values.file(
+                    ref["kind"], kustomization.namespace, ref["name"]
+                )
+                if values_file is not None:
+                    files.add(self._rel(values_file))
+            self.inputs[key] = files
+            for file in files | {self._rel(f) for f in inputs.missing}:
+                self._dependents[file].add(key)
+            for dir_path in inputs.scanned_dirs:
+                self._scanned_dirs[self._rel(dir_path)].add(key)
+        return self
+
+    def knows(self, file: str) -> bool:
+        # whether any Kustomization is built from 'file', relative to the repository root
+        return os.path.normpath(file) in self._dependents
+
+    def _nearest_existing_dir(self, path: str) -> str:
+        dir_path = os.path.dirname(path)
+        while dir_path and not os.path.isdir(os.path.join(self._repo_root, dir_path)):
+            dir_path = os.path.dirname(dir_path)
+        return dir_path or "."
+
+    def affected(self, changed_files: Iterable[str]) -> list[FluxKustomization]:
+        # Paths are relative to the repository root, like 'git diff --name-only' prints them. Files that don't
+        # exist anymore also affect the Kustomizations that generate their kustomization.yaml from the directory
+        # they were in.
+        affected: set[tuple[str, str]] = set()
+        for file in changed_files:
+            file = os.path.normpath(file)
+            affected.update(self._dependents.get(file, ()))
+            if os.path.dirname(file) in self._scanned_dirs:
+                affected.update(self._scanned_dirs[os.path.dirname(file)])
+            elif not os.path.exists(os.path.join(self._repo_root, file)):
+                affected.update(
+                    self._scanned_dirs.get(self._nearest_existing_dir(file), ())
+                )
+        # keep the order of the index
+        return [k for k in self._index if kustomization_key(k) in affected]
+
+
+def changed_files(repo_root: str, revision_range: str) -> list[str]:
+    # '--no-renames' lists both the old and the new path of a renamed file
+    proc = subprocess.run(  # nosec B603 B607
+        ["git", "diff", "--name-only", "--no-renames", revision_range, "--"],
+        cwd=repo_root,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if proc.returncode != 0:
+        raise Exception(
+            f"Can't get the files changed in '{revision_range}': {proc.stderr.strip()}"
+        )
+    return [line for line in proc.stdout.splitlines() if line]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Dependency graph of the flux Kustomizations and the files they're built from."
+    )
+    parser.add_argument("--root", default=".", help="repository root directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    affected_parser = subparsers.add_parser(
+        "affected",
+        help="list the Kustomizations whose inputs changed in a git revision range, in the format of the index",
+    )
+    affected_parser.add_argument(
+        "revision_range", help="for example 'origin/main...HEAD'"
+    )
+    inputs_parser = subparsers.add_parser(
+        "inputs", help="list the files a Kustomization is built from"
+    )
+    inputs_parser.add_argument("name")
+    inputs_parser.add_argument("--namespace", default="")
+    args = parser.parse_args()
+
+    graph = DependencyGraph(args.root).build()
+    if args.command == "inputs":
+        matches = [
+            key
+            for key in graph.inputs
+            if key[1] == args.name and (not args.namespace or key[0] == args.namespace)
+        ]
+        if len(matches) != 1:
+            print(
+                f"Expected exactly one Kustomization '{args.name}', found {len(matches)}.",
+                file=sys.stderr,
+            )
+            return 1
+        for file in sorted(graph.inputs[matches[0]]):
+            print(file)
+        return 0
+
+    for k in graph.affected(changed_files(args.root, args.revision_range)):
+        print(",".join([k.file, k.name, k.namespace, k.path, FLUX_KUSTOMIZATION_KIND]))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(levelname)s: %(message)s")
+    sys.exit(main())
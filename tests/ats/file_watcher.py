@@ -0,0 +1,173 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from typing import Optional, Protocol
+
+# inotify(7) event masks
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+# editors save either in place or by renaming a temporary file over the original
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+IGNORED_DIR_NAMES = {".git"}
+POLL_INTERVAL_SEC = 0.5
+# changes saved within this time of the first one are handled together
+DEBOUNCE_SEC = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+def _is_temporary(file_name: str) -> bool:
+    # swap and backup files of editors, and vim's '4913' write test
+    return (
+        file_name.endswith((".swp", ".swx", "~", ".tmp"))
+        or file_name == "4913"
+        or file_name.startswith(".#")
+    )
+
+
+class FileWatcher(Protocol):
+    def wait(self, timeout_sec: Optional[float] = None) -> set[str]:
+        # Blocks until files change and returns their paths, relative to the watched root. Returns an empty set
+        # after 'timeout_sec'. A change to a directory as a whole, like moving it, is returned as the directory.
+        ...
+
+    def close(self) -> None: ...
+
+
+class InotifyWatcher:
+    # Watches a tree with inotify(7) through libc, so no package is needed. inotify isn't recursive: every
+    # directory gets its own watch, and new directories are watched as soon as they're created.
+
+    def __init__(self, root: str) -> None:
+        self._root = os.path.abspath(root)
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: dict[int, str] = {}
+        self._add_tree(self._root)
+
+    def _add_dir(self, path: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, path.encode(), WATCH_MASK)
+        if wd < 0:
+            logger.warning(
+                f"Can't watch '{path}': {os.strerror(ctypes.get_errno())}; "
+                "raising 'fs.inotify.max_user_watches' may help."
+            )
+            return
+        self._dirs[wd] = path
+
+    def _add_tree(self, path: str) -> list[str]:
+        # returns the files found, they may have been written before the watch was in place
+        files = []
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names[:] = [d for d in dir_names if d not in IGNORED_DIR_NAMES]
+            self._add_dir(dir_path)
+            files += [os.path.join(dir_path, f) for f in file_names]
+        return files
+
+    def _read(self) -> set[str]:
+        changed: set[str] = set()
+        data = os.read(self._fd, READ_SIZE)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0").decode()
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("Too many changes at once, some of them were missed.")
+                continue
+            dir_path = self._dirs.get(wd)
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            if dir_path is None or not name or _is_temporary(name):
+                continue
+            path = os.path.join(dir_path, name)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                if name not in IGNORED_DIR_NAMES:
+                    changed.update(self._add_tree(path))
+            elif mask & IN_CREATE and not mask & IN_ISDIR:
+                # the content comes with IN_CLOSE_WRITE
+                continue
+            changed.add(path)
+        return {os.path.relpath(p, self._root) for p in changed}
+
+    def wait(self, timeout_sec: Optional[float] = None) -> set[str]:
+        ready, _, _ = select.select([self._fd], [], [], timeout_sec)
+        if not ready:
+            return set()
+        changed = self._read()
+        while select.select([self._fd], [], [], DEBOUNCE_SEC)[0]:
+            changed |= self._read()
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    # Fallback for systems without inotify: compares the mtime and size of every file at a fixed interval.
+
+    def __init__(self, root: str) -> None:
+        self._root = os.path.abspath(root)
+        self._snapshot = self._scan()
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        for dir_path, dir_names, file_names in os.walk(self._root):
+            dir_names[:] = [d for d in dir_names if d not in IGNORED_DIR_NAMES]
+            for file_name in file_names:
+                if _is_temporary(file_name):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[os.path.relpath(path, self._root)] = (
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                )
+        return snapshot
+
+    def wait(self, timeout_sec: Optional[float] = None) -> set[str]:
+        deadline = None if timeout_sec is None else time.monotonic() + timeout_sec
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL_SEC)
+            snapshot = self._scan()
+            changed = {
+                p
+                for p in snapshot.keys() | self._snapshot.keys()
+                if snapshot.get(p) != self._snapshot.get(p)
+            }
+            self._snapshot = snapshot
+            if changed:
+                return changed
+        return set()
+
+    def close(self) -> None:
+        pass
+
+
+def create_watcher(root: str) -> FileWatcher:
+    try:
+        return InotifyWatcher(root)
+    except (OSError, AttributeError) as err:
+        # not Linux, or out of inotify instances
+        logger.warning(f"inotify isn't available ({err}), polling for changes instead.")
+        return PollingWatcher(root)
@@ -0,0 +1,196 @@
+import logging
+import math
+import time
+from typing import Type, TypeVar, Optional, Union
+
+import pykube
+import requests
+from pytest_helm_charts.flux.utils import NamespacedFluxCR
+
+from tracing import FLUX_OBJECT_CATEGORY, tracer
+
+TFNS = TypeVar("TFNS", bound=NamespacedFluxCR)
+
+# Flux marks reconciliation errors it won't retry on its own with the 'Stalled' condition
+FLUX_STALLED_CONDITION = "Stalled"
+FLUX_READY_CONDITION = "Ready"
+
+logger = logging.getLogger(__name__)
+
+
+def _get_condition(flux_obj: NamespacedFluxCR, condition_type: str) -> Optional[dict]:
+    conditions = flux_obj.obj.get("status", {}).get("conditions", [])
+    for condition in conditions:
+        if condition.get("type") == condition_type:
+            return condition
+    return None
+
+
+def flux_cr_ready(flux_obj: NamespacedFluxCR) -> bool:
+    # unlike 'pytest_helm_charts.flux.utils.flux_cr_ready', doesn't assume 'Ready' is the first condition
+    ready = _get_condition(flux_obj, FLUX_READY_CONDITION)
+    return ready is not None and ready.get("status") == "True"
+
+
+def flux_cr_failed(flux_obj: NamespacedFluxCR) -> bool:
+    # the object is 'Ready=False' and flux won't retry the reconciliation without a change
+    ready = _get_condition(flux_obj, FLUX_READY_CONDITION)
+    stalled = _get_condition(flux_obj, FLUX_STALLED_CONDITION)
+    return (
+        ready is not None
+        and ready.get("status") == "False"
+        and stalled is not None
+        and stalled.get("status") == "True"
+    )
+
+
+class FluxObjectsReadinessWaiter:
+    # Does a single cluster wide LIST of the objects and then WATCHes them from the returned resource version.
+    # Every object seen is tracked as pending until it's 'Ready', including the ones created while we're waiting.
+    # Each object gets its own deadline counted from the moment it was first seen, so the total wait time
+    # is bounded by the slowest object, not by the number of namespaces.
+
+    def __init__(
+        self,
+        kube_client: pykube.HTTPClient,
+        obj_type: Type[TFNS],
+        timeout_sec: int,
+        ignored_objects: Union[list[str], None] = None,
+    ) -> None:
+        self._kube_client = kube_client
+        self._obj_type = obj_type
+        self._timeout_sec = timeout_sec
+        self._ignored_objects = set(ignored_objects) if ignored_objects else set()
+        # "namespace/name" -> deadline (monotonic time)
+        self._pending: dict[str, float] = {}
+        self._ready: dict[str, float] = {}
+        self._failed: dict[str, str] = {}
+        self._started = time.monotonic()
+
+    def _observe(self, flux_obj: NamespacedFluxCR) -> None:
+        key = f"{flux_obj.namespace}/{flux_obj.name}"
+        if key in self._ignored_objects or key in self._ready:
+            return
+        if flux_cr_ready(flux_obj):
+            self._pending.pop(key, None)
+            self._ready[key] = time.monotonic() - self._started
+            tracer.record(
+                f"{self._obj_type.__name__} {key}",
+                FLUX_OBJECT_CATEGORY,
+                self._started,
+                self._ready[key],
+                status="ready",
+            )
+            logger.debug(
+                f"{self._obj_type.__name__} '{key}' is ready after {self._ready[key]:.1f} s."
+            )
+            return
+        if flux_cr_failed(flux_obj):
+            ready = _get_condition(flux_obj, FLUX_READY_CONDITION) or {}
+            self._pending.pop(key, None)
+            self._failed[key] = f"{ready.get('reason')}: {ready.get('message')}"
+            tracer.record(
+                f"{self._obj_type.__name__} {key}",
+                FLUX_OBJECT_CATEGORY,
+                self._started,
+                time.monotonic() - self._started,
+                status="failed",
+            )
+            return
+        if key not in self._pending:
+            self._pending[key] = time.monotonic() + self._timeout_sec
+
+    def _forget(self, flux_obj: NamespacedFluxCR) -> None:
+        key = f"{flux_obj.namespace}/{flux_obj.name}"
+        if self._pending.pop(key, None) is not None:
+            logger.debug(
+                f"{self._obj_type.__name__} '{key}' was deleted while waiting for it to be ready."
+            )
+
+    def _list(self) -> str:
+        query = self._obj_type.objects(self._kube_client, namespace=pykube.all).all()
+        for flux_obj in query:
+            self._observe(flux_obj)
+        return query.response["metadata"]["resourceVersion"]
+
+    def _watch(self, resource_version: str) -> Optional[str]:
+        # Watches for changes until the server closes the stream or all the pending objects are resolved.
+        # Returns the last seen resource version or None if the watch has to be restarted with a new LIST.
+        watch_timeout = max(
+            1, math.ceil(min(self._pending.values()) - time.monotonic())
+        )
+        query = self._obj_type.objects(self._kube_client, namespace=pykube.all).watch(
+            since=resource_version, params={"timeoutSeconds": watch_timeout}
+        )
+        try:
+            for event in query.object_stream():
+                if event.type == "ERROR":
+                    # most probably '410 Gone' - the resource version is too old, we need to LIST again
+                    logger.debug(
+                        f"Watch for {self._obj_type.__name__} objects returned an error: '{event.object.obj}'."
+                    )
+                    return None
+                if event.type == "DELETED":
+                    self._forget(event.object)
+                else:
+                    self._observe(event.object)
+                resource_version = event.object.obj["metadata"]["resourceVersion"]
+                if self._failed or not self._pending:
+                    break
+        except pykube.http.HTTPError as err:
+            if err.code != 410:
+                raise
+            return None
+        except requests.exceptions.RequestException as err:
+            # the client side read timeout is shorter than the watch timeout when nothing happens for a while
+            logger.debug(
+                f"Watch for {self._obj_type.__name__} objects interrupted: '{err}', resuming."
+            )
+        return resource_version
+
+    def _check_failed(self) -> None:
+        if not self._failed:
+            return
+        failures = "; ".join(f"'{k}' ({v})" for k, v in self._failed.items())
+        msg = f"The following {self._obj_type.__name__} objects failed to reconcile: {failures}."
+        raise Exception(msg)
+
+    def _check_timed_out(self) -> None:
+        timed_out = [
+            k for k, deadline in self._pending.items() if deadline <= time.monotonic()
+        ]
+        if not timed_out:
+            return
+        msg = (
+            f"Timeout of {self._timeout_sec} s reached while waiting for the following {self._obj_type.__name__}"
+            f" objects to be ready: '{sorted(timed_out)}'."
+        )
+        raise TimeoutError(msg)
+
+    def wait(self) -> dict[str, float]:
+        # returns time-to-ready in seconds for each of the objects
+        resource_version: Optional[str] = self._list()
+        logger.debug(
+            f"Waiting max {self._timeout_sec} s for each of {len(self._pending)} {self._obj_type.__name__} "
+            f"objects to be ready (already ready: {len(self._ready)})."
+        )
+        while True:
+            self._check_failed()
+            if not self._pending:
+                return self._ready
+            self._check_timed_out()
+            if resource_version is None:
+                resource_version = self._list()
+                continue
+            resource_version = self._watch(resource_version)
+
+
+def wait_for_flux_objects_ready(
+    kube_client: pykube.HTTPClient,
+    obj_type: Type[TFNS],
+    timeout_sec: int,
+    ignored_objects: Union[list[str], None] = None,
+) -> dict[str, float]:
+    return FluxObjectsReadinessWaiter(
+        kube_client, obj_type, timeout_sec, ignored_objects
+    ).wait()
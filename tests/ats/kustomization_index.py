@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from typing import Iterator, NamedTuple, Optional
+
+import yaml
+
+from cache_dir import get_cache_dir
+
+KUSTOMIZATIONS_INDEX_CACHE_DIR_NAME = "kustomizations"
+# bump when the format of the cached entries changes
+KUSTOMIZATIONS_INDEX_VERSION = 1
+DEFAULT_SCAN_DIRS = ["management-clusters"]
+FLUX_KUSTOMIZATION_KIND = "Kustomization"
+FLUX_KUSTOMIZATION_API_GROUP = "kustomize.toolkit.fluxcd.io"
+
+# cheap check done on the raw file content, so we only parse the files that might contain flux objects
+FLUX_API_VERSION_RE = re.compile(
+    rb"^apiVersion:\s*['\"]?[\w.-]+\.fluxcd\.io/", re.MULTILINE
+)
+
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+logger = logging.getLogger(__name__)
+
+
+class FluxKustomization(NamedTuple):
+    # path of the file declaring the kustomization, relative to the repository root and starting with './'
+    file: str
+    name: str
+    namespace: str
+    path: str
+    post_build: dict
+
+
+def _is_flux_kustomization(doc: object) -> bool:
+    return (
+        isinstance(doc, dict)
+        and str(doc.get("apiVersion", "")).startswith(
+            f"{FLUX_KUSTOMIZATION_API_GROUP}/"
+        )
+        and doc.get("kind") == FLUX_KUSTOMIZATION_KIND
+    )
+
+
+def parse_kustomizations(rel_path: str, content: bytes) -> list[FluxKustomization]:
+    if not FLUX_API_VERSION_RE.search(content):
+        return []
+    try:
+        documents = yaml.load_all(
+            content, Loader=YamlLoader
+        )  # nosec B506 - safe loader
+        docs = list(documents)
+    except yaml.YAMLError as err:
+        logger.warning(f"Skipping '{rel_path}', it's not a valid YAML file: '{err}'.")
+        return []
+    return [
+        FluxKustomization(
+            rel_path,
+            doc["metadata"]["name"],
+            doc["metadata"].get("namespace", ""),
+            doc.get("spec", {}).get("path", ""),
+            doc.get("spec", {}).get("postBuild") or {},
+        )
+        for doc in docs
+        if _is_flux_kustomization(doc)
+    ]
+
+
+class KustomizationIndex:
+    # Index of all the flux Kustomizations declared in the repository, built with a single pass over the scanned
+    # directories. The index is persisted on disk and a file is read again only if its mtime or size changed.
+
+    def __init__(
+        self,
+        repo_root: str = ".",
+        scan_dirs: Optional[list[str]] = None,
+        cache_dir: Optional[str] = None,
+    ) -> None:
+        self._repo_root = os.path.abspath(repo_root)
+        self._scan_dirs = scan_dirs or DEFAULT_SCAN_DIRS
+        repo_hash = hashlib.sha256(self._repo_root.encode()).hexdigest()[:16]
+        self._cache_file = os.path.join(
+            cache_dir or get_cache_dir(KUSTOMIZATIONS_INDEX_CACHE_DIR_NAME),
+            f"index-{repo_hash}.json",
+        )
+        # relative file path -> {"mtime": ..., "size": ..., "kustomizations": [...]}
+        self._files: dict[str, dict] = {}
+        self.kustomizations: list[FluxKustomization] = []
+
+    def _load_cache(self) -> dict[str, dict]:
+        try:
+            with open(self._cache_file) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != KUSTOMIZATIONS_INDEX_VERSION:
+            return {}
+        return data["files"]
+
+    def _save_cache(self) -> None:
+        tmp_file = f"{self._cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(
+                {"version": KUSTOMIZATIONS_INDEX_VERSION, "files": self._files}, f
+            )
+        os.replace(tmp_file, self._cache_file)
+
+    def _scan(self, dir_path: str) -> Iterator[os.DirEntry]:
+        with os.scandir(dir_path) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._scan(entry.path)
+                elif entry.name.endswith(".yaml") and entry.is_file():
+                    yield entry
+
+    def load(self) -> "KustomizationIndex":
+        cached_files = self._load_cache()
+        files: dict[str, dict] = {}
+        changed = False
+        for scan_dir in self._scan_dirs:
+            abs_scan_dir = os.path.join(self._repo_root, scan_dir)
+            if not os.path.isdir(abs_scan_dir):
+                continue
+            for entry in self._scan(abs_scan_dir):
+                rel_path = "./" + os.path.relpath(entry.path, self._repo_root)
+                stat = entry.stat()
+                cached = cached_files.get(rel_path)
+                if (
+                    cached
+                    and cached["mtime"] == stat.st_mtime_ns
+                    and cached["size"] == stat.st_size
+                ):
+                    files[rel_path] = cached
+                    continue
+                with open(entry.path, "rb") as f:
+                    kustomizations = parse_kustomizations(rel_path, f.read())
+                files[rel_path] = {
+                    "mtime": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                    "kustomizations": [k._asdict() for k in kustomizations],
+                }
+                changed = True
+        self._files = files
+        if changed or files.keys() != cached_files.keys():
+            self._save_cache()
+        self.kustomizations = [
+            FluxKustomization(**k)
+            for entry in files.values()
+            for k in entry["kustomizations"]
+        ]
+        return self
+
+    def find(self, name: str, namespace: str = "") -> list[FluxKustomization]:
+        return [
+            k
+            for k in self.kustomizations
+            if k.name == name and (not namespace or k.namespace == namespace)
+        ]
+
+    def __iter__(self) -> Iterator[FluxKustomization]:
+        return iter(self.kustomizations)
+
+    def __len__(self) -> int:
+        return len(self.kustomizations)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Index of flux Kustomizations found in the repository."
+    )
+    parser.add_argument("--root", default=".", help="repository root directory")
+    parser.add_argument(
+        "--scan-dir",
+        action="append",
+        dest="scan_dirs",
+        help=f"directory to scan, relative to the root; can be repeated (default: {DEFAULT_SCAN_DIRS})",
+    )
+    parser.add_argument("--format", choices=["csv", "json"], default="csv")
+    args = parser.parse_args()
+
+    index = KustomizationIndex(args.root, args.scan_dirs).load()
+    if args.format == "json":
+        json.dump([k._asdict() for k in index], sys.stdout, indent=2)
+        print()
+        return 0
+    # the same format the shell tools used to build with 'find' and 'yq'
+    for k in index:
+        print(",".join([k.file, k.name, k.namespace, k.path, FLUX_KUSTOMIZATION_KIND]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import mmap
+import os
+import sys
+from types import TracebackType
+from typing import Iterator, NamedTuple, Optional, Type
+
+import yaml
+
+from kustomization_index import FluxKustomization
+from postbuild_substitution import split_documents
+
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+MANIFESTS_FILE_NAME = "manifests.yaml"
+INDEX_FILE_NAME = "index.json"
+# bump when the format of the store changes
+MANIFEST_STORE_VERSION = 1
+DOCUMENT_SEPARATOR = b"---\n"
+
+logger = logging.getLogger(__name__)
+
+
+class StoreEntry(NamedTuple):
+    # the flux Kustomization that rendered the document
+    kustomization_namespace: str
+    kustomization_name: str
+    kind: str
+    namespace: str
+    name: str
+    # position of the document in the manifests file, in bytes
+    offset: int
+    length: int
+
+
+def _document_key(document: str) -> Optional[tuple[str, str, str]]:
+    obj = yaml.load(document, Loader=YamlLoader)  # nosec B506 - safe loader
+    if not isinstance(obj, dict) or "kind" not in obj:
+        return None
+    meta = obj.get("metadata") or {}
+    return str(obj["kind"]), meta.get("namespace") or "", meta.get("name") or ""
+
+
+class ManifestStoreWriter:
+    # Writes rendered manifests to a store as they come, one Kustomization at a time, so the whole render is
+    # never held in memory. The manifests file stays a valid YAML stream; the index is written last and both
+    # files replace the previous store atomically when the writer is closed.
+
+    def __init__(self, store_dir: str) -> None:
+        os.makedirs(store_dir, exist_ok=True)
+        self._store_dir = store_dir
+        self._tmp_suffix = f".{os.getpid()}.tmp"
+        self._manifests_file = os.path.join(store_dir, MANIFESTS_FILE_NAME)
+        self._manifests = open(self._manifests_file + self._tmp_suffix, "wb")
+        self._entries: list[StoreEntry] = []
+
+    def __enter__(self) -> "ManifestStoreWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            # the previous store, if any, is kept
+            self._manifests.close()
+            os.unlink(self._manifests_file + self._tmp_suffix)
+
+    def add(self, kustomization: FluxKustomization, manifests: str) -> None:
+        for document in split_documents(manifests):
+            key = _document_key(document)
+            if key is None:
+                continue
+            data = document.encode()
+            if not data.endswith(b"\n"):
+                data += b"\n"
+            self._manifests.write(DOCUMENT_SEPARATOR)
+            offset = self._manifests.tell()
+            self._manifests.write(data)
+            self._entries.append(
+                StoreEntry(
+                    kustomization.namespace, kustomization.name, *key, offset, len(data)
+                )
+            )
+
+    def close(self) -> None:
+        self._manifests.close()
+        index_file = os.path.join(self._store_dir, INDEX_FILE_NAME)
+        with open(index_file + self._tmp_suffix, "w") as f:
+            json.dump({"version": MANIFEST_STORE_VERSION, "entries": self._entries}, f)
+        # the index goes last, a reader never gets an index pointing past the end of the manifests
+        os.replace(self._manifests_file + self._tmp_suffix, self._manifests_file)
+        os.replace(index_file + self._tmp_suffix, index_file)
+        logger.info(f"Stored {len(self._entries)} documents in '{self._store_dir}'.")
+
+
+class ManifestStore:
+    # Read side of a store written by 'ManifestStoreWriter'. The manifests file is memory-mapped and lookups go
+    # through the index, so only the matching documents are read and nothing is parsed.
+
+    def __init__(self, store_dir: str) -> None:
+        index_file = os.path.join(store_dir, INDEX_FILE_NAME)
+        try:
+            with open(index_file) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            msg = f"'{store_dir}' is not a manifest store, '{INDEX_FILE_NAME}' is missing."
+            logger.error(msg)
+            raise Exception(msg)
+        if index.get("version") != MANIFEST_STORE_VERSION:
+            msg = f"The manifest store in '{store_dir}' has an unsupported version, render it again."
+            logger.error(msg)
+            raise Exception(msg)
+        self.entries = [StoreEntry(*e) for e in index["entries"]]
+        self._by_kind: dict[str, list[StoreEntry]] = {}
+        for entry in self.entries:
+            self._by_kind.setdefault(entry.kind, []).append(entry)
+        self._file = open(os.path.join(store_dir, MANIFESTS_FILE_NAME), "rb")
+        # an empty file can't be mapped
+        self._mmap = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.entries
+            else None
+        )
+
+    def __enter__(self) -> "ManifestStore":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def find(
+        self,
+        kind: Optional[str] = None,
+        namespace: Optional[str] = None,
+        name: Optional[str] = None,
+        kustomization: Optional[tuple[str, str]] = None,
+    ) -> Iterator[StoreEntry]:
+        # 'None' matches anything; 'kustomization' is (name, namespace)
+        for entry in self._by_kind.get(kind, []) if kind else self.entries:
+            if namespace is not None and entry.namespace != namespace:
+                continue
+            if name is not None and entry.name != name:
+                continue
+            if kustomization is not None and kustomization != (
+                entry.kustomization_name,
+                entry.kustomization_namespace,
+            ):
+                continue
+            yield entry
+
+    def read(self, entry: StoreEntry) -> str:
+        if self._mmap is None:
+            return ""
+        return self._mmap[entry.offset : entry.offset + entry.length].decode()
+
+    def get(self, kind: str, namespace: Optional[str], name: str) -> Optional[dict]:
+        for entry in self.find(kind, namespace or "", name):
+            document = self.read(entry)
+            return yaml.load(document, Loader=YamlLoader)  # nosec B506 - safe loader
+        return None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def _kustomization_arg(value: str) -> tuple[str, str]:
+    # Kustomizations declared without a namespace are stored with an empty one, like 'render.py' selects them
+    name, _, namespace = value.partition(":")
+    return name, namespace
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Queries the manifests stored by 'render.py --store' without parsing them."
+    )
+    parser.add_argument("command", choices=["query", "list"])
+    parser.add_argument("store_dir", help="manifest store directory")
+    parser.add_argument("--kind", help="only documents of this kind")
+    parser.add_argument("--namespace", help="only documents in this namespace")
+    parser.add_argument("--name", help="only documents with this name")
+    parser.add_argument(
+        "--kustomization",
+        type=_kustomization_arg,
+        metavar="NAME:NAMESPACE",
+        help="only documents rendered by this Kustomization",
+    )
+    args = parser.parse_args()
+
+    with ManifestStore(args.store_dir) as store:
+        entries = store.find(args.kind, args.namespace, args.name, args.kustomization)
+        written = False
+        for entry in entries:
+            if args.command == "list":
+                print(
+                    f"{entry.kustomization_namespace}/{entry.kustomization_name}\t{entry.kind}\t"
+                    f"{entry.namespace}/{entry.name}"
+                )
+                continue
+            if written:
+                sys.stdout.write("---\n")
+            sys.stdout.write(store.read(entry))
+            written = True
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
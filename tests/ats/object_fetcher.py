@@ -0,0 +1,141 @@
+import logging
+import random
+import time
+from collections import defaultdict
+from typing import Optional, Type
+
+import pykube
+from pykube.exceptions import HTTPError
+from pykube.objects import APIObject, NamespacedAPIObject
+
+from rest_mapper import RestMapper
+from tracing import ASSERTION_CATEGORY, tracer
+
+# group of objects fetched with a single LIST: (apiVersion, kind, namespace)
+ObjectGroup = tuple[str, str, Optional[str]]
+# (apiVersion, kind, namespace, name)
+ObjectKey = tuple[str, str, Optional[str], str]
+
+FETCH_BACKOFF_INITIAL_SEC = 0.25
+FETCH_BACKOFF_MAX_SEC = 4.0
+
+logger = logging.getLogger(__name__)
+
+
+def object_key(obj: dict) -> ObjectKey:
+    meta = obj["metadata"]
+    return obj["apiVersion"], obj["kind"], meta.get("namespace"), meta["name"]
+
+
+def format_object_name(namespace: Optional[str], name: str) -> str:
+    return f"{namespace}/{name}" if namespace else name
+
+
+def group_objects(objects: list[dict]) -> dict[ObjectGroup, set[str]]:
+    groups: dict[ObjectGroup, set[str]] = defaultdict(set)
+    for obj in objects:
+        api_version, kind, namespace, name = object_key(obj)
+        groups[(api_version, kind, namespace)].add(name)
+    return groups
+
+
+def _list_objects(
+    kube_client: pykube.HTTPClient,
+    obj_class: Type[APIObject],
+    namespace: Optional[str],
+    names: set[str],
+) -> dict[str, APIObject]:
+    query = obj_class.objects(kube_client, namespace=namespace)
+    if len(names) == 1:
+        # just a single object left, so let's not transfer the whole list
+        query = query.filter(field_selector={"metadata.name": next(iter(names))})
+    try:
+        return {o.name: o for o in query.iterator() if o.name in names}
+    except HTTPError as err:
+        # the CRD of the object might not be registered yet
+        if err.code != 404:
+            raise
+        return {}
+
+
+def _list_group(
+    kube_client: pykube.HTTPClient,
+    rest_mapper: RestMapper,
+    group: ObjectGroup,
+    names: set[str],
+) -> dict[str, APIObject]:
+    api_version, kind, namespace = group
+    obj_class = rest_mapper.find_api_object_class(api_version, kind)
+    if obj_class is None:
+        # flux might register the CRD late, the objects are just not there yet then
+        return {}
+    if not issubclass(obj_class, NamespacedAPIObject):
+        namespace = None
+    return _list_objects(kube_client, obj_class, namespace, names)
+
+
+def missing_objects_message(
+    group: ObjectGroup, missing: set[str], timeout_sec: int
+) -> str:
+    _, kind, namespace = group
+    obj_names = sorted(format_object_name(namespace, n) for n in missing)
+    return (
+        f"Timeout of {timeout_sec} sec reached while waiting "
+        + f"for objects '{obj_names}' of kind '{kind}'"
+    )
+
+
+def _trace_fetch(
+    kind: str,
+    namespace: Optional[str],
+    name: str,
+    start: float,
+    retries: int,
+    found: bool,
+) -> None:
+    tracer.record(
+        f"{kind} {format_object_name(namespace, name)}",
+        ASSERTION_CATEGORY,
+        start,
+        time.monotonic() - start,
+        retries=retries,
+        found=found,
+    )
+
+
+def fetch_object_group(
+    kube_client: pykube.HTTPClient,
+    rest_mapper: RestMapper,
+    group: ObjectGroup,
+    names: set[str],
+    timeout_sec: int,
+) -> dict[str, APIObject]:
+    # Returns all the objects from 'names' that were found before the timeout was reached. Kinds the API server
+    # doesn't serve are retried like missing objects, and raise if that doesn't change before the timeout.
+    api_version, kind, namespace = group
+    start = time.monotonic()
+    deadline = start + timeout_sec
+    backoff = FETCH_BACKOFF_INITIAL_SEC
+    found: dict[str, APIObject] = {}
+    missing = set(names)
+    retries = 0
+    while True:
+        listed = _list_group(kube_client, rest_mapper, group, missing)
+        for name in listed:
+            _trace_fetch(kind, namespace, name, start, retries, found=True)
+        found |= listed
+        missing = names - found.keys()
+        if not missing:
+            return found
+        # we might need to wait a bit for flux to create all the managed objects
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            for name in missing:
+                _trace_fetch(kind, namespace, name, start, retries, found=False)
+            # tell a kind that never got served apart from objects that never got created
+            rest_mapper.get(api_version, kind)
+            return found
+        retries += 1
+        jitter = random.uniform(0.5, 1.0)  # nosec B311 - not used for security
+        time.sleep(min(backoff * jitter, remaining))
+        backoff = min(backoff * 2, FETCH_BACKOFF_MAX_SEC)
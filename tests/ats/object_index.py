@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+import argparse
+import copy
+import hashlib
+import json
+import logging
+import os
+import subprocess  # nosec B404 - only runs git
+import sys
+import tempfile
+from typing import Iterable, NamedTuple, Optional
+
+import yaml
+
+from kustomization_index import KustomizationIndex
+from postbuild_substitution import split_documents
+from render import Renderer, RenderResult
+from render_cache import RenderCache
+
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# bump when the format of saved indexes or the way objects are hashed changes
+OBJECT_INDEX_VERSION = 1
+# labels 'flux build' adds to every object
+FLUX_NAME_LABEL = "kustomize.toolkit.fluxcd.io/name"
+FLUX_NAMESPACE_LABEL = "kustomize.toolkit.fluxcd.io/namespace"
+WORKING_TREE = "working tree"
+# exit code of 'collisions' when there are any, apart from the 1 of a failure, for example of a render
+COLLISIONS_EXIT_CODE = 3
+
+logger = logging.getLogger(__name__)
+
+
+class ObjectId(NamedTuple):
+    # the identity of an object in the cluster: the API version doesn't count, only its group
+    group: str
+    kind: str
+    namespace: str
+    name: str
+
+    def __str__(self) -> str:
+        kind = f"{self.kind}.{self.group}" if self.group else self.kind
+        name = f"{self.namespace}/{self.name}" if self.namespace else self.name
+        return f"{kind} '{name}'"
+
+
+class ObjectEntry(NamedTuple):
+    # 'namespace/name' of the Kustomizations rendering the object, more than one is a collision
+    kustomizations: list[str]
+    # the 'content_hash' of what each of them renders, in the same order
+    hashes: list[str]
+
+    @property
+    def content(self) -> list[str]:
+        return sorted(set(self.hashes))
+
+
+class Collision(NamedTuple):
+    object_id: ObjectId
+    kustomizations: list[str]
+    # whether the Kustomizations render different content, so the object flips on every reconciliation
+    conflicting: bool
+
+
+class Change(NamedTuple):
+    object_id: ObjectId
+    # 'added', 'removed', 'changed' or 'moved'
+    change: str
+    kustomizations: list[str]
+
+
+def _object_id(obj: dict) -> ObjectId:
+    meta = obj.get("metadata") or {}
+    group = str(obj.get("apiVersion", "")).rpartition("/")[0]
+    return ObjectId(
+        group, str(obj["kind"]), meta.get("namespace") or "", meta.get("name") or ""
+    )
+
+
+def content_hash(obj: dict) -> str:
+    # sha256 of the object without the labels flux adds, so moving it to another Kustomization doesn't change
+    # its content
+    obj = copy.deepcopy(obj)
+    labels = (obj.get("metadata") or {}).get("labels") or {}
+    for label in (FLUX_NAME_LABEL, FLUX_NAMESPACE_LABEL):
+        labels.pop(label, None)
+    if "labels" in (obj.get("metadata") or {}) and not labels:
+        del obj["metadata"]["labels"]
+    canonical = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ObjectIndex:
+    # Index of every object the flux Kustomizations render, keyed by its identity in the cluster, with the hash
+    # of its content and the Kustomizations rendering it. Built in a single pass over the renders, it finds
+    # the objects more than one Kustomization would apply, and two indexes, for example of two git revisions,
+    # compare in linear time to the list of objects a change alters.
+
+    def __init__(
+        self,
+        revision: str = WORKING_TREE,
+        objects: Optional[dict[ObjectId, ObjectEntry]] = None,
+    ) -> None:
+        self.revision = revision
+        self.objects = objects or {}
+
+    def add(self, result: RenderResult) -> None:
+        owner = f"{result.kustomization.namespace}/{result.kustomization.name}"
+        for document in split_documents(result.manifests):
+            obj = yaml.load(document, Loader=YamlLoader)  # nosec B506 - safe loader
+            if not isinstance(obj, dict) or "kind" not in obj:
+                continue
+            entry = self.objects.setdefault(_object_id(obj), ObjectEntry([], []))
+            # the last one applied wins in the cluster, there's no telling which one that is
+            entry.kustomizations.append(owner)
+            entry.hashes.append(content_hash(obj))
+
+    @classmethod
+    def build(
+        cls, results: Iterable[RenderResult], revision: str = WORKING_TREE
+    ) -> "ObjectIndex":
+        index = cls(revision)
+        errors = []
+        for result in results:
+            if result.error:
+                k = result.kustomization
+                errors.append(f"Kustomization '{k.namespace}/{k.name}': {result.error}")
+                continue
+            index.add(result)
+        if errors:
+            msg = "Rendering failed for:\n" + "\n".join(errors)
+            logger.error(msg)
+            raise Exception(msg)
+        return index
+
+    @classmethod
+    def render(
+        cls,
+        repo_root: str = ".",
+        revision: str = WORKING_TREE,
+        workers: Optional[int] = None,
+        kustomization_index: Optional[KustomizationIndex] = None,
+    ) -> "ObjectIndex":
+        kustomizations = list(
+            kustomization_index or KustomizationIndex(repo_root).load()
+        )
+        # renders are indexed as they come, never all held in memory at once
+        results = Renderer(repo_root, workers, cache=RenderCache()).render_iter(
+            kustomizations
+        )
+        index = cls.build(results, revision)
+        logger.info(
+            f"Indexed {len(index.objects)} objects from {len(kustomizations)} Kustomizations at {revision}."
+        )
+        return index
+
+    def collisions(self) -> list[Collision]:
+        return [
+            Collision(
+                object_id,
+                entry.kustomizations,
+                len(entry.content) > 1,
+            )
+            for object_id, entry in sorted(self.objects.items())
+            if len(entry.kustomizations) > 1
+        ]
+
+    def diff(self, other: "ObjectIndex") -> list[Change]:
+        # what changes in the cluster going from this index to 'other'
+        changes = []
+        for object_id in sorted(self.objects.keys() | other.objects.keys()):
+            before, after = self.objects.get(object_id), other.objects.get(object_id)
+            if before is None and after is not None:
+                changes.append(Change(object_id, "added", after.kustomizations))
+            elif after is None and before is not None:
+                changes.append(Change(object_id, "removed", before.kustomizations))
+            elif before is not None and after is not None:
+                if before.content != after.content:
+                    changes.append(Change(object_id, "changed", after.kustomizations))
+                elif sorted(before.kustomizations) != sorted(after.kustomizations):
+                    changes.append(Change(object_id, "moved", after.kustomizations))
+        return changes
+
+    def save(self, path: str) -> None:
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(
+                {
+                    "version": OBJECT_INDEX_VERSION,
+                    "revision": self.revision,
+                    "objects": [
+                        [*object_id, entry.kustomizations, entry.hashes]
+                        for object_id, entry in self.objects.items()
+                    ],
+                },
+                f,
+            )
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ObjectIndex":
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != OBJECT_INDEX_VERSION:
+            msg = f"The object index in '{path}' has an unsupported version, build it again."
+            logger.error(msg)
+            raise Exception(msg)
+        return cls(
+            data["revision"],
+            {ObjectId(*o[:4]): ObjectEntry(o[4], o[5]) for o in data["objects"]},
+        )
+
+
+def _git(repo_root: str, *args: str) -> str:
+    proc = subprocess.run(  # nosec B603 B607
+        ["git", *args], cwd=repo_root, capture_output=True, text=True, check=False
+    )
+    if proc.returncode != 0:
+        msg = f"'git {' '.join(args)}' failed: {proc.stderr.strip()}"
+        logger.error(msg)
+        raise Exception(msg)
+    return proc.stdout.strip()
+
+
+def _remove_worktree(repo_root: str, worktree: str) -> None:
+    # runs in a 'finally', a failure to clean up must not hide the error that got there
+    for args in (("worktree", "remove", "--force", worktree), ("worktree", "prune")):
+        try:
+            _git(repo_root, *args)
+        except Exception as e:
+            logger.warning(f"Cleaning up the worktree '{worktree}' failed: {e}")
+
+
+def index_revision(
+    repo_root: str, revision: str, workers: Optional[int] = None
+) -> ObjectIndex:
+    # Renders a revision in a temporary worktree. Renders are cached by the content of their inputs, so only
+    # the Kustomizations the revisions don't share are built again.
+    if revision == WORKING_TREE:
+        return ObjectIndex.render(repo_root, revision, workers)
+    commit = _git(repo_root, "rev-parse", "--verify", f"{revision}^{{commit}}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        worktree = os.path.join(tmp_dir, "worktree")
+        _git(repo_root, "worktree", "add", "--detach", "--quiet", worktree, commit)
+        try:
+            # the index of a throwaway worktree isn't worth keeping in the shared cache
+            index = KustomizationIndex(worktree, cache_dir=tmp_dir).load()
+            return ObjectIndex.render(worktree, revision, workers, index)
+        finally:
+            _remove_worktree(repo_root, worktree)
+
+
+def _load_or_index(repo_root: str, source: str, workers: Optional[int]) -> ObjectIndex:
+    # a file saved by 'build', a git revision or the working tree
+    if os.path.isfile(source):
+        return ObjectIndex.load(source)
+    return index_revision(repo_root, source, workers)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Finds objects rendered by more than one Kustomization and objects changed between revisions."
+    )
+    parser.add_argument("--root", default=".", help="repository root directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    collisions_parser = subparsers.add_parser(
+        "collisions", help="list the objects rendered by more than one Kustomization"
+    )
+    collisions_parser.add_argument(
+        "source",
+        nargs="?",
+        default=WORKING_TREE,
+        help="saved index or git revision (default: working tree)",
+    )
+    build_parser = subparsers.add_parser("build", help="save the index of a revision")
+    build_parser.add_argument("output", help="file to save the index to")
+    build_parser.add_argument(
+        "--revision", default=WORKING_TREE, help="git revision (default: working tree)"
+    )
+    diff_parser = subparsers.add_parser(
+        "diff",
+        help="list the objects a change adds, removes, changes or moves to another Kustomization",
+    )
+    diff_parser.add_argument("base", help="saved index or git revision")
+    diff_parser.add_argument(
+        "head",
+        nargs="?",
+        default=WORKING_TREE,
+        help="saved index or git revision (default: working tree)",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    if args.command == "build":
+        index_revision(args.root, args.revision, args.workers).save(args.output)
+        return 0
+    if args.command == "collisions":
+        collisions = _load_or_index(args.root, args.source, args.workers).collisions()
+        for c in collisions:
+            kind = "conflicting" if c.conflicting else "identical"
+            print(f"{c.object_id}: {kind}, rendered by {', '.join(c.kustomizations)}")
+        return COLLISIONS_EXIT_CODE if collisions else 0
+    base = _load_or_index(args.root, args.base, args.workers)
+    head = _load_or_index(args.root, args.head, args.workers)
+    for change in base.diff(head):
+        print(
+            f"{change.change:<8} {change.object_id} ({', '.join(change.kustomizations)})"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+import argparse
+import base64
+import binascii
+import logging
+import os
+import re
+import sys
+from typing import Callable, Iterable, Iterator, Optional
+
+import yaml
+
+from kustomization_index import DEFAULT_SCAN_DIRS, FluxKustomization, KustomizationIndex
+
+# ${var}, ${var:=default}, ${var=default}, ${var:-default} and ${var-default}; $${var} escapes the substitution
+VARIABLE_RE = re.compile(r"(\$?)\$\{([_a-zA-Z][_a-zA-Z0-9]*)(?:(:?[=-])([^}]*))?\}")
+DOCUMENT_SEPARATOR_RE = re.compile(r"^---[ \t]*$", re.MULTILINE)
+# objects labeled or annotated with 'kustomize.toolkit.fluxcd.io/substitute: disabled' are not substituted
+SUBSTITUTE_DISABLED_RE = re.compile(
+    r"^\s+kustomize\.toolkit\.fluxcd\.io/substitute:\s*['\"]?disabled['\"]?\s*$",
+    re.MULTILINE,
+)
+VALUES_KIND_RE = re.compile(
+    rb"^kind:\s*['\"]?(ConfigMap|Secret)['\"]?\s*$", re.MULTILINE
+)
+
+VALUES_KINDS = ("ConfigMap", "Secret")
+
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+logger = logging.getLogger(__name__)
+
+# (kind, namespace, name) -> variables
+ValuesResolver = Callable[[str, str, str], Optional[dict[str, str]]]
+
+
+class Substitution:
+    # Variables of a single flux Kustomization, resolved once and applied to any number of documents
+    # without touching the process environment.
+
+    def __init__(self, variables: dict[str, str]) -> None:
+        self.variables = variables
+
+    def _replace(self, match: re.Match) -> str:
+        escape, name, operator, default = match.groups()
+        if escape:
+            return match.group(0)[1:]
+        value = self.variables.get(name)
+        if operator is None:
+            return value or ""
+        # with ':' the default is used also when the variable is set, but empty
+        if value is None or (operator.startswith(":") and value == ""):
+            return default
+        return value
+
+    def apply(self, document: str) -> str:
+        if "${" not in document or SUBSTITUTE_DISABLED_RE.search(document):
+            return document
+        return VARIABLE_RE.sub(self._replace, document)
+
+    def stream(self, documents: Iterable[str]) -> Iterator[str]:
+        for document in documents:
+            yield self.apply(document)
+
+
+def split_documents(manifests: str) -> list[str]:
+    return [d for d in DOCUMENT_SEPARATOR_RE.split(manifests) if d.strip()]
+
+
+def read_documents(lines: Iterable[str]) -> Iterator[str]:
+    # splits a stream of manifests into documents without reading all of it into memory first
+    document: list[str] = []
+    for line in lines:
+        if DOCUMENT_SEPARATOR_RE.match(line.rstrip("\n")):
+            if "".join(document).strip():
+                yield "".join(document)
+            document = []
+        else:
+            document.append(line)
+    if "".join(document).strip():
+        yield "".join(document)
+
+
+def join_documents(documents: Iterable[str]) -> str:
+    return "---\n".join(d if d.endswith("\n") else d + "\n" for d in documents)
+
+
+class RepoValuesResolver:
+    # Resolves 'substituteFrom' references with ConfigMaps and Secrets declared in the repository. Objects
+    # that exist only in the cluster can't be resolved offline.
+
+    def __init__(
+        self, repo_root: str = ".", scan_dirs: Optional[list[str]] = None
+    ) -> None:
+        self._repo_root = repo_root
+        self._scan_dirs = scan_dirs or DEFAULT_SCAN_DIRS
+        self._values: Optional[dict[tuple[str, str, str], dict[str, str]]] = None
+        self._files: dict[tuple[str, str, str], str] = {}
+
+    @staticmethod
+    def _object_values(doc: dict) -> Optional[dict[str, str]]:
+        if doc["kind"] == "ConfigMap":
+            return {k: str(v) for k, v in (doc.get("data") or {}).items()}
+        if "sops" in doc:
+            # encrypted secrets can't be used without decrypting them first
+            return None
+        values = {k: str(v) for k, v in (doc.get("stringData") or {}).items()}
+        for k, v in (doc.get("data") or {}).items():
+            try:
+                values[k] = base64.b64decode(v).decode()
+            except (binascii.Error, UnicodeDecodeError):
+                logger.warning(
+                    f"Can't decode value '{k}' of Secret '{doc['metadata'].get('name')}'."
+                )
+        return values
+
+    def _file_values(
+        self, path: str
+    ) -> Iterator[tuple[tuple[str, str, str], Optional[dict[str, str]]]]:
+        with open(path, "rb") as f:
+            content = f.read()
+        if not VALUES_KIND_RE.search(content):
+            return
+        try:
+            documents = yaml.load_all(
+                content, Loader=YamlLoader
+            )  # nosec B506 - safe loader
+            docs = list(documents)
+        except yaml.YAMLError:
+            return
+        for doc in docs:
+            if not isinstance(doc, dict) or doc.get("kind") not in VALUES_KINDS:
+                continue
+            meta = doc.get("metadata") or {}
+            yield (
+                doc["kind"],
+                meta.get("namespace", ""),
+                meta.get("name", ""),
+            ), self._object_values(doc)
+
+    def _load(self) -> dict[tuple[str, str, str], dict[str, str]]:
+        values: dict[tuple[str, str, str], dict[str, str]] = {}
+        self._files = {}
+        for scan_dir in self._scan_dirs:
+            for dir_path, _, filenames in os.walk(
+                os.path.join(self._repo_root, scan_dir)
+            ):
+                for file in filenames:
+                    if not file.endswith(".yaml"):
+                        continue
+                    path = os.path.join(dir_path, file)
+                    for key, object_values in self._file_values(path):
+                        # encrypted Secrets too, their values change with the file
+                        self._files[key] = path
+                        if object_values is not None:
+                            values[key] = object_values
+        return values
+
+    def file(self, kind: str, namespace: str, name: str) -> Optional[str]:
+        # the file declaring the ConfigMap or Secret, to know which Kustomizations its changes affect
+        if self._values is None:
+            self._values = self._load()
+        return self._files.get((kind, namespace, name))
+
+    def __call__(
+        self, kind: str, namespace: str, name: str
+    ) -> Optional[dict[str, str]]:
+        if self._values is None:
+            self._values = self._load()
+        return self._values.get((kind, namespace, name))
+
+
+def compile_substitution(
+    kustomization: FluxKustomization, resolver: Optional[ValuesResolver] = None
+) -> Substitution:
+    # Same precedence as flux: 'substituteFrom' entries in order, then inline 'substitute' values on top.
+    post_build = kustomization.post_build
+    variables: dict[str, str] = {}
+    for ref in post_build.get("substituteFrom") or []:
+        values = (
+            resolver(ref["kind"], kustomization.namespace, ref["name"])
+            if resolver
+            else None
+        )
+        if values is None:
+            if not ref.get("optional", False):
+                logger.warning(
+                    f"{ref['kind']} '{kustomization.namespace}/{ref['name']}' used in 'substituteFrom' of "
+                    f"Kustomization '{kustomization.namespace}/{kustomization.name}' can't be found in the repository."
+                )
+            continue
+        variables.update(values)
+    variables.update(
+        {k: str(v) for k, v in (post_build.get("substitute") or {}).items()}
+    )
+    return Substitution(variables)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Applies flux 'postBuild' variable substitution of a Kustomization to manifests read from stdin."
+    )
+    parser.add_argument("--root", default=".", help="repository root directory")
+    parser.add_argument("--name", required=True, help="name of the flux Kustomization")
+    parser.add_argument(
+        "--namespace", default="", help="namespace of the flux Kustomization"
+    )
+    args = parser.parse_args()
+
+    matches = KustomizationIndex(args.root).load().find(args.name, args.namespace)
+    if len(matches) != 1:
+        print(
+            f"Expected exactly one Kustomization '{args.name}', found {len(matches)}.",
+            file=sys.stderr,
+        )
+        return 1
+    substitution = compile_substitution(matches[0], RepoValuesResolver(args.root))
+    for i, document in enumerate(substitution.stream(read_documents(sys.stdin))):
+        if i > 0:
+            sys.stdout.write("---\n")
+        sys.stdout.write(document)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(levelname)s: %(message)s")
+    sys.exit(main())
@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+import argparse
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess  # nosec B404 - only runs kustomize and flux
+import sys
+import tempfile
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+
+import yaml
+
+from kustomization_index import FluxKustomization, KustomizationIndex
+from manifest_store import ManifestStoreWriter
+from postbuild_substitution import (
+    SUBSTITUTE_DISABLED_RE,
+    RepoValuesResolver,
+    Substitution,
+    ValuesResolver,
+    compile_substitution,
+    split_documents,
+)
+from render_cache import RenderCache, render_cache_key
+from sops_decrypt import (
+    GITOPS_MASTER_GPG_KEY_ENV_VAR_NAME,
+    SopsDecryptor,
+    master_key_from_env,
+)
+
+KUSTOMIZATION_FILE_NAMES = ["kustomization.yaml", "kustomization.yml", "Kustomization"]
+# paths in the 'config.kubernetes.io/origin' annotations kustomize adds with 'buildMetadata: [originAnnotations]'
+ORIGIN_PATH_RE = r"^(\s+path: ){}"
+
+# how many Kustomizations 'render_iter' renders ahead of the one it yields, per worker
+RENDER_AHEAD_PER_WORKER = 2
+
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+logger = logging.getLogger(__name__)
+
+
+def find_kustomization_file(dir_path: str) -> Optional[str]:
+    for file_name in KUSTOMIZATION_FILE_NAMES:
+        file = os.path.join(dir_path, file_name)
+        if os.path.isfile(file):
+            return file
+    return None
+
+
+def generated_resources(
+    dir_path: str, scanned_dirs: Optional[set[str]] = None
+) -> list[str]:
+    # What flux puts in the kustomization.yaml it generates for a path that doesn't have one: all the YAML files
+    # in the tree, except for directories with their own kustomization, which are included as a whole.
+    if find_kustomization_file(dir_path) is not None:
+        return [dir_path]
+    if scanned_dirs is not None:
+        scanned_dirs.add(dir_path)
+    resources = []
+    with os.scandir(dir_path) as entries:
+        for entry in sorted(entries, key=lambda e: e.name):
+            if entry.is_dir():
+                resources.extend(generated_resources(entry.path, scanned_dirs))
+            elif entry.is_file() and entry.name.endswith(".yaml"):
+                resources.append(entry.path)
+    return resources
+
+
+def _path_refs(node: object) -> Iterator[str]:
+    # Every string in a kustomization.yaml that could point to a file: resources, components, patches,
+    # generator files ('key=path' included) and so on. Whatever doesn't exist on disk is ignored later.
+    if isinstance(node, dict):
+        for value in node.values():
+            yield from _path_refs(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _path_refs(value)
+    elif isinstance(node, str) and "\n" not in node:
+        yield node.split("=", 1)[-1]
+
+
+@functools.lru_cache(maxsize=4096)
+def _kustomization_refs(kustomization_file: str, mtime_ns: int) -> tuple[str, ...]:
+    # bases are referenced by most of the overlays, their kustomization.yaml is parsed only once
+    with open(kustomization_file, "rb") as f:
+        try:
+            kustomization = yaml.load(f, Loader=YamlLoader)  # nosec B506 - safe loader
+        except yaml.YAMLError:
+            return ()
+    dir_path = os.path.dirname(kustomization_file)
+    return tuple(
+        os.path.normpath(os.path.join(dir_path, ref))
+        for ref in _path_refs(kustomization)
+        if "://" not in ref
+    )
+
+
+class KustomizeInputs(NamedTuple):
+    # files 'kustomize build' reads
+    files: set[str]
+    # directories listed to generate a kustomization.yaml, adding or removing files there changes the build
+    scanned_dirs: set[str]
+    # referenced paths that don't exist, they break the build if they start to exist or the other way round
+    missing: set[str]
+
+
+def _collect_inputs(dir_path: str, inputs: KustomizeInputs, visited: set[str]) -> None:
+    if dir_path in visited:
+        return
+    visited.add(dir_path)
+    kustomization_file = find_kustomization_file(dir_path)
+    if kustomization_file is None:
+        for resource in generated_resources(dir_path, inputs.scanned_dirs):
+            if os.path.isdir(resource):
+                _collect_inputs(resource, inputs, visited)
+            else:
+                inputs.files.add(resource)
+        return
+    inputs.files.add(kustomization_file)
+    for path in _kustomization_refs(
+        kustomization_file, os.stat(kustomization_file).st_mtime_ns
+    ):
+        if os.path.isdir(path):
+            _collect_inputs(path, inputs, visited)
+        elif os.path.isfile(path):
+            inputs.files.add(path)
+        else:
+            inputs.missing.add(path)
+
+
+def collect_kustomize_inputs(dir_path: str) -> KustomizeInputs:
+    if not os.path.isdir(dir_path):
+        # what flux reports too, instead of failing on the first directory listing
+        raise Exception(f"kustomization path not found: '{dir_path}'")
+    inputs = KustomizeInputs(set(), set(), set())
+    _collect_inputs(os.path.abspath(dir_path), inputs, set())
+    return inputs
+
+
+def kustomize_inputs(dir_path: str) -> set[str]:
+    # Absolute paths of all the local files 'kustomize build' of 'dir_path' reads.
+    return collect_kustomize_inputs(dir_path).files
+
+
+class RenderResult(NamedTuple):
+    kustomization: FluxKustomization
+    manifests: str
+    error: str
+
+
+class Renderer:
+    # Renders flux Kustomizations like 'flux build kustomization' does, but with a worker pool and rendering
+    # every distinct kustomize input tree only once: overlays made from the same bases, at the same depth,
+    # are the same build and differ only in their 'postBuild' variables, which are applied per Kustomization.
+    # Only 'spec.path' and 'spec.postBuild' are taken into account and, as with 'fake-flux build --use-kustomize',
+    # the output is kustomize's as is, without the labels flux adds to every object.
+    # With 'use_flux', every Kustomization is rendered by 'flux build kustomization' instead.
+    # Renders are kept in a 'RenderCache', keyed by the input files, the variables and the tool version.
+    # With a 'decryptor', SOPS encrypted Secrets are decrypted after the cache, so it never holds them in clear.
+
+    def __init__(
+        self,
+        repo_root: str = ".",
+        workers: Optional[int] = None,
+        resolver: Optional[ValuesResolver] = None,
+        cache: Optional[RenderCache] = None,
+        use_flux: bool = False,
+        decryptor: Optional[SopsDecryptor] = None,
+    ) -> None:
+        self._repo_root = os.path.abspath(repo_root)
+        self._workers = workers or os.cpu_count() or 1
+        self._resolver = resolver or RepoValuesResolver(self._repo_root)
+        self._cache = cache
+        self._use_flux = use_flux
+        self._decryptor = decryptor
+        self._tool_version = ""
+        self._digests: dict[str, str] = {}
+        self._digests_lock = threading.Lock()
+
+    def _run(self, *args: str) -> str:
+        proc = subprocess.run(  # nosec B603
+            list(args), capture_output=True, text=True, check=False
+        )
+        if proc.returncode != 0:
+            raise Exception(proc.stderr.strip() or f"'{' '.join(args[:2])}' failed.")
+        return proc.stdout
+
+    def _file_digest(self, path: str) -> str:
+        # bases are shared by most of the overlays, hash every file only once
+        digest = self._digests.get(path)
+        if digest is None:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            with self._digests_lock:
+                self._digests[path] = digest
+        return digest
+
+    def forget(self, files: Iterable[str]) -> None:
+        # for renderers kept across changes to the repository: files that changed since they were hashed
+        with self._digests_lock:
+            for file in files:
+                self._digests.pop(os.path.join(self._repo_root, file), None)
+
+    def render_key(self, path: str) -> str:
+        # Paths are taken relative to the rendered directory, so the same tree at another place with the same
+        # relative references to the bases has the same key.
+        hasher = hashlib.sha256(self._tool_version.encode())
+        hasher.update(b"generated" if find_kustomization_file(path) is None else b"")
+        for file in sorted(kustomize_inputs(path)):
+            hasher.update(f"\0{os.path.relpath(file, path)}\0".encode())
+            hasher.update(self._file_digest(file).encode())
+        return hasher.hexdigest()
+
+    def _safe_render_key(self, path: str) -> tuple[str, str]:
+        return self._safe(lambda: self.render_key(path))
+
+    def build(self, path: str) -> str:
+        if find_kustomization_file(path) is not None:
+            return self._run(
+                "kustomize", "build", "--load-restrictor=LoadRestrictionsNone", path
+            )
+        # generated in a temporary directory, so nothing is written to the repository while other builds,
+        # possibly of a parent directory, are running
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            resources = [os.path.relpath(r, tmp_dir) for r in generated_resources(path)]
+            with open(os.path.join(tmp_dir, "kustomization.yaml"), "w") as f:
+                yaml.dump(
+                    {
+                        "apiVersion": "kustomize.config.k8s.io/v1beta1",
+                        "kind": "Kustomization",
+                        "buildMetadata": ["originAnnotations"],
+                        "resources": resources,
+                    },
+                    f,
+                    Dumper=YamlDumper,
+                    sort_keys=False,
+                )
+            manifests = self._run(
+                "kustomize", "build", "--load-restrictor=LoadRestrictionsNone", tmp_dir
+            )
+            # origins are relative to the temporary directory, make them relative to 'path' as flux does
+            prefix = os.path.relpath(path, tmp_dir) + os.sep
+            return re.sub(
+                ORIGIN_PATH_RE.format(re.escape(prefix)),
+                r"\1",
+                manifests,
+                flags=re.MULTILINE,
+            )
+
+    def flux_build(self, kustomization: FluxKustomization, path: str) -> str:
+        return self._run(
+            "flux",
+            "build",
+            "kustomization",
+            "-n",
+            kustomization.namespace,
+            kustomization.name,
+            "--path",
+            path,
+            "--kustomization-file",
+            os.path.join(self._repo_root, kustomization.file),
+            "--dry-run",
+        )
+
+    def _path(self, kustomization: FluxKustomization, sub_path: str) -> str:
+        return os.path.normpath(
+            os.path.join(self._repo_root, kustomization.path, sub_path)
+        )
+
+    def _cache_key(
+        self,
+        kustomization: FluxKustomization,
+        render_key: str,
+        substitution: Substitution,
+    ) -> str:
+        parts = [
+            "flux" if self._use_flux else "kustomize",
+            render_key,
+            kustomization.namespace,
+            kustomization.name,
+            json.dumps(substitution.variables, sort_keys=True),
+        ]
+        if self._use_flux:
+            # flux reads the whole Kustomization, not only its 'postBuild'
+            parts.append(
+                self._file_digest(os.path.join(self._repo_root, kustomization.file))
+            )
+        return render_cache_key(*parts)
+
+    def _finalize(self, substitution: Substitution, manifests: str) -> str:
+        return "---\n".join(substitution.stream(split_documents(manifests)))
+
+    def _decrypt(self, manifests: str, substitution: Substitution) -> str:
+        # like kustomize-controller, variables are substituted in the decrypted content too, once: the rest of
+        # the documents is substituted already
+        assert self._decryptor is not None  # nosec B101 - only called with a decryptor
+        self._decryptor.load()
+        documents = []
+        for document in split_documents(manifests):
+            disabled = SUBSTITUTE_DISABLED_RE.search(document) is not None
+            decrypted = self._decryptor.decrypt_document(
+                document, None if disabled else substitution.apply
+            )
+            documents.append(document if decrypted is None else decrypted)
+        return "---\n".join(documents)
+
+    def _decrypt_result(
+        self, result: RenderResult, substitution: Substitution
+    ) -> RenderResult:
+        if self._decryptor is None or result.error:
+            return result
+        manifests, error = self._safe(
+            lambda: self._decrypt(result.manifests, substitution)
+        )
+        return RenderResult(result.kustomization, manifests, error)
+
+    def _safe(self, build: Callable[[], str]) -> tuple[str, str]:
+        try:
+            return build(), ""
+        except Exception as err:
+            return "", str(err)
+
+    def _load_tool_version(self) -> None:
+        if not self._tool_version:
+            self._tool_version = (
+                self._run("flux", "version", "--client")
+                if self._use_flux
+                else self._run("kustomize", "version")
+            ).strip()
+
+    def _render_one(
+        self,
+        kustomization: FluxKustomization,
+        path: str,
+        substitution: Substitution,
+        cache_key: str,
+        shared_build: Callable[[], tuple[str, str]],
+    ) -> tuple[RenderResult, bool]:
+        # returns whether the result comes from the cache too
+        manifests = self._cache.get(cache_key) if self._cache else None
+        if manifests is not None:
+            result = RenderResult(kustomization, manifests, "")
+            return self._decrypt_result(result, substitution), True
+        if self._use_flux:
+            manifests, error = self._safe(lambda: self.flux_build(kustomization, path))
+        else:
+            manifests, error = shared_build()
+            if not error:
+                manifests, error = self._safe(
+                    lambda: self._finalize(substitution, manifests)
+                )
+        if self._cache and not error:
+            self._cache.put(cache_key, manifests)
+        result = RenderResult(kustomization, manifests, error)
+        return self._decrypt_result(result, substitution), False
+
+    def render_iter(
+        self, kustomizations: list[FluxKustomization], sub_path: str = ""
+    ) -> Iterator[RenderResult]:
+        # Yields the results in the same order as 'kustomizations', each one as soon as it and the ones before
+        # it are done, so they can be written out as they come. Only a window of Kustomizations is rendered
+        # ahead of the one yielded, and a shared build is kept only until the last Kustomization using it is
+        # done, so the whole render is never held in memory.
+        self._load_tool_version()
+        paths = [self._path(k, sub_path) for k in kustomizations]
+        substitutions = [
+            compile_substitution(k, self._resolver) for k in kustomizations
+        ]
+        # the builds run on their own pool, the renders waiting for them can't starve it
+        with ThreadPoolExecutor(
+            max_workers=self._workers
+        ) as build_executor, ThreadPoolExecutor(
+            max_workers=self._workers
+        ) as render_executor:
+            # a Kustomization whose inputs can't be listed, like with a 'spec.path' that doesn't exist, fails
+            # on its own like a failed build
+            prepared = list(build_executor.map(self._safe_render_key, paths))
+            keys = [key for key, _ in prepared]
+            errors = [error for _, error in prepared]
+            cache_keys = [
+                "" if error else self._cache_key(k, key, substitution)
+                for k, key, error, substitution in zip(
+                    kustomizations, keys, errors, substitutions
+                )
+            ]
+            users = Counter(keys)
+            builds: dict[str, Future] = {}
+            builds_lock = threading.Lock()
+            built = 0
+            cached = 0
+
+            def shared_build(i: int) -> tuple[str, str]:
+                nonlocal built
+                with builds_lock:
+                    if keys[i] not in builds:
+                        built += 1
+                        builds[keys[i]] = build_executor.submit(
+                            self._safe, lambda: self.build(paths[i])
+                        )
+                    build = builds[keys[i]]
+                return build.result()
+
+            def render(i: int) -> tuple[RenderResult, bool]:
+                if errors[i]:
+                    return RenderResult(kustomizations[i], "", errors[i]), False
+                return self._render_one(
+                    kustomizations[i],
+                    paths[i],
+                    substitutions[i],
+                    cache_keys[i],
+                    lambda: shared_build(i),
+                )
+
+            window = RENDER_AHEAD_PER_WORKER * self._workers
+            pending = deque(
+                render_executor.submit(render, i)
+                for i in range(min(window, len(kustomizations)))
+            )
+            for i in range(len(kustomizations)):
+                result, from_cache = pending.popleft().result()
+                cached += from_cache
+                if i + window < len(kustomizations):
+                    pending.append(render_executor.submit(render, i + window))
+                users[keys[i]] -= 1
+                if users[keys[i]] == 0:
+                    with builds_lock:
+                        builds.pop(keys[i], None)
+                yield result
+        logger.info(
+            f"{cached} of {len(kustomizations)} Kustomizations found in the cache, "
+            f"{built} distinct kustomize builds rendered for the others."
+        )
+        if self._cache:
+            self._cache.prune()
+
+    def render_all(
+        self, kustomizations: list[FluxKustomization], sub_path: str = ""
+    ) -> list[RenderResult]:
+        # Results are in the same order as 'kustomizations', no matter in which order the builds finished.
+        return list(self.render_iter(kustomizations, sub_path))
+
+
+def _report(
+    results: Iterable[RenderResult], failed: list[RenderResult]
+) -> Iterator[RenderResult]:
+    # passes on the results that rendered, the others are printed and added to 'failed'
+    for result in results:
+        if not result.error:
+            yield result
+            continue
+        failed.append(result)
+        k = result.kustomization
+        print(
+            f"Rendering Kustomization '{k.namespace}/{k.name}' failed: {result.error}",
+            file=sys.stderr,
+        )
+
+
+def _write_results(
+    rendered: Iterable[RenderResult], store: Optional[str], output_dir: Optional[str]
+) -> None:
+    # every result is written as soon as it comes
+    if store:
+        with ManifestStoreWriter(store) as writer:
+            for result in rendered:
+                writer.add(result.kustomization, result.manifests)
+    elif output_dir:
+        for result in rendered:
+            k = result.kustomization
+            file = os.path.join(output_dir, f"{k.namespace}_{k.name}.yaml")
+            with open(file, "w") as f:
+                f.write(result.manifests)
+    else:
+        for i, result in enumerate(rendered):
+            if i:
+                sys.stdout.write("---\n")
+            sys.stdout.write(result.manifests)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Renders the flux Kustomizations of the repository in parallel."
+    )
+    parser.add_argument("--root", default=".", help="repository root directory")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of parallel renders (default: CPU count)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="write every Kustomization to '<namespace>_<name>.yaml' in this directory instead of stdout",
+    )
+    parser.add_argument(
+        "--store",
+        help="write the documents to an indexed manifest store in this directory instead of stdout, "
+        "to query with 'manifest_store.py'",
+    )
+    parser.add_argument(
+        "--kustomization",
+        action="append",
+        dest="kustomizations",
+        metavar="NAME:NAMESPACE",
+        help="render only the given Kustomizations; can be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--sub-path",
+        default="",
+        help="render only this path below the path of the Kustomizations",
+    )
+    parser.add_argument(
+        "--use-flux",
+        action="store_true",
+        help="render with 'flux build kustomization' instead of kustomize",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="don't use the render cache"
+    )
+    parser.add_argument(
+        "--decrypt",
+        action="store_true",
+        help=f"decrypt SOPS encrypted Secrets with the key from {GITOPS_MASTER_GPG_KEY_ENV_VAR_NAME}",
+    )
+    args = parser.parse_args()
+
+    kustomizations = list(KustomizationIndex(args.root).load())
+    if args.kustomizations:
+        selected = {tuple((k + ":").split(":")[:2]) for k in args.kustomizations}
+        kustomizations = [
+            k for k in kustomizations if (k.name, k.namespace) in selected
+        ]
+    cache = None if args.no_cache else RenderCache()
+    decryptor = None
+    if args.decrypt:
+        master_key = master_key_from_env()
+        decryptor = SopsDecryptor(
+            args.root, [master_key] if master_key else [], args.workers
+        )
+    renderer = Renderer(
+        args.root,
+        args.workers,
+        cache=cache,
+        use_flux=args.use_flux,
+        decryptor=decryptor,
+    )
+    failed: list[RenderResult] = []
+    results = renderer.render_iter(kustomizations, args.sub_path)
+    _write_results(_report(results, failed), args.store, args.output_dir)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(levelname)s: %(message)s")
+    sys.exit(main())
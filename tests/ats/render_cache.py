@@ -0,0 +1,105 @@
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+from typing import Optional
+
+from cache_dir import get_cache_dir
+
+RENDER_CACHE_DIR_NAME = "renders"
+GITOPS_RENDER_CACHE_MAX_MB_ENV_VAR_NAME = "GITOPS_RENDER_CACHE_MAX_MB"
+DEFAULT_RENDER_CACHE_MAX_MB = 512
+# bump when the format of the cached renders changes
+RENDER_CACHE_VERSION = 2
+PRUNE_LOCK_FILE_NAME = ".prune.lock"
+
+logger = logging.getLogger(__name__)
+
+
+def render_cache_key(*parts: str) -> str:
+    hasher = hashlib.sha256(str(RENDER_CACHE_VERSION).encode())
+    for part in parts:
+        hasher.update(b"\0")
+        hasher.update(part.encode())
+    return hasher.hexdigest()
+
+
+def _max_bytes_from_env() -> int:
+    max_mb = os.getenv(
+        GITOPS_RENDER_CACHE_MAX_MB_ENV_VAR_NAME, str(DEFAULT_RENDER_CACHE_MAX_MB)
+    )
+    if not max_mb.isdigit():
+        logger.error(
+            f"The '{GITOPS_RENDER_CACHE_MAX_MB_ENV_VAR_NAME}' environment variable must be a non-negative integer"
+            f" [current value: '{max_mb}']."
+        )
+        raise Exception("malformed render cache size")
+    return int(max_mb) * 1024 * 1024
+
+
+class RenderCache:
+    # Content-addressed store of rendered manifests, one file per key. Entries are written atomically, so any
+    # number of processes can share the directory; a hit refreshes the entry's mtime, which is what 'prune'
+    # uses to evict the least recently used entries once the cache is over its size limit.
+
+    def __init__(
+        self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None
+    ) -> None:
+        self._cache_dir = cache_dir or get_cache_dir(RENDER_CACHE_DIR_NAME)
+        self._max_bytes = _max_bytes_from_env() if max_bytes is None else max_bytes
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key[:2], f"{key}.yaml")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._entry_path(key)
+        try:
+            with open(path) as f:
+                manifests = f.read()
+            os.utime(path)
+        except OSError:
+            # missing, or evicted by another process in the meantime
+            return None
+        return manifests
+
+    def put(self, key: str, manifests: str) -> None:
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "w") as f:
+            f.write(manifests)
+        os.replace(tmp_file, path)
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        for shard in os.scandir(self._cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith(".yaml"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def prune(self) -> None:
+        with open(os.path.join(self._cache_dir, PRUNE_LOCK_FILE_NAME), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # another process is already pruning
+                return
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self._max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
@@ -0,0 +1,73 @@
+import logging
+from typing import Optional
+
+import yaml
+
+from kustomization_index import KustomizationIndex
+from postbuild_substitution import split_documents
+from render import Renderer
+from render_cache import RenderCache
+from sops_decrypt import SopsDecryptor
+
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# (kind, namespace, name)
+RenderedKey = tuple[str, str, str]
+
+logger = logging.getLogger(__name__)
+
+
+class RenderedObjects:
+    # All the objects the flux Kustomizations of the repository render to, indexed by (kind, namespace, name).
+    # This is what the cluster gets, before any controller acts on it, so expectations about objects fully
+    # decided at render time can be checked without a cluster.
+
+    def __init__(self, objects: dict[RenderedKey, dict]) -> None:
+        self._objects = objects
+
+    @classmethod
+    def render(
+        cls, repo_root: str = ".", decryptor: Optional[SopsDecryptor] = None
+    ) -> "RenderedObjects":
+        kustomizations = list(KustomizationIndex(repo_root).load())
+        results = Renderer(
+            repo_root, cache=RenderCache(), decryptor=decryptor
+        ).render_all(kustomizations)
+        errors = [
+            f"Kustomization '{r.kustomization.namespace}/{r.kustomization.name}': {r.error}"
+            for r in results
+            if r.error
+        ]
+        if errors:
+            msg = "Rendering failed for:\n" + "\n".join(errors)
+            logger.error(msg)
+            raise Exception(msg)
+
+        objects: dict[RenderedKey, dict] = {}
+        for result in results:
+            for document in split_documents(result.manifests):
+                obj = yaml.load(document, Loader=YamlLoader)  # nosec B506 - safe loader
+                if not isinstance(obj, dict) or "kind" not in obj:
+                    continue
+                meta = obj.get("metadata") or {}
+                key = (obj["kind"], meta.get("namespace", ""), meta.get("name", ""))
+                if key in objects:
+                    logger.warning(
+                        f"{key[0]} '{key[1]}/{key[2]}' is rendered by more than one Kustomization, "
+                        f"the one from '{result.kustomization.name}' is used."
+                    )
+                objects[key] = obj
+        logger.info(
+            f"Rendered {len(objects)} objects from {len(kustomizations)} Kustomizations."
+        )
+        return cls(objects)
+
+    def get(self, kind: str, namespace: Optional[str], name: str) -> Optional[dict]:
+        obj = self._objects.get((kind, namespace or "", name))
+        if obj is None and namespace == "default":
+            # objects without a namespace end up in 'default' when they're applied
+            obj = self._objects.get((kind, "", name))
+        return obj
+
+    def __len__(self) -> int:
+        return len(self._objects)
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional, Type
+
+import pykube
+import requests
+from pykube.exceptions import HTTPError
+from pykube.objects import APIObject, NamespacedAPIObject
+
+from cache_dir import get_cache_dir
+
+DISCOVERY_CACHE_DIR_NAME = "discovery"
+DISCOVERY_CONCURRENCY = 8
+CRDS_API_VERSION = "apiextensions.k8s.io/v1"
+# ask only for the metadata of the CRDs, their schemas can be huge
+PARTIAL_METADATA_LIST_ACCEPT = (
+    "application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1"
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _not_served_message(api_version: str, kind: str) -> str:
+    return f"The API server doesn't serve objects of kind '{kind}' in version '{api_version}'."
+
+
+class RestMapping(NamedTuple):
+    plural: str
+    namespaced: bool
+
+
+class RestMapper:
+    # Maps (apiVersion, kind) to the REST resource serving it, based on the API server's discovery endpoints.
+    # Discovery results are persisted on disk and keyed by the server version and the set of installed CRDs,
+    # so repeated runs against the same cluster version don't need to go through the discovery again.
+
+    def __init__(
+        self, kube_client: pykube.HTTPClient, cache_dir: Optional[str] = None
+    ) -> None:
+        self._kube_client = kube_client
+        self._cache_dir = cache_dir or get_cache_dir(DISCOVERY_CACHE_DIR_NAME)
+        self._mappings: dict[tuple[str, str], RestMapping] = {}
+        self._classes: dict[tuple[str, str], Type[APIObject]] = {}
+        self._cache_key = ""
+        self._lock = threading.Lock()
+
+    def _server_version(self) -> str:
+        resp = self._kube_client.get(version="", base="/version")
+        self._kube_client.raise_for_status(resp)
+        return resp.json()["gitVersion"]
+
+    def _crds_fingerprint(self) -> str:
+        resp = self._kube_client.get(
+            version=CRDS_API_VERSION,
+            url="customresourcedefinitions",
+            headers={"Accept": PARTIAL_METADATA_LIST_ACCEPT},
+        )
+        self._kube_client.raise_for_status(resp)
+        crds = sorted(
+            f"{i['metadata']['name']}:{i['metadata'].get('generation', 0)}"
+            for i in resp.json().get("items") or []
+        )
+        return hashlib.sha256("\n".join(crds).encode()).hexdigest()
+
+    def _get_cache_key(self) -> str:
+        key = f"{self._server_version()}/{self._crds_fingerprint()}"
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def _cache_file(self, cache_key: str) -> str:
+        return os.path.join(self._cache_dir, f"rest-mappings-{cache_key}.json")
+
+    def _discover_group_version(self, group_version: str) -> Optional[list[list]]:
+        # None when the discovery failed. Not 'resource_list', it keeps the first answer for the client's
+        # lifetime and would miss the CRDs added to a group version after that.
+        try:
+            resp = self._kube_client.get(version=group_version)
+            self._kube_client.raise_for_status(resp)
+            resources = resp.json()["resources"]
+        except (HTTPError, requests.exceptions.RequestException) as err:
+            # aggregated APIs might be unavailable, this shouldn't break the discovery of all the others
+            logger.warning(f"Discovery of '{group_version}' API failed: '{err}'.")
+            return None
+        # subresources, like 'deployments/scale', have their own entries
+        return [
+            [group_version, r["kind"], r["name"], r["namespaced"]]
+            for r in resources
+            if "/" not in r["name"]
+        ]
+
+    def _discover(self) -> tuple[list[list], bool]:
+        # the mappings, and whether all the group versions were discovered
+        resp = self._kube_client.get(version="/apis")
+        self._kube_client.raise_for_status(resp)
+        group_versions = ["v1"] + [
+            v["groupVersion"] for g in resp.json()["groups"] for v in g["versions"]
+        ]
+        with ThreadPoolExecutor(max_workers=DISCOVERY_CONCURRENCY) as executor:
+            results = list(executor.map(self._discover_group_version, group_versions))
+        mappings = [m for result in results if result is not None for m in result]
+        return mappings, None not in results
+
+    def _load_from_file(self, cache_file: str) -> Optional[list[list]]:
+        try:
+            with open(cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_to_file(self, cache_file: str, mappings: list[list]) -> None:
+        tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(mappings, f)
+        os.replace(tmp_file, cache_file)
+
+    def load(self) -> None:
+        cache_key = self._get_cache_key()
+        if cache_key == self._cache_key:
+            return
+        cache_file = self._cache_file(cache_key)
+        mappings = self._load_from_file(cache_file)
+        if mappings is None:
+            logger.debug(
+                f"Running API discovery, results will be saved in '{cache_file}'."
+            )
+            mappings, complete = self._discover()
+            if not complete:
+                # partial results would stick to the cache key, discover again next time instead
+                self._set_mappings(mappings)
+                return
+            self._save_to_file(cache_file, mappings)
+        else:
+            logger.debug(f"Using API discovery results from '{cache_file}'.")
+        self._set_mappings(mappings)
+        self._cache_key = cache_key
+
+    def _set_mappings(self, mappings: list[list]) -> None:
+        self._mappings = {
+            (api_version, kind): RestMapping(plural, namespaced)
+            for api_version, kind, plural, namespaced in mappings
+        }
+
+    def find(self, api_version: str, kind: str) -> Optional[RestMapping]:
+        # None when the API server doesn't serve the kind, even after running the discovery again
+        mapping = self._mappings.get((api_version, kind))
+        if mapping is not None:
+            return mapping
+        # the CRD might have been installed after we loaded the mappings
+        with self._lock:
+            self.load()
+        return self._mappings.get((api_version, kind))
+
+    def get(self, api_version: str, kind: str) -> RestMapping:
+        mapping = self.find(api_version, kind)
+        if mapping is None:
+            raise Exception(_not_served_message(api_version, kind))
+        return mapping
+
+    def find_api_object_class(
+        self, api_version: str, kind: str
+    ) -> Optional[Type[APIObject]]:
+        obj_class = self._classes.get((api_version, kind))
+        if obj_class is not None:
+            return obj_class
+        mapping = self.find(api_version, kind)
+        if mapping is None:
+            return None
+        base_class = NamespacedAPIObject if mapping.namespaced else APIObject
+        obj_class = type(
+            kind,
+            (base_class,),
+            {"version": api_version, "endpoint": mapping.plural, "kind": kind},
+        )
+        self._classes[(api_version, kind)] = obj_class
+        return obj_class
+
+    def api_object_class(self, api_version: str, kind: str) -> Type[APIObject]:
+        obj_class = self.find_api_object_class(api_version, kind)
+        if obj_class is None:
+            raise Exception(_not_served_message(api_version, kind))
+        return obj_class
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator, NamedTuple, Optional
+
+import yaml
+
+from cache_dir import get_cache_dir
+from postbuild_substitution import read_documents
+
+try:
+    import jsonschema
+except ImportError:  # pragma: no cover - optional, only needed by 'validate'
+    jsonschema = None
+
+GITOPS_SCHEMA_DIR_ENV_VAR_NAME = "GITOPS_SCHEMA_DIR"
+SCHEMAS_DIR_NAME = "schemas"
+VALIDATORS_CACHE_DIR_NAME = "validators"
+# bump when the format of the bundled schemas changes
+VALIDATORS_CACHE_VERSION = 1
+# the same sources test-all-ff used with kubeconform
+SCHEMA_REPOSITORIES = [
+    "https://raw.githubusercontent.com/yannh/kubernetes-json-schema/master/master",
+    "https://raw.githubusercontent.com/giantswarm/json-schema/main/master",
+]
+DEFINITIONS_FILE_NAME = "_definitions.json"
+# written next to where a schema would be when none of the repositories has it, so it isn't looked for again
+MISSING_SCHEMA_SUFFIX = ".missing"
+DOCUMENTS_PER_BATCH = 64
+
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentError(NamedTuple):
+    file: str
+    # position of the document in the file, starting at 0
+    document: int
+    api_version: str
+    kind: str
+    name: str
+    namespace: str
+    # JSON path of the invalid field, empty for errors about the whole document
+    path: str
+    message: str
+
+
+class ValidationSummary(NamedTuple):
+    file: str
+    documents: int
+    skipped: int
+    errors: list[DocumentError]
+
+
+def get_schema_dir() -> str:
+    return os.getenv(GITOPS_SCHEMA_DIR_ENV_VAR_NAME) or get_cache_dir(SCHEMAS_DIR_NAME)
+
+
+def schema_file_name(api_version: str, kind: str) -> str:
+    # the naming used by kubeconform's '{{ .ResourceKind }}{{ .KindSuffix }}.json' template
+    group, _, version = api_version.rpartition("/")
+    if not group:
+        return f"{kind.lower()}-{version}.json"
+    return f"{kind.lower()}-{group.split('.')[0]}-{version}.json"
+
+
+def _bundle(schema: Any, schema_dir: str) -> Any:
+    # Inlines the definitions referenced from other files (like '_definitions.json#/definitions/...'), so the
+    # result is self-contained and can be validated and cached without the, possibly huge, definitions file.
+    definitions: dict[str, Any] = {}
+    loaded: dict[str, Any] = {}
+
+    def rewrite(node: Any) -> Any:
+        if isinstance(node, list):
+            return [rewrite(n) for n in node]
+        if not isinstance(node, dict):
+            return node
+        node = {k: rewrite(v) for k, v in node.items()}
+        ref = node.get("$ref")
+        if isinstance(ref, str) and "#/definitions/" in ref:
+            file, _, name = ref.partition("#/definitions/")
+            if file and name not in definitions:
+                if file not in loaded:
+                    with open(os.path.join(schema_dir, file)) as f:
+                        loaded[file] = json.load(f).get("definitions", {})
+                definitions[name] = None
+                definitions[name] = rewrite(_rebase(loaded[file][name], file))
+            node["$ref"] = f"#/definitions/{name}"
+        return node
+
+    bundled = rewrite(schema)
+    if definitions:
+        bundled.setdefault("definitions", {}).update(definitions)
+    return bundled
+
+
+def _rebase(node: Any, file: str) -> Any:
+    # references inside a definitions file are local to it
+    if isinstance(node, list):
+        return [_rebase(n, file) for n in node]
+    if not isinstance(node, dict):
+        return node
+    node = {k: _rebase(v, file) for k, v in node.items()}
+    if isinstance(node.get("$ref"), str) and node["$ref"].startswith("#/"):
+        node["$ref"] = file + node["$ref"]
+    return node
+
+
+class ValidatorStore:
+    # One compiled validator per (apiVersion, kind), kept in memory. The bundled schemas they're compiled from
+    # are cached on disk, keyed by the schema files they were made of, so a new process doesn't have to load
+    # and resolve the definitions again.
+
+    def __init__(
+        self, schema_dir: Optional[str] = None, cache_dir: Optional[str] = None
+    ) -> None:
+        self._schema_dir = schema_dir or get_schema_dir()
+        self._cache_dir = cache_dir or get_cache_dir(VALIDATORS_CACHE_DIR_NAME)
+        self._validators: dict[tuple[str, str], Any] = {}
+
+    def _fingerprint(self, *files: str) -> str:
+        hasher = hashlib.sha256(str(VALIDATORS_CACHE_VERSION).encode())
+        for file in files:
+            try:
+                stat = os.stat(file)
+            except FileNotFoundError:
+                continue
+            hasher.update(f"{file}\0{stat.st_mtime_ns}\0{stat.st_size}\0".encode())
+        return hasher.hexdigest()
+
+    def _load_bundled(self, schema_file: str) -> Any:
+        cache_file = os.path.join(
+            self._cache_dir,
+            self._fingerprint(
+                schema_file, os.path.join(self._schema_dir, DEFINITIONS_FILE_NAME)
+            )
+            + ".json",
+        )
+        try:
+            with open(cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+        with open(schema_file) as f:
+            bundled = _bundle(json.load(f), self._schema_dir)
+        tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(bundled, f)
+        os.replace(tmp_file, cache_file)
+        return bundled
+
+    def get(self, api_version: str, kind: str) -> Optional[Any]:
+        # None when there's no schema for the kind; like 'kubeconform -ignore-missing-schemas', such objects
+        # are skipped
+        key = (api_version, kind)
+        if key in self._validators:
+            return self._validators[key]
+        schema_file = os.path.join(
+            self._schema_dir, schema_file_name(api_version, kind)
+        )
+        validator = None
+        if os.path.isfile(schema_file):
+            schema = self._load_bundled(schema_file)
+            validator_class = jsonschema.validators.validator_for(
+                schema, default=jsonschema.Draft4Validator
+            )
+            validator = validator_class(schema)
+        self._validators[key] = validator
+        return validator
+
+
+# every worker process keeps its own validators
+_store: Optional[ValidatorStore] = None
+
+
+def _init_worker(schema_dir: str) -> None:
+    global _store
+    _store = ValidatorStore(schema_dir)
+
+
+def _json_path(path: Any) -> str:
+    return "".join(f"[{p}]" if isinstance(p, int) else f".{p}" for p in path)
+
+
+def validate_documents(
+    file: str, first: int, documents: list[str]
+) -> tuple[int, list[DocumentError]]:
+    # Returns the number of documents without a schema and the errors found in the others.
+    assert _store is not None  # nosec B101 - set by '_init_worker'
+    skipped = 0
+    errors = []
+    for i, document in enumerate(documents, start=first):
+        try:
+            obj = yaml.load(document, Loader=YamlLoader)  # nosec B506 - safe loader
+        except yaml.YAMLError as err:
+            errors.append(
+                DocumentError(file, i, "", "", "", "", "", f"invalid YAML: {err}")
+            )
+            continue
+        if obj is None:
+            continue
+        if not isinstance(obj, dict) or "apiVersion" not in obj or "kind" not in obj:
+            errors.append(
+                DocumentError(
+                    file, i, "", "", "", "", "", "missing 'apiVersion' or 'kind'"
+                )
+            )
+            continue
+        api_version, kind = str(obj["apiVersion"]), str(obj["kind"])
+        metadata = obj.get("metadata") or {}
+        validator = _store.get(api_version, kind)
+        if validator is None:
+            skipped += 1
+            continue
+        for error in sorted(validator.iter_errors(obj), key=lambda e: list(e.path)):
+            errors.append(
+                DocumentError(
+                    file,
+                    i,
+                    api_version,
+                    kind,
+                    str(metadata.get("name", "")),
+                    str(metadata.get("namespace", "")),
+                    _json_path(error.absolute_path),
+                    error.message,
+                )
+            )
+    return skipped, errors
+
+
+def _batches(file: str) -> Iterator[tuple[str, int, list[str]]]:
+    with open(file) as f:
+        batch: list[str] = []
+        first = 0
+        for document in read_documents(f):
+            batch.append(document)
+            if len(batch) == DOCUMENTS_PER_BATCH:
+                yield file, first, batch
+                first += len(batch)
+                batch = []
+        if batch:
+            yield file, first, batch
+
+
+def validator_pool(
+    schema_dir: Optional[str] = None, workers: Optional[int] = None
+) -> ProcessPoolExecutor:
+    # Workers keep their validators for as long as the pool lives, submit 'validate_documents' to them.
+    if jsonschema is None:
+        raise Exception(
+            "Schema validation needs the 'jsonschema' package, install it first."
+        )
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(schema_dir or get_schema_dir(),),
+    )
+
+
+def validate_files(
+    files: list[str], schema_dir: Optional[str] = None, workers: Optional[int] = None
+) -> list[ValidationSummary]:
+    # Documents are validated in batches across a process pool as they're read. Summaries are in the order
+    # of 'files' and errors in the order of the documents.
+    summaries = {f: ValidationSummary(f, 0, 0, []) for f in files}
+    with validator_pool(schema_dir, workers) as executor:
+        futures = [
+            (file, len(batch), executor.submit(validate_documents, file, first, batch))
+            for f in files
+            for file, first, batch in _batches(f)
+        ]
+        for file, count, future in futures:
+            skipped, errors = future.result()
+            summary = summaries[file]
+            summaries[file] = ValidationSummary(
+                file,
+                summary.documents + count,
+                summary.skipped + skipped,
+                summary.errors + errors,
+            )
+    return list(summaries.values())
+
+
+def _objects_kinds(files: list[str]) -> set[tuple[str, str]]:
+    kinds = set()
+    for file in files:
+        with open(file) as f:
+            for document in read_documents(f):
+                obj = yaml.load(document, Loader=YamlLoader)  # nosec B506 - safe loader
+                if isinstance(obj, dict) and "apiVersion" in obj and "kind" in obj:
+                    kinds.add((str(obj["apiVersion"]), str(obj["kind"])))
+    return kinds
+
+
+def _download(file_name: str, schema_dir: str) -> Optional[bool]:
+    # True when the schema was downloaded, False when none of the repositories has it and None when they
+    # couldn't be reached, it may be there on the next try
+    for repository in SCHEMA_REPOSITORIES:
+        url = f"{repository}/{file_name}"
+        try:
+            with urllib.request.urlopen(
+                url, timeout=30
+            ) as resp:  # nosec B310 - fixed https URLs
+                content = resp.read()
+        except urllib.error.HTTPError as err:
+            if err.code == 404:
+                continue
+            logger.warning(f"Downloading '{url}' failed: {err}.")
+            return None
+        except (urllib.error.URLError, OSError) as err:
+            logger.warning(f"Downloading '{url}' failed: {err}.")
+            return None
+        schema_file = os.path.join(schema_dir, file_name)
+        tmp_file = f"{schema_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(content)
+        os.replace(tmp_file, schema_file)
+        return True
+    return False
+
+
+def vendor_schemas(
+    files: list[str], schema_dir: Optional[str] = None, retry_missing: bool = False
+) -> list[str]:
+    # Downloads the schemas of all the kinds found in 'files' that aren't in 'schema_dir' yet. Schemas none of
+    # the repositories has are marked as missing and not looked for again, unless 'retry_missing' is set.
+    # Returns the names of the schemas that are missing or couldn't be downloaded.
+    schema_dir = schema_dir or get_schema_dir()
+    os.makedirs(schema_dir, exist_ok=True)
+    missing = []
+    file_names = {schema_file_name(v, k) for v, k in _objects_kinds(files)}
+    for file_name in sorted(file_names | {DEFINITIONS_FILE_NAME}):
+        schema_file = os.path.join(schema_dir, file_name)
+        if os.path.isfile(schema_file):
+            continue
+        marker = schema_file + MISSING_SCHEMA_SUFFIX
+        if os.path.isfile(marker) and not retry_missing:
+            missing.append(file_name)
+            continue
+        logger.info(f"Downloading schema '{file_name}'.")
+        downloaded = _download(file_name, schema_dir)
+        if downloaded:
+            if os.path.isfile(marker):
+                os.unlink(marker)
+            continue
+        if downloaded is False:
+            open(marker, "w").close()
+        missing.append(file_name)
+    return missing
+
+
+def _print_text(summaries: list[ValidationSummary]) -> None:
+    for summary in summaries:
+        status = "OK" if not summary.errors else f"{len(summary.errors)} errors"
+        print(
+            f"{summary.file}: {summary.documents} documents, {summary.skipped} without schema, {status}"
+        )
+        for err in summary.errors:
+            obj = ""
+            if err.kind:
+                name = f"{err.namespace}/{err.name}" if err.namespace else err.name
+                obj = f" ({err.kind} '{name}')"
+            print(f"  document {err.document}{obj} {err.path or '.'}: {err.message}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Validates rendered manifests against JSON schemas from a local directory."
+    )
+    parser.add_argument(
+        "--schema-dir",
+        help=f"directory with the schemas (default: '{GITOPS_SCHEMA_DIR_ENV_VAR_NAME}' or the cache directory)",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    validate_parser = subparsers.add_parser("validate", help="validate manifest files")
+    validate_parser.add_argument("files", nargs="+")
+    validate_parser.add_argument(
+        "--workers", type=int, help="number of worker processes (default: CPU count)"
+    )
+    validate_parser.add_argument("--format", choices=["text", "json"], default="text")
+    vendor_parser = subparsers.add_parser(
+        "vendor",
+        help="download the schemas the manifest files need into the schema directory",
+    )
+    vendor_parser.add_argument("files", nargs="+")
+    vendor_parser.add_argument(
+        "--retry-missing",
+        action="store_true",
+        help="look again for the schemas that weren't found in any repository before",
+    )
+    args = parser.parse_args()
+
+    if args.command == "vendor":
+        missing = vendor_schemas(args.files, args.schema_dir, args.retry_missing)
+        for file_name in missing:
+            print(f"No schema found for '{file_name}'.", file=sys.stderr)
+        return 0
+
+    summaries = validate_files(args.files, args.schema_dir, args.workers)
+    if args.format == "json":
+        json.dump(
+            [
+                {**s._asdict(), "errors": [e._asdict() for e in s.errors]}
+                for s in summaries
+            ],
+            sys.stdout,
+            indent=2,
+        )
+        print()
+    else:
+        _print_text(summaries)
+    return 2 if any(s.errors for s in summaries) else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    sys.exit(main())
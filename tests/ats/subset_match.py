@@ -0,0 +1,75 @@
+from collections import Counter
+from typing import Any, Hashable
+
+
+def _freeze(value: Any) -> Hashable:
+    # hashable representation of a YAML value, where order of list items doesn't matter
+    if isinstance(value, dict):
+        return dict, frozenset((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return list, frozenset(Counter(_freeze(v) for v in value).items())
+    return type(value), value
+
+
+def _list_is_subset(expected: list, actual: list) -> bool:
+    # Lists are matched as multisets: the real list can't have more or fewer items than the expectation,
+    # but the order doesn't matter. Items equal on both sides are matched by their hash first, then each of
+    # the expected items left has to be a subset of a different one of the real items left.
+    if len(expected) != len(actual):
+        return False
+    actual_left = Counter(_freeze(v) for v in actual)
+    expected_left = []
+    for value in expected:
+        frozen = _freeze(value)
+        if actual_left[frozen] > 0:
+            actual_left[frozen] -= 1
+        else:
+            expected_left.append(value)
+    if not expected_left:
+        return True
+    candidates = []
+    for value in actual:
+        frozen = _freeze(value)
+        if actual_left[frozen] > 0:
+            actual_left[frozen] -= 1
+            candidates.append(value)
+    return _has_perfect_matching(expected_left, candidates)
+
+
+def _has_perfect_matching(expected: list, candidates: list) -> bool:
+    # An expected item can be a subset of more than one candidate, so the first fit isn't always right:
+    # matching is a bipartite one, found with augmenting paths (Kuhn's algorithm). The items left after
+    # the exact matches are few, so the quadratic number of subset checks doesn't matter.
+    fits = [
+        [j for j, candidate in enumerate(candidates) if is_subset(value, candidate)]
+        for value in expected
+    ]
+    # candidate index -> expected index it's matched with
+    matched: dict[int, int] = {}
+
+    def augment(i: int, visited: set[int]) -> bool:
+        for j in fits[i]:
+            if j in visited:
+                continue
+            visited.add(j)
+            if j not in matched or augment(matched[j], visited):
+                matched[j] = i
+                return True
+        return False
+
+    return all(augment(i, set()) for i in range(len(expected)))
+
+
+def is_subset(expected: Any, actual: Any) -> bool:
+    # Checks if all the properties from 'expected' are present in 'actual' with the same values. Walks only
+    # the keys present in the expectation and stops on the first mismatch.
+    if isinstance(expected, dict):
+        if not isinstance(actual, dict):
+            return False
+        for key, value in expected.items():
+            if key not in actual or not is_subset(value, actual[key]):
+                return False
+        return True
+    if isinstance(expected, list):
+        return isinstance(actual, list) and _list_is_subset(expected, actual)
+    return type(expected) is type(actual) and expected == actual
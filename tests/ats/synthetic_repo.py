@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+import os
+import shutil
+import subprocess  # nosec B404 - only used to run 'git init'
+import sys
+from typing import NamedTuple
+
+import yaml
+
+GITOPS_REPO_ROOT = "../.."
+GITOPS_TOP_DIR_NAME = "management-clusters"
+BASES_DIR_NAME = "bases"
+TEMPLATE_MC_DIR_NAME = "MC_NAME"
+TEMPLATE_MC_ID = "mc-name"
+TEMPLATE_ORG_DIR_NAME = "ORG_NAME"
+TEMPLATE_ORG_ID = "org-name"
+WORKLOAD_CLUSTERS_DIR_NAME = "workload-clusters"
+# workload clusters made from 'bases/cluster_templates/hello_app_cluster' with the 'bases/environments' overlays,
+# new clusters cycle through them
+TEMPLATE_WC_DIR_NAMES = (
+    "HELLO_APP_DEV_CLUSTER_1",
+    "HELLO_APP_STAGING_CLUSTER_1",
+    "HELLO_APP_PROD_CLUSTER_EU_CENTRAL",
+    "HELLO_APP_PROD_CLUSTER_US_WEST",
+)
+ASSERTIONS_DIR = os.path.join("tests", "ats", "assertions", "exists")
+WC_ASSERTIONS_DIR = os.path.join(
+    ASSERTIONS_DIR, "organizations", WORKLOAD_CLUSTERS_DIR_NAME
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RepoSize(NamedTuple):
+    management_clusters: int
+    organizations: int
+    workload_clusters: int
+
+    @classmethod
+    def parse(cls, size: str) -> "RepoSize":
+        # 'NxMxK': N management clusters with M organizations each, with K workload clusters each
+        parts = size.split("x")
+        if len(parts) != 3 or not all(p.isdigit() and int(p) > 0 for p in parts):
+            msg = f"Repository size '{size}' has to be in the 'NxMxK' format, with positive numbers."
+            logger.error(msg)
+            raise Exception(msg)
+        return cls(*(int(p) for p in parts))
+
+    def __str__(self) -> str:
+        return "x".join(str(p) for p in self)
+
+
+class WorkloadClusterTemplate(NamedTuple):
+    dir_name: str
+    cluster_name: str
+
+
+def _copy_tree(src: str, dst: str, replacements: list[tuple[str, str]]) -> None:
+    # copies 'src' to 'dst', applying the replacements to the names and the content of all the files
+    for dir_path, _, file_names in os.walk(src):
+        rel_dir = os.path.relpath(dir_path, src)
+        for file_name in file_names:
+            src_file = os.path.join(dir_path, file_name)
+            dst_file = os.path.normpath(os.path.join(dst, rel_dir, file_name))
+            _copy_file(src_file, dst_file, replacements)
+
+
+def _replace(text: str, replacements: list[tuple[str, str]]) -> str:
+    for old, new in replacements:
+        text = text.replace(old, new)
+    return text
+
+
+def _copy_file(src: str, dst: str, replacements: list[tuple[str, str]]) -> None:
+    dst = os.path.join(
+        os.path.dirname(dst), _replace(os.path.basename(dst), replacements)
+    )
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    with open(src) as f:
+        content = f.read()
+    with open(dst, "w") as f:
+        f.write(_replace(content, replacements))
+
+
+class SyntheticRepoGenerator:
+    # Builds a repository of any size out of the building blocks of this one: every management cluster is a copy
+    # of 'MC_NAME', every organization of 'ORG_NAME' and every workload cluster of one of the 'hello_app_cluster'
+    # based clusters, so they all share 'bases/' the same way real clusters made from templates do. The
+    # assertions of the template clusters are copied too, renamed for each new cluster.
+
+    def __init__(self, source_root: str = GITOPS_REPO_ROOT) -> None:
+        self._source_root = source_root
+        self._mc_dir = os.path.join(
+            source_root, GITOPS_TOP_DIR_NAME, TEMPLATE_MC_DIR_NAME
+        )
+        self._org_dir = os.path.join(
+            self._mc_dir, "organizations", TEMPLATE_ORG_DIR_NAME
+        )
+        self._wc_templates = [self._wc_template(d) for d in TEMPLATE_WC_DIR_NAMES]
+
+    def _wc_template(self, dir_name: str) -> WorkloadClusterTemplate:
+        with open(
+            os.path.join(self._org_dir, WORKLOAD_CLUSTERS_DIR_NAME, f"{dir_name}.yaml")
+        ) as f:
+            kustomization = yaml.safe_load(f)
+        cluster_name = kustomization["spec"]["postBuild"]["substitute"]["cluster_name"]
+        return WorkloadClusterTemplate(dir_name, cluster_name)
+
+    def _generate_mc(self, out_dir: str, mc_id: str, size: RepoSize) -> None:
+        mc_dir_name = mc_id.upper().replace("-", "_")
+        replacements = [(TEMPLATE_MC_DIR_NAME, mc_dir_name), (TEMPLATE_MC_ID, mc_id)]
+        mc_out_dir = os.path.join(out_dir, GITOPS_TOP_DIR_NAME, mc_dir_name)
+        # everything but the organizations, which are generated separately
+        for entry in os.listdir(self._mc_dir):
+            src = os.path.join(self._mc_dir, entry)
+            if entry == "organizations":
+                continue
+            if os.path.isdir(src):
+                _copy_tree(src, os.path.join(mc_out_dir, entry), replacements)
+            else:
+                _copy_file(src, os.path.join(mc_out_dir, entry), replacements)
+        for org in range(1, size.organizations + 1):
+            self._generate_org(
+                out_dir, mc_out_dir, f"{mc_id}-org{org}", replacements, size
+            )
+
+    def _generate_org(
+        self,
+        out_dir: str,
+        mc_out_dir: str,
+        org_id: str,
+        mc_replacements: list[tuple[str, str]],
+        size: RepoSize,
+    ) -> None:
+        org_dir_name = org_id.upper().replace("-", "_")
+        replacements = mc_replacements + [
+            (TEMPLATE_ORG_DIR_NAME, org_dir_name),
+            (TEMPLATE_ORG_ID, org_id),
+        ]
+        org_out_dir = os.path.join(mc_out_dir, "organizations", org_dir_name)
+        _copy_file(
+            os.path.join(self._org_dir, f"{TEMPLATE_ORG_DIR_NAME}.yaml"),
+            os.path.join(org_out_dir, f"{TEMPLATE_ORG_DIR_NAME}.yaml"),
+            replacements,
+        )
+        wc_files = []
+        for wc in range(1, size.workload_clusters + 1):
+            template = self._wc_templates[(wc - 1) % len(self._wc_templates)]
+            cluster_name = f"{org_id}-wc{wc}"
+            wc_dir_name = cluster_name.upper().replace("-", "_")
+            wc_replacements = replacements + [
+                (template.dir_name, wc_dir_name),
+                (template.cluster_name, cluster_name),
+            ]
+            src = os.path.join(self._org_dir, WORKLOAD_CLUSTERS_DIR_NAME)
+            dst = os.path.join(org_out_dir, WORKLOAD_CLUSTERS_DIR_NAME)
+            _copy_file(
+                os.path.join(src, f"{template.dir_name}.yaml"),
+                os.path.join(dst, f"{template.dir_name}.yaml"),
+                wc_replacements,
+            )
+            _copy_tree(
+                os.path.join(src, template.dir_name),
+                os.path.join(dst, wc_dir_name),
+                wc_replacements,
+            )
+            assertions_dir = os.path.join(
+                self._source_root, WC_ASSERTIONS_DIR, template.cluster_name
+            )
+            if os.path.isdir(assertions_dir):
+                _copy_tree(
+                    assertions_dir,
+                    os.path.join(out_dir, WC_ASSERTIONS_DIR, cluster_name),
+                    wc_replacements,
+                )
+            wc_files.append(f"{wc_dir_name}.yaml")
+        self._write_wc_kustomization(org_out_dir, wc_files)
+
+    def _write_wc_kustomization(self, org_out_dir: str, wc_files: list[str]) -> None:
+        with open(
+            os.path.join(
+                self._org_dir, WORKLOAD_CLUSTERS_DIR_NAME, "kustomization.yaml"
+            )
+        ) as f:
+            kustomization = yaml.safe_load(f)
+        kustomization["resources"] = wc_files
+        with open(
+            os.path.join(org_out_dir, WORKLOAD_CLUSTERS_DIR_NAME, "kustomization.yaml"),
+            "w",
+        ) as f:
+            yaml.safe_dump(kustomization, f, sort_keys=False)
+
+    def generate(self, out_dir: str, size: RepoSize) -> None:
+        if os.path.exists(out_dir) and os.listdir(out_dir):
+            msg = f"Output directory '{out_dir}' has to be empty."
+            logger.error(msg)
+            raise Exception(msg)
+        shutil.copytree(
+            os.path.join(self._source_root, BASES_DIR_NAME),
+            os.path.join(out_dir, BASES_DIR_NAME),
+            dirs_exist_ok=True,
+        )
+        for mc in range(1, size.management_clusters + 1):
+            self._generate_mc(out_dir, f"mc{mc}", size)
+        # the tools have to be run from the root of a git repository
+        subprocess.run(  # nosec B603 B607 - fixed command
+            ["git", "init", "-q", out_dir], check=True
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Generates a repository with the layout of this one, in any size."
+    )
+    parser.add_argument("out_dir", help="empty directory to generate the repository in")
+    parser.add_argument(
+        "--size",
+        default="1x1x4",
+        help="NxMxK: N management clusters, M organizations per MC, K workload clusters per organization",
+    )
+    parser.add_argument(
+        "--root", default=GITOPS_REPO_ROOT, help="source repository root"
+    )
+    args = parser.parse_args()
+
+    SyntheticRepoGenerator(args.root).generate(args.out_dir, RepoSize.parse(args.size))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
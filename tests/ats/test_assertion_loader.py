@@ -0,0 +1,126 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+import assertion_loader
+from assertion_loader import (
+    ASSERTIONS_CACHE_FILE_NAME,
+    AssertionsCache,
+    load_assertions,
+)
+
+pytestmark = pytest.mark.offline
+
+CONFIG_MAP = """apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: first
+  namespace: default
+"""
+
+
+@pytest.fixture
+def parses(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    # the files parsed instead of taken from the cache
+    parsed: list[str] = []
+    parse = assertion_loader.parse_assertions
+
+    def counting_parse(file: str, content: bytes) -> list[dict]:
+        parsed.append(os.path.basename(file))
+        return parse(file, content)
+
+    monkeypatch.setattr(assertion_loader, "parse_assertions", counting_parse)
+    return parsed
+
+
+def _load(assertions_dir: Path, cache_dir: Path) -> dict[str, list[dict]]:
+    cache_dir.mkdir(exist_ok=True)
+    return load_assertions(str(assertions_dir), AssertionsCache(str(cache_dir)))
+
+
+def _cached_files(cache_dir: Path) -> list[str]:
+    with open(cache_dir / ASSERTIONS_CACHE_FILE_NAME) as f:
+        return sorted(os.path.basename(p) for p in json.load(f)["entries"])
+
+
+def _touch(path: Path) -> None:
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_cache_hit(tmp_path: Path, parses: list[str]) -> None:
+    (tmp_path / "a.yaml").write_text(CONFIG_MAP)
+    (tmp_path / "README.md").write_text("not an assertion")
+    first = _load(tmp_path, tmp_path / "cache")
+    assert parses == ["a.yaml"]
+    assert _load(tmp_path, tmp_path / "cache") == first
+    assert parses == ["a.yaml"]
+    # a new mtime with the same content only needs hashing
+    _touch(tmp_path / "a.yaml")
+    assert _load(tmp_path, tmp_path / "cache") == first
+    assert parses == ["a.yaml"]
+
+
+def test_changed_content(tmp_path: Path, parses: list[str]) -> None:
+    path = tmp_path / "a.yaml"
+    path.write_text(CONFIG_MAP)
+    _load(tmp_path, tmp_path / "cache")
+    path.write_text(CONFIG_MAP.replace("first", "second"))
+    _touch(path)
+    [assertion] = _load(tmp_path, tmp_path / "cache")[str(path)]
+    assert assertion["metadata"]["name"] == "second"
+    assert parses == ["a.yaml", "a.yaml"]
+
+
+@pytest.mark.parametrize(
+    "extra",
+    [
+        "data:\n  1: one\n",
+        "data:\n  true: yes\n",
+        "data:\n  date: 2024-01-01\n",
+    ],
+)
+def test_not_round_tripping_files_arent_cached(
+    tmp_path: Path, parses: list[str], extra: str
+) -> None:
+    (tmp_path / "a.yaml").write_text(CONFIG_MAP + extra)
+    (tmp_path / "b.yaml").write_text(CONFIG_MAP)
+    first = _load(tmp_path, tmp_path / "cache")
+    assert _cached_files(tmp_path / "cache") == ["b.yaml"]
+    # and they are parsed again every time, exactly like the first time
+    assert _load(tmp_path, tmp_path / "cache") == first
+    assert parses == ["a.yaml", "b.yaml", "a.yaml"]
+
+
+@pytest.mark.parametrize(
+    "content,error",
+    [
+        ("kind: ConfigMap\n", "'metadata' and 'kind' properties"),
+        ("- a\n", "'metadata' and 'kind' properties"),
+        ("kind: ConfigMap\nmetadata:\n  namespace: default\n", "'name' property"),
+    ],
+)
+def test_validation_errors(tmp_path: Path, content: str, error: str) -> None:
+    (tmp_path / "a.yaml").write_text(CONFIG_MAP + "---\n" + content)
+    with pytest.raises(Exception, match=error):
+        _load(tmp_path, tmp_path / "cache")
+
+
+def test_prune(tmp_path: Path) -> None:
+    assertions_dir = tmp_path / "assertions"
+    other_dir = tmp_path / "other"
+    for directory in (assertions_dir, other_dir):
+        directory.mkdir()
+        (directory / "a.yaml").write_text(CONFIG_MAP)
+        (directory / "b.yaml").write_text(CONFIG_MAP)
+    cache_dir = tmp_path / "cache"
+    _load(assertions_dir, cache_dir)
+    _load(other_dir, cache_dir)
+    assert _cached_files(cache_dir) == ["a.yaml", "a.yaml", "b.yaml", "b.yaml"]
+    (assertions_dir / "b.yaml").rename(assertions_dir / "c.yaml")
+    (other_dir / "a.yaml").unlink()
+    # entries of the files still in other directories are kept
+    _load(assertions_dir, cache_dir)
+    assert _cached_files(cache_dir) == ["a.yaml", "b.yaml", "c.yaml"]
@@ -0,0 +1,106 @@
+from typing import Any, Iterator
+
+import pytest
+
+from bootstrap import BootstrapScheduler, BootstrapStep
+
+pytestmark = pytest.mark.offline
+
+
+def _step(
+    name: str, events: list[str], *requires: str, fail: bool = False
+) -> BootstrapStep:
+    def setup() -> Iterator[Any]:
+        events.append(f"setup {name}")
+        if fail:
+            raise Exception(f"{name} failed")
+        yield name.upper()
+        events.append(f"teardown {name}")
+
+    return BootstrapStep(name, setup, requires)
+
+
+def _steps(events: list[str], fail: str = "") -> list[BootstrapStep]:
+    # crds <- capi, app-platform <- flux-app
+    return [
+        _step("crds", events),
+        _step("capi", events, "crds", fail=fail == "capi"),
+        _step("app-platform", events, fail=fail == "app-platform"),
+        _step("flux-app", events, "app-platform", "crds"),
+    ]
+
+
+def test_results_and_order() -> None:
+    events: list[str] = []
+    scheduler = BootstrapScheduler(_steps(events))
+    assert scheduler.run() == {
+        "crds": "CRDS",
+        "capi": "CAPI",
+        "app-platform": "APP-PLATFORM",
+        "flux-app": "FLUX-APP",
+    }
+    assert events.index("setup crds") < events.index("setup capi")
+    assert events.index("setup app-platform") < events.index("setup flux-app")
+    assert events.index("setup crds") < events.index("setup flux-app")
+
+
+def test_teardown_in_reverse_order() -> None:
+    events: list[str] = []
+    steps = _steps(events)
+    scheduler = BootstrapScheduler(steps)
+    scheduler.run()
+    events.clear()
+    scheduler.teardown()
+    assert sorted(events) == sorted(f"teardown {s.name}" for s in steps)
+    # a step is torn down before the steps it requires
+    for step in steps:
+        for required in step.requires:
+            assert events.index(f"teardown {step.name}") < events.index(
+                f"teardown {required}"
+            )
+    # and only once
+    scheduler.teardown()
+    assert len(events) == len(steps)
+
+
+def test_failure_tears_down_the_steps_done() -> None:
+    events: list[str] = []
+    scheduler = BootstrapScheduler(_steps(events, fail="app-platform"))
+    with pytest.raises(Exception, match="app-platform"):
+        scheduler.run()
+    # 'flux-app' requires the failed step and never starts
+    assert "setup flux-app" not in events
+    torn_down = {e.split()[1] for e in events if e.startswith("teardown")}
+    set_up = {e.split()[1] for e in events if e.startswith("setup")}
+    assert torn_down == set_up - {"app-platform"}
+
+
+@pytest.mark.parametrize(
+    "requires",
+    [
+        {"a": ("b",), "b": ("a",)},
+        {"a": ("b",), "b": ("c",), "c": ("a",)},
+        {"a": ("a",)},
+    ],
+)
+def test_cycle(requires: dict[str, tuple[str, ...]]) -> None:
+    events: list[str] = []
+    steps = [_step(name, events, *deps) for name, deps in requires.items()]
+    with pytest.raises(Exception, match="dependency cycle"):
+        BootstrapScheduler(steps)
+
+
+def test_unknown_step() -> None:
+    with pytest.raises(Exception, match="unknown steps"):
+        BootstrapScheduler([_step("a", [], "missing")])
+
+
+def test_step_yielding_twice() -> None:
+    def setup() -> Iterator[Any]:
+        yield 1
+        yield 2
+
+    scheduler = BootstrapScheduler([BootstrapStep("twice", setup)])
+    scheduler.run()
+    with pytest.raises(Exception, match="twice"):
+        scheduler.teardown()
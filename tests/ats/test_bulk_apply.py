@@ -0,0 +1,89 @@
+from typing import Any, Optional, Type, cast
+
+import pykube
+import pytest
+from pykube.objects import APIObject
+
+import bulk_apply
+from bulk_apply import BulkApplier
+from rest_mapper import RestMapper
+
+pytestmark = pytest.mark.offline
+
+CONFIG_MAP = {
+    "apiVersion": "v1",
+    "kind": "ConfigMap",
+    "metadata": {"name": "stuck", "namespace": "default"},
+}
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, body: Optional[dict] = None) -> None:
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = ""
+        self._body = body
+
+    def json(self) -> Optional[dict]:
+        return self._body
+
+
+class FakeClient:
+    # the object is deleted, but stays around with a finalizer for 'terminating' polls
+    def __init__(self, terminating: int) -> None:
+        self.terminating = terminating
+        self.patches: list[Any] = []
+
+    def delete(self, **_: Any) -> FakeResponse:
+        return FakeResponse(200)
+
+    def get(self, **_: Any) -> FakeResponse:
+        if self.terminating == 0:
+            return FakeResponse(404)
+        self.terminating -= 1
+        metadata = {
+            "name": "stuck",
+            "namespace": "default",
+            "finalizers": ["example.com/cleanup"],
+        }
+        return FakeResponse(200, {**CONFIG_MAP, "metadata": metadata})
+
+    def patch(self, **kwargs: Any) -> FakeResponse:
+        self.patches.append(kwargs)
+        return FakeResponse(200)
+
+    def raise_for_status(self, resp: FakeResponse) -> None:
+        pass
+
+
+class StaticRestMapper(RestMapper):
+    def __init__(self) -> None:
+        pass
+
+    def api_object_class(self, api_version: str, kind: str) -> Type[APIObject]:
+        return pykube.ConfigMap
+
+
+def _applier(client: FakeClient) -> BulkApplier:
+    return BulkApplier(cast(pykube.HTTPClient, client), StaticRestMapper(), 2)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(bulk_apply.time, "sleep", lambda _: None)
+
+
+def test_delete_waits_for_finalizers() -> None:
+    client = FakeClient(terminating=3)
+    _applier(client).delete([CONFIG_MAP], timeout_sec=60)
+    assert client.patches == []
+
+
+def test_stuck_object_is_reported_with_its_finalizers() -> None:
+    client = FakeClient(terminating=1000)
+    with pytest.raises(Exception) as err:
+        _applier(client).delete([CONFIG_MAP], timeout_sec=0)
+    assert "ConfigMap 'default/stuck': still terminating" in str(err.value)
+    assert "example.com/cleanup" in str(err.value)
+    # the finalizers are left alone
+    assert client.patches == []
@@ -0,0 +1,123 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from dependency_graph import DependencyGraph
+from kustomization_index import KustomizationIndex
+
+pytestmark = pytest.mark.offline
+
+FILES = {
+    "management-clusters/mc/mc.yaml": """
+apiVersion: kustomize.toolkit.fluxcd.io/v1
+kind: Kustomization
+metadata:
+  name: overlay
+  namespace: default
+spec:
+  path: ./management-clusters/mc/overlay
+  postBuild:
+    substituteFrom:
+      - kind: ConfigMap
+        name: vars
+---
+apiVersion: kustomize.toolkit.fluxcd.io/v1
+kind: Kustomization
+metadata:
+  name: generated
+  namespace: default
+spec:
+  path: ./management-clusters/mc/generated
+---
+apiVersion: kustomize.toolkit.fluxcd.io/v1
+kind: Kustomization
+metadata:
+  name: dangling
+  namespace: default
+spec:
+  path: ./management-clusters/mc/missing
+""",
+    "management-clusters/mc/vars.yaml": """
+apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: vars
+  namespace: default
+data:
+  cluster: mc
+""",
+    "management-clusters/mc/overlay/kustomization.yaml": """
+resources:
+  - ../../../bases/app
+patches:
+  - path: patch.yaml
+""",
+    "management-clusters/mc/overlay/patch.yaml": "kind: ConfigMap\n",
+    "bases/app/kustomization.yaml": "resources:\n  - configmap.yaml\n",
+    "bases/app/configmap.yaml": "kind: ConfigMap\n",
+    "management-clusters/mc/generated/a.yaml": "kind: ConfigMap\n",
+    "management-clusters/mc/generated/sub/b.yaml": "kind: ConfigMap\n",
+}
+
+
+@pytest.fixture
+def graph(tmp_path: Path) -> DependencyGraph:
+    for file, content in FILES.items():
+        path = tmp_path / file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    index = KustomizationIndex(str(tmp_path), cache_dir=str(tmp_path)).load()
+    return DependencyGraph(str(tmp_path), index).build()
+
+
+def _affected(graph: DependencyGraph, *files: str) -> list[str]:
+    return [k.name for k in graph.affected(files)]
+
+
+def test_inputs(graph: DependencyGraph) -> None:
+    assert graph.inputs[("default", "overlay")] == {
+        os.path.normpath(f)
+        for f in [
+            "management-clusters/mc/mc.yaml",
+            "management-clusters/mc/vars.yaml",
+            "management-clusters/mc/overlay/kustomization.yaml",
+            "management-clusters/mc/overlay/patch.yaml",
+            "bases/app/kustomization.yaml",
+            "bases/app/configmap.yaml",
+        ]
+    }
+
+
+def test_missing_path(graph: DependencyGraph) -> None:
+    assert graph.inputs[("default", "dangling")] == {
+        os.path.normpath("management-clusters/mc/mc.yaml")
+    }
+    assert "kustomization path not found" in graph.errors[("default", "dangling")]
+    assert list(graph.errors) == [("default", "dangling")]
+
+
+@pytest.mark.parametrize(
+    "files,affected",
+    [
+        (["bases/app/configmap.yaml"], ["overlay"]),
+        (["management-clusters/mc/overlay/patch.yaml"], ["overlay"]),
+        # only the values of 'substituteFrom' changed
+        (["management-clusters/mc/vars.yaml"], ["overlay"]),
+        (["management-clusters/mc/mc.yaml"], ["overlay", "generated", "dangling"]),
+        # the path of a Kustomization that doesn't exist starts to
+        (["management-clusters/mc/missing/a.yaml"], ["dangling"]),
+        (["management-clusters/mc/generated/sub/b.yaml"], ["generated"]),
+        # new and deleted files in a directory the kustomization.yaml is generated from
+        (["management-clusters/mc/generated/c.yaml"], ["generated"]),
+        (["management-clusters/mc/generated/gone/d.yaml"], ["generated"]),
+        (["bases/other/configmap.yaml", "README.md"], []),
+    ],
+)
+def test_affected(
+    graph: DependencyGraph, files: list[str], affected: list[str]
+) -> None:
+    assert _affected(graph, *files) == affected
+    assert graph.knows(files[0]) == (
+        os.path.normpath(files[0]) in FILES and bool(affected)
+    )
@@ -1,21 +1,31 @@
 import logging
 import os.path
-import time
-from typing import Type, TypeVar, Iterator, Union
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Type, TypeVar, Union
 
 import pykube
 import pytest
-import yaml
 from deepdiff import DeepDiff
-from deepdiff.helper import NotPresent
-from pykube.objects import APIObject
 from pytest_helm_charts.clusters import Cluster
 from pytest_helm_charts.flux.helm_release import HelmReleaseCR
 from pytest_helm_charts.flux.kustomization import KustomizationCR
-from pytest_helm_charts.flux.utils import NamespacedFluxCR, flux_cr_ready
-from pytest_helm_charts.utils import wait_for_objects_condition
+from pytest_helm_charts.flux.utils import NamespacedFluxCR
 
+from assertion_loader import load_assertions
 from conftest import GitOpsTestConfig
+from flux_readiness import wait_for_flux_objects_ready
+from object_fetcher import (
+    ObjectGroup,
+    fetch_object_group,
+    format_object_name,
+    missing_objects_message,
+    object_key,
+)
+from rendered_objects import RenderedObjects
+from rest_mapper import RestMapper
+from subset_match import is_subset
+from tracing import STEP_CATEGORY, tracer
 
 TFNS = TypeVar("TFNS", bound=NamespacedFluxCR)
 
@@ -32,31 +42,13 @@ def check_flux_objects_successful(
     obj_type: Type[TFNS],
     ignored_objects: Union[list[str], None] = None,
 ) -> None:
-    namespaces = pykube.Namespace.objects(kube_cluster.kube_client).all()
-    for ns in namespaces:
-        objects = (
-            obj_type.objects(kube_cluster.kube_client).filter(namespace=ns.name).all()
-        )
-        if not objects.response["items"]:
-            continue
-        if not ignored_objects:
-            ignored_objects = []
-        obj_names = [o.name for o in objects if f"{ns}/{o.name}" not in ignored_objects]
-        if not obj_names:
-            continue
-        logger.debug(
-            f"Waiting max {FLUX_OBJECTS_READY_TIMEOUT_SEC} s for the following {obj_type.__name__} objects "
-            f"to be ready in '{ns.name}' namespace: '{obj_names}'."
-        )
-        wait_for_objects_condition(
-            kube_cluster.kube_client,
-            obj_type,
-            obj_names,
-            ns.name,
-            flux_cr_ready,
-            FLUX_OBJECTS_READY_TIMEOUT_SEC,
-            missing_ok=False,
-        )
+    ready = wait_for_flux_objects_ready(
+        kube_cluster.kube_client,
+        obj_type,
+        FLUX_OBJECTS_READY_TIMEOUT_SEC,
+        ignored_objects,
+    )
+    logger.debug(f"All {len(ready)} {obj_type.__name__} objects are ready.")
 
 
 @pytest.fixture(scope="module")
@@ -88,131 +80,148 @@ def test_helm_release_successful(check_helm_release_successful: None) -> None:
 
 
 def test_positive_assertions(
-    kube_cluster: Cluster,
+    pooled_kube_client: pykube.HTTPClient,
+    rest_mapper: RestMapper,
+    gitops_test_config: GitOpsTestConfig,
     gitops_deployment: None,
     check_helm_release_successful: None,
     check_kustomizations_successful: None,
 ) -> None:
-    assertions = load_assertions()
+    with tracer.span("load assertions", STEP_CATEGORY):
+        assertions = load_assertions(EXISTS_ASSERTIONS_DIR)
+    groups: dict[ObjectGroup, list[tuple[str, dict]]] = defaultdict(list)
     for file, assert_list in assertions.items():
         # I'm out names for "assertion" :P
         for ass in assert_list:
-            if "metadata" not in ass or "kind" not in ass:
-                msg = f"Expected object declared in the '{file}' has to have the 'metadata' and 'kind' properties."
-                logger.error(msg)
-                raise Exception(msg)
-            if "name" not in ass["metadata"]:
-                msg = f"Expected object declared in the '{file}' has to have 'name' property in the 'metadata' section."
-                logger.error(msg)
-                raise Exception(msg)
-            if "namespace" in ass["metadata"]:
-                cluster_obj = pykube.objects.NamespacedAPIObject(
-                    kube_cluster.kube_client, ass
-                )
-                cluster_obj.obj["metadata"]["namespace"] = ass["metadata"]["namespace"]
-            else:
-                cluster_obj = pykube.objects.APIObject(kube_cluster.kube_client, ass)
-            setattr(cluster_obj, "kind", ass["kind"])
-            setattr(cluster_obj, "version", ass["apiVersion"])
-            endpoint = get_plural_from_kind(ass["kind"])
-            setattr(cluster_obj, "endpoint", endpoint)
-
-            reload_obj_from_cluster(cluster_obj)
-            assert_objects(ass, cluster_obj, file)
+            api_version, kind, namespace, _ = object_key(ass)
+            groups[(api_version, kind, namespace)].append((file, ass))
+
+    # groups are independent, so one slow object doesn't block checking all the others
+    with ThreadPoolExecutor(
+        max_workers=gitops_test_config.assertions_concurrency
+    ) as executor:
+        futures = [
+            executor.submit(
+                check_object_group, pooled_kube_client, rest_mapper, group, group_ass
+            )
+            for group, group_ass in groups.items()
+        ]
+        failures = [failure for f in futures for failure in f.result()]
+
+    if failures:
+        msg = (
+            f"{len(failures)} expected object(s) don't match the cluster state:\n"
+            + "\n".join(failures)
+        )
+        logger.error(msg)
+        pytest.fail(msg)
 
 
-def reload_obj_from_cluster(
-    cluster_obj: Union[pykube.objects.NamespacedAPIObject, pykube.objects.APIObject]
-) -> None:
-    retries = 0
-    obj_loaded = False
-    while retries < FLUX_MANAGED_OBJECTS_READY_TIMEOUT_SEC:
+@pytest.mark.dry
+def test_positive_assertions_rendered(rendered_objects: RenderedObjects) -> None:
+    # The same checks as 'test_positive_assertions', but against the rendered manifests. Objects that aren't
+    # rendered, like the ones created by controllers or the tests themselves, are left to the cluster run.
+    failures = []
+    not_rendered = []
+    for file, assert_list in load_assertions(EXISTS_ASSERTIONS_DIR).items():
+        for ass in assert_list:
+            _, kind, namespace, name = object_key(ass)
+            rendered_obj = rendered_objects.get(kind, namespace, name)
+            if rendered_obj is None:
+                not_rendered.append(
+                    f"{kind} '{format_object_name(namespace, name)}' from '{file}'"
+                )
+                continue
+            try:
+                assert_objects(ass, rendered_obj, file)
+            except (Exception, pytest.fail.Exception) as err:
+                failures.append(str(err))
+
+    if not_rendered:
+        logger.info(
+            f"{len(not_rendered)} expected object(s) aren't rendered and can only be checked in a cluster:\n"
+            + "\n".join(not_rendered)
+        )
+    if failures:
+        msg = (
+            f"{len(failures)} expected object(s) don't match the rendered manifests:\n"
+            + "\n".join(failures)
+        )
+        logger.error(msg)
+        pytest.fail(msg)
+
+
+def check_object_group(
+    kube_client: pykube.HTTPClient,
+    rest_mapper: RestMapper,
+    group: ObjectGroup,
+    expected: list[tuple[str, dict]],
+) -> list[str]:
+    # returns the failures instead of stopping at the first one, so all of them can be reported together
+    names = {ass["metadata"]["name"] for _, ass in expected}
+    try:
+        found = fetch_object_group(
+            kube_client,
+            rest_mapper,
+            group,
+            names,
+            FLUX_MANAGED_OBJECTS_READY_TIMEOUT_SEC,
+        )
+    except Exception as err:
+        return [str(err)]
+    failures = []
+    missing = names - found.keys()
+    if missing:
+        failures.append(
+            missing_objects_message(
+                group, missing, FLUX_MANAGED_OBJECTS_READY_TIMEOUT_SEC
+            )
+        )
+    for file, ass in expected:
+        if ass["metadata"]["name"] in missing:
+            continue
         try:
-            cluster_obj.reload()
-            obj_loaded = True
-            break
-        except pykube.http.HTTPError as err:
-            # we might need to wait a bit for flux to create all the managed objects
-            if err.code != 404:
-                raise
-            time.sleep(1)
-            retries += 1
-    if not obj_loaded:
-        meta = cluster_obj.obj["metadata"]
+            assert_objects(ass, found[ass["metadata"]["name"]].obj, file)
+        except (Exception, pytest.fail.Exception) as err:
+            failures.append(str(err))
+    return failures
+
+
+def _ignore_single_line_values(expected: Any, actual: Any) -> Any:
+    # Single line 'values' (like in Secrets' 'data') can't be known upfront when writing the expectations,
+    # so they are never compared.
+    if (
+        isinstance(expected, dict)
+        and isinstance(actual, dict)
+        and isinstance(expected.get("values"), str)
+        and isinstance(actual.get("values"), str)
+        and "\n" not in expected["values"]
+        and "\n" not in actual["values"]
+    ):
+        return {k: v for k, v in expected.items() if k != "values"}
+    return expected
+
+
+def assert_objects(ass: dict, actual_obj: dict, file: str) -> None:
+    for key in actual_obj.keys():
+        if key not in ass:
+            continue
+        # The only difference that we allow for is when the real object has some attributes that the
+        #  expectation doesn't have.
+        expected = _ignore_single_line_values(ass[key], actual_obj[key])
+        if is_subset(expected, actual_obj[key]):
+            continue
+        meta = actual_obj["metadata"]
         obj_name = (
             meta["namespace"] + "/" + meta["name"]
             if "namespace" in meta
             else meta["name"]
         )
-        raise Exception(
-            f"Timeout of {FLUX_MANAGED_OBJECTS_READY_TIMEOUT_SEC} sec reached while waiting "
-            + f"for object '{obj_name}' of kind '{cluster_obj.kind}'"
+        msg = (
+            f"Object '{obj_name}' of kind '{actual_obj['kind']}' is different than expectation in "
+            f"file '{file}'."
         )
-
-
-def load_assertions() -> dict[str, Iterator]:
-    assertions = {}
-    walk_dirs = os.walk(EXISTS_ASSERTIONS_DIR)
-    for (dir_path, _, filenames) in walk_dirs:
-        for file in filenames:
-            rel_path = str(os.path.join(dir_path, file))
-            if os.path.splitext(file)[1] != ".yaml":
-                logger.debug(
-                    f"Ignoring file '{rel_path}' in '{EXISTS_ASSERTIONS_DIR}' as it's not a file or it"
-                    f" doesn't have a '.yaml' extension."
-                )
-                continue
-            with open(rel_path) as f:
-                from_file_assertions = yaml.safe_load_all(f.read())
-                assertions[rel_path] = from_file_assertions
-    return assertions
-
-
-def get_plural_from_kind(kind: str) -> str:
-    if kind[-1] == "s":
-        endpoint = kind.lower() + "es"
-    elif kind[-1] == "y":
-        endpoint = kind.lower()[:-1] + "ies"
-    else:
-        endpoint = kind.lower() + "s"
-    return endpoint
-
-
-def assert_objects(ass: dict, cluster_obj: APIObject, file: str) -> None:
-    top_level_keys = cluster_obj.obj.keys()
-    for key in top_level_keys:
-        if key not in ass:
-            continue
-        diff = DeepDiff(ass[key], cluster_obj.obj[key], ignore_order=True)
-        # we have no difference between the expectation and the real object
-        if len(diff) == 0:
-            continue
-        # Check if 'diff' exists in the values_changed otherwise it is an empty space
-        if "values_changed" in diff:
-            vc = diff["values_changed"]
-            if "root['values']" in vc:
-                rv = vc["root['values']"]
-                if "diff" not in rv:
-                    continue
-        # The only difference that we allow for is when the real object has some attributes that the
-        #  expectation doesn't have. This means that if a diff of a kind different from 'dictionary_item_added'
-        #  is detected, it's an error.
-        if len(diff) > 1 or "dictionary_item_added" not in diff.tree:
-            meta = cluster_obj.obj["metadata"]
-            obj_name = (
-                meta["namespace"] + "/" + meta["name"]
-                if "namespace" in meta
-                else meta["name"]
-            )
-            msg = (
-                f"Object '{obj_name}' of kind '{cluster_obj.obj['kind']}' is different than expectation in "
-                f"file '{file}'."
-            )
-            logger.error(msg)
-            logger.error(diff)
-            pytest.fail(msg)
-        # Even if we only have 'dictionary_item_added', it has to show that added stuff is only on the
-        #  real object side. In other words, we check that all the attributes given in the expectation
-        # are present in the real object.
-        for d in diff.tree["dictionary_item_added"].items:
-            assert isinstance(d.t1, NotPresent)
+        logger.error(msg)
+        # DeepDiff is slow on big objects, so we use it only to show what's different
+        logger.error(DeepDiff(expected, actual_obj[key], ignore_order=True))
+        pytest.fail(msg)
@@ -0,0 +1,150 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+import kustomization_index
+from kustomization_index import KustomizationIndex, main
+
+pytestmark = pytest.mark.offline
+
+FILES = {
+    "management-clusters/mc/mc.yaml": """apiVersion: kustomize.toolkit.fluxcd.io/v1
+kind: Kustomization
+metadata:
+  name: mc
+  namespace: default
+spec:
+  path: ./management-clusters/mc
+---
+apiVersion: source.toolkit.fluxcd.io/v1
+kind: GitRepository
+metadata:
+  name: repo
+  namespace: default
+---
+apiVersion: "kustomize.toolkit.fluxcd.io/v1beta2"
+kind: Kustomization
+metadata:
+  name: no-namespace
+spec:
+  path: ./bases/app
+""",
+    "management-clusters/mc/kustomization.yaml": """apiVersion: kustomize.config.k8s.io/v1beta1
+kind: Kustomization
+resources:
+  - mc.yaml
+""",
+    "management-clusters/mc/apps/release.yaml": """apiVersion: helm.toolkit.fluxcd.io/v2
+kind: HelmRelease
+metadata:
+  name: release
+  namespace: default
+""",
+    "management-clusters/mc/apps/apps.yaml": """apiVersion: kustomize.toolkit.fluxcd.io/v1
+kind: Kustomization
+metadata:
+  name: apps
+  namespace: org-a
+spec:
+  path: ./management-clusters/mc/apps
+""",
+    "management-clusters/mc/apps/notes.txt": "apiVersion: kustomize.toolkit.fluxcd.io/v1\n",
+    "management-clusters/mc/broken.yaml": "apiVersion: kustomize.toolkit.fluxcd.io/v1\n: [\n",
+    "bases/app/ks.yaml": """apiVersion: kustomize.toolkit.fluxcd.io/v1
+kind: Kustomization
+metadata:
+  name: outside
+""",
+}
+
+# what 'find' with 'yq' printed for the same files: '[filename,.metadata.name,.metadata.namespace,.spec.path,.kind]'
+# joined with ',', a missing namespace being empty
+CSV = """./management-clusters/mc/apps/apps.yaml,apps,org-a,./management-clusters/mc/apps,Kustomization
+./management-clusters/mc/mc.yaml,mc,default,./management-clusters/mc,Kustomization
+./management-clusters/mc/mc.yaml,no-namespace,,./bases/app,Kustomization
+"""
+
+
+@pytest.fixture
+def repo(tmp_path: Path) -> Path:
+    for file, content in FILES.items():
+        path = tmp_path / "repo" / file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    (tmp_path / "cache").mkdir()
+    return tmp_path / "repo"
+
+
+@pytest.fixture
+def parses(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    # the files read and parsed instead of taken from the index
+    parsed: list[str] = []
+    parse = kustomization_index.parse_kustomizations
+
+    def counting_parse(rel_path: str, content: bytes) -> list:
+        parsed.append(rel_path)
+        return parse(rel_path, content)
+
+    monkeypatch.setattr(kustomization_index, "parse_kustomizations", counting_parse)
+    return parsed
+
+
+def _load(repo: Path) -> KustomizationIndex:
+    return KustomizationIndex(str(repo), cache_dir=str(repo.parent / "cache")).load()
+
+
+def test_csv(
+    repo: Path,
+    capsys: pytest.CaptureFixture,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.chdir(repo)
+    monkeypatch.setattr(
+        kustomization_index, "get_cache_dir", lambda _: str(repo.parent / "cache")
+    )
+    monkeypatch.setattr(sys, "argv", ["kustomization_index.py"])
+    assert main() == 0
+    assert capsys.readouterr().out == CSV
+
+
+def test_single_pass(repo: Path, parses: list[str]) -> None:
+    index = _load(repo)
+    assert sorted(k.name for k in index) == ["apps", "mc", "no-namespace"]
+    assert index.find("mc", "default")[0].path == "./management-clusters/mc"
+    assert [k.namespace for k in index.find("no-namespace")] == [""]
+    # every '.yaml' file is read once, the other files not at all
+    assert sorted(parses) == sorted(
+        f"./{f}"
+        for f in FILES
+        if f.startswith("management-clusters/") and f.endswith(".yaml")
+    )
+
+
+def test_invalidation(repo: Path, parses: list[str]) -> None:
+    _load(repo)
+    parses.clear()
+    assert len(_load(repo)) == 3
+    assert parses == []
+    apps = repo / "management-clusters/mc/apps/apps.yaml"
+    # a different size with the same mtime
+    stat = apps.stat()
+    apps.write_text(
+        FILES["management-clusters/mc/apps/apps.yaml"].replace("org-a", "org-ab")
+    )
+    os.utime(apps, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    # a different mtime with the same size
+    release = repo / "management-clusters/mc/apps/release.yaml"
+    os.utime(release, ns=(0, release.stat().st_mtime_ns + 1_000_000_000))
+    index = _load(repo)
+    assert sorted(parses) == [
+        "./management-clusters/mc/apps/apps.yaml",
+        "./management-clusters/mc/apps/release.yaml",
+    ]
+    assert [k.namespace for k in index.find("apps")] == ["org-ab"]
+    # removed files leave the index
+    (repo / "management-clusters/mc/mc.yaml").unlink()
+    parses.clear()
+    assert [k.name for k in _load(repo)] == ["apps"]
+    assert parses == []
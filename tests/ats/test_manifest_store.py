@@ -0,0 +1,125 @@
+from pathlib import Path
+
+import pytest
+import yaml
+
+from kustomization_index import FluxKustomization
+from manifest_store import (
+    INDEX_FILE_NAME,
+    MANIFESTS_FILE_NAME,
+    ManifestStore,
+    ManifestStoreWriter,
+    _kustomization_arg,
+)
+
+pytestmark = pytest.mark.offline
+
+APPS = FluxKustomization("./mc.yaml", "apps", "default", "./apps", {})
+CLUSTERS = FluxKustomization("./mc.yaml", "clusters", "org-a", "./clusters", {})
+NO_NAMESPACE = FluxKustomization("./mc.yaml", "no-namespace", "", "./other", {})
+
+APPS_MANIFESTS = """apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: first
+  namespace: default
+data:
+  text: "ünïcode"
+---
+# only a comment
+---
+apiVersion: v1
+kind: Namespace
+metadata:
+  name: org-a
+"""
+CLUSTERS_MANIFESTS = """apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: first
+  namespace: org-a
+data:
+  values: |
+    no: trailing newline"""
+
+
+def _write(store_dir: Path) -> None:
+    with ManifestStoreWriter(str(store_dir)) as writer:
+        writer.add(APPS, APPS_MANIFESTS)
+        writer.add(CLUSTERS, CLUSTERS_MANIFESTS)
+
+
+def test_offsets(tmp_path: Path) -> None:
+    _write(tmp_path)
+    content = (tmp_path / MANIFESTS_FILE_NAME).read_bytes()
+    with ManifestStore(str(tmp_path)) as store:
+        # the document that is only a comment isn't stored
+        assert len(store) == 3
+        for entry in store.entries:
+            document = content[entry.offset : entry.offset + entry.length]
+            # offsets are in bytes, not characters
+            assert document.decode() == store.read(entry)
+            assert content[entry.offset - 4 : entry.offset] == b"---\n"
+        last = store.entries[-1]
+        assert last.offset + last.length == len(content)
+    # the manifests file stays a valid YAML stream
+    assert [d["metadata"]["name"] for d in yaml.safe_load_all(content)] == [
+        "first",
+        "org-a",
+        "first",
+    ]
+
+
+def test_find_and_get(tmp_path: Path) -> None:
+    _write(tmp_path)
+    with ManifestStore(str(tmp_path)) as store:
+        assert [e.namespace for e in store.find(kind="ConfigMap")] == [
+            "default",
+            "org-a",
+        ]
+        assert [e.kind for e in store.find(kustomization=("apps", "default"))] == [
+            "ConfigMap",
+            "Namespace",
+        ]
+        assert list(store.find(kind="Secret")) == []
+        config_map = store.get("ConfigMap", "org-a", "first")
+        assert config_map is not None
+        # documents are stored ending with a newline
+        assert config_map["data"] == {"values": "no: trailing newline\n"}
+        assert store.get("ConfigMap", "default", "first") == yaml.safe_load(
+            APPS_MANIFESTS.split("---")[0]
+        )
+        assert store.get("Namespace", None, "org-a") is not None
+        assert store.get("Namespace", None, "missing") is None
+
+
+def test_failed_write_keeps_the_previous_store(tmp_path: Path) -> None:
+    _write(tmp_path)
+    index = (tmp_path / INDEX_FILE_NAME).read_bytes()
+    with pytest.raises(RuntimeError):
+        with ManifestStoreWriter(str(tmp_path)) as writer:
+            writer.add(APPS, "kind: ConfigMap\nmetadata:\n  name: other\n")
+            raise RuntimeError("render failed")
+    assert (tmp_path / INDEX_FILE_NAME).read_bytes() == index
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        INDEX_FILE_NAME,
+        MANIFESTS_FILE_NAME,
+    ]
+
+
+def test_empty_store(tmp_path: Path) -> None:
+    with ManifestStoreWriter(str(tmp_path)):
+        pass
+    with ManifestStore(str(tmp_path)) as store:
+        assert len(store) == 0
+        assert list(store.find()) == []
+
+
+def test_kustomization_without_namespace(tmp_path: Path) -> None:
+    with ManifestStoreWriter(str(tmp_path)) as writer:
+        writer.add(NO_NAMESPACE, "kind: ConfigMap\nmetadata:\n  name: other\n")
+    with ManifestStore(str(tmp_path)) as store:
+        # selected like 'render.py --kustomization no-namespace' does
+        selected = _kustomization_arg("no-namespace")
+        assert [e.name for e in store.find(kustomization=selected)] == ["other"]
+        assert list(store.find(kustomization=_kustomization_arg("apps:default"))) == []
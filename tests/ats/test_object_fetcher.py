@@ -0,0 +1,84 @@
+from pathlib import Path
+from typing import Any, Iterator, Optional, Type, cast
+
+import pykube
+import pytest
+from pykube.exceptions import HTTPError
+from pykube.objects import APIObject
+
+import object_fetcher
+from object_fetcher import _list_objects, fetch_object_group
+from rest_mapper import RestMapper, RestMapping
+
+pytestmark = pytest.mark.offline
+
+GROUP = ("example.com/v1", "Example", "default")
+
+
+class LateRestMapper(RestMapper):
+    # serves the kind only after it was looked up 'served_after' times, like a CRD registered late by flux
+    def __init__(self, cache_dir: Path, served_after: Optional[int]) -> None:
+        super().__init__(cast(pykube.HTTPClient, None), str(cache_dir))
+        self.lookups = 0
+        self._served_after = served_after
+
+    def find(self, api_version: str, kind: str) -> Optional[RestMapping]:
+        self.lookups += 1
+        if self._served_after is None or self.lookups <= self._served_after:
+            return None
+        return RestMapping("examples", True)
+
+
+class FailingQuery:
+    def filter(self, **_: Any) -> "FailingQuery":
+        return self
+
+    def iterator(self) -> Iterator[APIObject]:
+        # what pykube raises for the 'Status' a kind that isn't served yet answers with
+        raise HTTPError(404, "the server could not find the requested resource")
+
+
+class FailingQueryObject(pykube.objects.NamespacedAPIObject):
+    version = "example.com/v1"
+    endpoint = "examples"
+    kind = "Example"
+
+    @classmethod
+    def objects(cls, *_: Any, **__: Any) -> Any:
+        return FailingQuery()
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(object_fetcher.time, "sleep", lambda _: None)
+
+
+def test_kind_served_late(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    rest_mapper = LateRestMapper(tmp_path, served_after=2)
+    listed: list[set[str]] = []
+
+    def list_objects(_: Any, obj_class: Type[APIObject], *args: Any) -> dict:
+        listed.append(set(args[1]))
+        return {name: obj_class for name in args[1]}
+
+    monkeypatch.setattr(object_fetcher, "_list_objects", list_objects)
+    found = fetch_object_group(None, rest_mapper, GROUP, {"a", "b"}, 60)
+    assert sorted(found) == ["a", "b"]
+    assert rest_mapper.lookups == 3
+    assert listed == [{"a", "b"}]
+
+
+def test_kind_never_served(tmp_path: Path) -> None:
+    rest_mapper = LateRestMapper(tmp_path, served_after=None)
+    with pytest.raises(Exception, match="doesn't serve objects of kind 'Example'"):
+        fetch_object_group(None, rest_mapper, GROUP, {"a"}, 0)
+
+
+def test_not_found_status() -> None:
+    # retried like missing objects
+    assert (
+        _list_objects(
+            cast(pykube.HTTPClient, None), FailingQueryObject, "default", {"a"}
+        )
+        == {}
+    )
@@ -0,0 +1,159 @@
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+import object_index
+from cache_dir import GITOPS_CACHE_DIR_ENV_VAR_NAME
+from kustomization_index import FluxKustomization
+from object_index import (
+    FLUX_NAME_LABEL,
+    ObjectId,
+    ObjectIndex,
+    _remove_worktree,
+    content_hash,
+)
+from render import Renderer, RenderResult
+
+pytestmark = pytest.mark.offline
+
+APPS = FluxKustomization("./mc.yaml", "apps", "default", "./apps", {})
+OTHER = FluxKustomization("./mc.yaml", "other", "default", "./other", {})
+
+
+def _config_map(name: str, value: str, namespace: str = "default") -> str:
+    return f"""apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: {name}
+  namespace: {namespace}
+data:
+  value: {value}
+"""
+
+
+def _index(*renders: tuple[FluxKustomization, list[str]]) -> ObjectIndex:
+    return ObjectIndex.build(
+        RenderResult(k, "---\n".join(documents), "") for k, documents in renders
+    )
+
+
+def _id(name: str) -> ObjectId:
+    return ObjectId("", "ConfigMap", "default", name)
+
+
+def test_object_id() -> None:
+    index = _index(
+        (
+            APPS,
+            [
+                "apiVersion: apps/v1\nkind: Deployment\nmetadata:\n  name: a\n  namespace: ns\n",
+                "apiVersion: v1\nkind: Namespace\nmetadata:\n  name: ns\n",
+                "# not an object\n",
+            ],
+        )
+    )
+    assert sorted(index.objects) == [
+        ObjectId("", "Namespace", "", "ns"),
+        ObjectId("apps", "Deployment", "ns", "a"),
+    ]
+
+
+def test_collisions() -> None:
+    index = _index(
+        (APPS, [_config_map("same", "1"), _config_map("different", "1")]),
+        (OTHER, [_config_map("same", "1"), _config_map("different", "2")]),
+    )
+    assert [(c.object_id, c.conflicting) for c in index.collisions()] == [
+        (_id("different"), True),
+        (_id("same"), False),
+    ]
+    assert index.collisions()[0].kustomizations == ["default/apps", "default/other"]
+
+
+def test_no_collisions_in_other_namespaces() -> None:
+    index = _index(
+        (APPS, [_config_map("a", "1")]),
+        (OTHER, [_config_map("a", "1", namespace="other")]),
+    )
+    assert index.collisions() == []
+
+
+def test_diff() -> None:
+    base = _index(
+        (APPS, [_config_map("removed", "1"), _config_map("changed", "1")]),
+        (OTHER, [_config_map("moved", "1"), _config_map("same", "1")]),
+    )
+    head = _index(
+        (APPS, [_config_map("changed", "2"), _config_map("moved", "1")]),
+        (OTHER, [_config_map("added", "1"), _config_map("same", "1")]),
+    )
+    assert [
+        (c.change, c.object_id.name, c.kustomizations) for c in base.diff(head)
+    ] == [
+        ("added", "added", ["default/other"]),
+        ("changed", "changed", ["default/apps"]),
+        ("moved", "moved", ["default/apps"]),
+        ("removed", "removed", ["default/apps"]),
+    ]
+    assert head.diff(head) == []
+
+
+def test_content_hash_ignores_flux_labels() -> None:
+    obj = {"kind": "ConfigMap", "metadata": {"name": "a"}}
+    labelled: dict = {
+        "kind": "ConfigMap",
+        "metadata": {"name": "a", "labels": {FLUX_NAME_LABEL: "apps"}},
+    }
+    assert content_hash(obj) == content_hash(labelled)
+    assert labelled["metadata"]["labels"] == {FLUX_NAME_LABEL: "apps"}
+    other = {"kind": "ConfigMap", "metadata": {"name": "a", "labels": {"a": "b"}}}
+    assert content_hash(obj) != content_hash(other)
+
+
+def test_save_and_load(tmp_path: Path) -> None:
+    index = _index((APPS, [_config_map("a", "1")]), (OTHER, [_config_map("a", "2")]))
+    path = str(tmp_path / "index.json")
+    index.save(path)
+    loaded = ObjectIndex.load(path)
+    assert loaded.revision == index.revision
+    assert loaded.objects == index.objects
+    assert loaded.diff(index) == []
+
+
+def test_render_errors() -> None:
+    results = [
+        RenderResult(APPS, _config_map("a", "1"), ""),
+        RenderResult(OTHER, "", "kustomize failed"),
+    ]
+    with pytest.raises(Exception, match="'default/other': kustomize failed"):
+        ObjectIndex.build(results)
+
+
+def test_worktree_cleanup_failure_is_logged(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    # in a 'finally', raising would hide the error that got there
+    _remove_worktree(str(tmp_path), str(tmp_path / "missing"))
+    assert "Cleaning up the worktree" in caplog.text
+
+
+class StreamingRenderer(Renderer):
+    # yields a render per Kustomization instead of running kustomize
+    def render_iter(
+        self, kustomizations: list[FluxKustomization], sub_path: str = ""
+    ) -> Iterator[RenderResult]:
+        for k in kustomizations:
+            yield RenderResult(k, _config_map(k.name, "1"), "")
+
+    def render_all(
+        self, kustomizations: list[FluxKustomization], sub_path: str = ""
+    ) -> list[RenderResult]:
+        raise AssertionError("renders are indexed as they come")
+
+
+def test_render_streams(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(GITOPS_CACHE_DIR_ENV_VAR_NAME, str(tmp_path))
+    monkeypatch.setattr(object_index, "Renderer", StreamingRenderer)
+    index = ObjectIndex.render(kustomization_index=[APPS, OTHER])  # type: ignore[arg-type]
+    assert sorted(index.objects) == [_id("apps"), _id("other")]
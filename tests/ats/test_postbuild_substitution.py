@@ -0,0 +1,100 @@
+import base64
+import os
+from pathlib import Path
+
+import pytest
+
+from kustomization_index import FluxKustomization
+from postbuild_substitution import (
+    RepoValuesResolver,
+    Substitution,
+    compile_substitution,
+    read_documents,
+    split_documents,
+)
+
+pytestmark = pytest.mark.offline
+
+
+@pytest.mark.parametrize(
+    "document,result",
+    [
+        ("name: ${cluster}\n", "name: mc\n"),
+        ("name: ${missing}\n", "name: \n"),
+        ("name: ${cluster:=other}\n", "name: mc\n"),
+        ("name: ${missing:=other}\n", "name: other\n"),
+        ("name: ${empty:=other}\n", "name: other\n"),
+        ("name: ${empty=other}\n", "name: \n"),
+        ("name: ${missing:-other}\n", "name: other\n"),
+        ("name: ${missing-}\n", "name: \n"),
+        ("name: $${cluster}\n", "name: ${cluster}\n"),
+        ("name: $${cluster:=other}-${cluster}\n", "name: ${cluster:=other}-mc\n"),
+        ("name: $cluster {cluster}\n", "name: $cluster {cluster}\n"),
+    ],
+)
+def test_apply(document: str, result: str) -> None:
+    assert Substitution({"cluster": "mc", "empty": ""}).apply(document) == result
+
+
+@pytest.mark.parametrize(
+    "marker",
+    [
+        "kustomize.toolkit.fluxcd.io/substitute: disabled",
+        "kustomize.toolkit.fluxcd.io/substitute: 'disabled'",
+        'kustomize.toolkit.fluxcd.io/substitute: "disabled"',
+    ],
+)
+def test_disabled_marker(marker: str) -> None:
+    document = f"metadata:\n  annotations:\n    {marker}\ndata:\n  name: ${{cluster}}\n"
+    assert Substitution({"cluster": "mc"}).apply(document) == document
+
+
+def test_disabled_marker_applies_to_its_document_only() -> None:
+    documents = [
+        "metadata:\n  labels:\n    kustomize.toolkit.fluxcd.io/substitute: disabled\nname: ${cluster}\n",
+        "name: ${cluster}\n",
+    ]
+    assert list(Substitution({"cluster": "mc"}).stream(documents)) == [
+        documents[0],
+        "name: mc\n",
+    ]
+
+
+def test_split_and_read_documents() -> None:
+    manifests = "---\na: 1\n---\n\n--- \nb: 2\n"
+    assert split_documents(manifests) == ["\na: 1\n", "\nb: 2\n"]
+    assert list(read_documents(manifests.splitlines(keepends=True))) == [
+        "a: 1\n",
+        "b: 2\n",
+    ]
+
+
+def test_compile_substitution(tmp_path: Path) -> None:
+    values_dir = os.path.join(tmp_path, "bases")
+    os.makedirs(values_dir)
+    with open(os.path.join(values_dir, "values.yaml"), "w") as f:
+        f.write(
+            "apiVersion: v1\nkind: ConfigMap\nmetadata:\n  name: vars\n  namespace: default\n"
+            "data:\n  cluster: from-configmap\n  region: eu\n"
+            "---\napiVersion: v1\nkind: Secret\nmetadata:\n  name: vars\n  namespace: default\n"
+            f"data:\n  region: {base64.b64encode(b'us').decode()}\n"
+        )
+    kustomization = FluxKustomization(
+        "./bases/ks.yaml",
+        "ks",
+        "default",
+        "./bases",
+        {
+            "substituteFrom": [
+                {"kind": "ConfigMap", "name": "vars"},
+                {"kind": "Secret", "name": "vars"},
+                {"kind": "ConfigMap", "name": "missing", "optional": True},
+            ],
+            "substitute": {"cluster": "inline"},
+        },
+    )
+    substitution = compile_substitution(
+        kustomization, RepoValuesResolver(str(tmp_path), ["bases"])
+    )
+    # later 'substituteFrom' entries win, inline values win over all of them
+    assert substitution.variables == {"cluster": "inline", "region": "us"}
@@ -0,0 +1,133 @@
+import os
+from pathlib import Path
+from typing import Optional
+
+import pytest
+import yaml
+
+from kustomization_index import FluxKustomization
+from render import Renderer
+from sops_decrypt import SopsDecryptor
+
+pytestmark = pytest.mark.offline
+
+BUILD = """apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: ${cluster}
+data:
+  escaped: $${cluster}
+---
+apiVersion: v1
+kind: Secret
+metadata:
+  name: secret
+data:
+  value: ENC[AES256_GCM,data:abc,type:str]
+sops:
+  mac: secret-mac
+---
+apiVersion: v1
+kind: Secret
+metadata:
+  name: not-substituted
+  labels:
+    kustomize.toolkit.fluxcd.io/substitute: disabled
+data:
+  value: ENC[AES256_GCM,data:def,type:str]
+sops:
+  mac: not-substituted-mac
+"""
+
+
+class StaticDecryptor(SopsDecryptor):
+    # decrypted documents known in advance, instead of running sops
+    def __init__(self, documents: dict[str, dict]) -> None:
+        super().__init__()
+        self._documents = documents
+
+    def load(self) -> "SopsDecryptor":
+        return self
+
+
+class StaticRenderer(Renderer):
+    # every kustomize build renders BUILD
+    def _run(self, *args: str) -> str:
+        return "v5.0.0" if args[1] == "version" else BUILD
+
+
+def _render(tmp_path: Path, decryptor: Optional[SopsDecryptor]) -> list[dict]:
+    app_dir = tmp_path / "app"
+    app_dir.mkdir()
+    (app_dir / "kustomization.yaml").write_text("resources: []\n")
+    kustomization = FluxKustomization(
+        "./ks.yaml", "ks", "default", "./app", {"substitute": {"cluster": "mc"}}
+    )
+    renderer = StaticRenderer(
+        str(tmp_path), 1, resolver=lambda *_: None, decryptor=decryptor
+    )
+    [result] = renderer.render_all([kustomization])
+    assert result.error == ""
+    return list(yaml.safe_load_all(result.manifests))
+
+
+def test_substitution_without_decryption(tmp_path: Path) -> None:
+    config_map, secret, _ = _render(tmp_path, None)
+    assert config_map["metadata"]["name"] == "mc"
+    assert config_map["data"] == {"escaped": "${cluster}"}
+    assert "sops" in secret
+
+
+def test_escape_with_decryption(tmp_path: Path) -> None:
+    decryptor = StaticDecryptor(
+        {
+            "secret-mac": {"stringData": {"value": "${cluster}-$${cluster}"}},
+            "not-substituted-mac": {"stringData": {"value": "${cluster}"}},
+        }
+    )
+    config_map, secret, not_substituted = _render(tmp_path, decryptor)
+    # documents that aren't encrypted are substituted only once
+    assert config_map["metadata"]["name"] == "mc"
+    assert config_map["data"] == {"escaped": "${cluster}"}
+    # the decrypted values are substituted once too
+    assert "sops" not in secret
+    assert secret["stringData"] == {"value": "mc-${cluster}"}
+    assert not_substituted["stringData"] == {"value": "${cluster}"}
+
+
+class FailingRenderer(StaticRenderer):
+    def build(self, path: str) -> str:
+        if path.endswith("broken"):
+            raise Exception("kustomize failed")
+        return f"kind: ConfigMap\nmetadata:\n  name: {os.path.basename(path)}\n"
+
+
+def test_render_iter_keeps_the_order(tmp_path: Path) -> None:
+    names = [f"app-{i}" for i in range(10)] + ["broken", "app-0"]
+    for name in set(names):
+        (tmp_path / name).mkdir()
+        # directories with the same content are the same build
+        (tmp_path / name / f"{name}.yaml").write_text(f"name: {name}\n")
+    kustomizations = [
+        FluxKustomization("./ks.yaml", f"ks-{i}", "default", f"./{name}", {})
+        for i, name in enumerate(names)
+    ]
+    renderer = FailingRenderer(str(tmp_path), 2, resolver=lambda *_: None)
+    results = list(renderer.render_iter(kustomizations))
+    assert [r.kustomization for r in results] == kustomizations
+    assert [r.error for r in results] == [""] * 10 + ["kustomize failed", ""]
+    assert results[-1].manifests == results[0].manifests
+
+
+def test_missing_path_fails_only_its_kustomization(tmp_path: Path) -> None:
+    (tmp_path / "app").mkdir()
+    (tmp_path / "app" / "app.yaml").write_text("name: app\n")
+    kustomizations = [
+        FluxKustomization("./ks.yaml", "missing", "default", "./missing", {}),
+        FluxKustomization("./ks.yaml", "app", "default", "./app", {}),
+    ]
+    renderer = FailingRenderer(str(tmp_path), 2, resolver=lambda *_: None)
+    missing, app = renderer.render_all(kustomizations)
+    assert "kustomization path not found" in missing.error
+    assert app.error == ""
+    assert yaml.safe_load(app.manifests)["metadata"]["name"] == "app"
@@ -0,0 +1,55 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from render_cache import RenderCache, render_cache_key
+
+pytestmark = pytest.mark.offline
+
+
+def _fill(cache_dir: Path, max_bytes: int) -> tuple[RenderCache, list[str]]:
+    # four entries of 100 bytes, from the least to the most recently used
+    cache = RenderCache(str(cache_dir), max_bytes)
+    keys = [render_cache_key(str(i)) for i in range(4)]
+    for i, key in enumerate(keys):
+        cache.put(key, "x" * 100)
+        mtime = 1000 + i
+        os.utime(cache_dir / key[:2] / f"{key}.yaml", (mtime, mtime))
+    return cache, keys
+
+
+def test_key() -> None:
+    assert render_cache_key("a", "b") == render_cache_key("a", "b")
+    # parts are separated, moving a character from one to the next changes the key
+    assert render_cache_key("ab", "c") != render_cache_key("a", "bc")
+
+
+def test_get_and_put(tmp_path: Path) -> None:
+    cache = RenderCache(str(tmp_path), max_bytes=1024)
+    key = render_cache_key("a")
+    assert cache.get(key) is None
+    cache.put(key, "kind: ConfigMap\n")
+    assert cache.get(key) == "kind: ConfigMap\n"
+
+
+def test_prune_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache, keys = _fill(tmp_path, 250)
+    # a hit makes the oldest entry the most recently used one
+    assert cache.get(keys[0]) is not None
+    cache.prune()
+    assert [cache.get(k) is not None for k in keys] == [True, False, False, True]
+
+
+def test_prune_under_the_limit(tmp_path: Path) -> None:
+    cache, keys = _fill(tmp_path, 400)
+    cache.prune()
+    assert all(cache.get(k) is not None for k in keys)
+
+
+def test_prune_everything(tmp_path: Path) -> None:
+    cache = RenderCache(str(tmp_path), max_bytes=0)
+    key = render_cache_key("a")
+    cache.put(key, "kind: ConfigMap\n")
+    cache.prune()
+    assert cache.get(key) is None
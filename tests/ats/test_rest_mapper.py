@@ -0,0 +1,86 @@
+from pathlib import Path
+from typing import Any, Optional, cast
+
+import pykube
+import pytest
+from pykube.exceptions import HTTPError
+
+from rest_mapper import RestMapper, RestMapping
+
+pytestmark = pytest.mark.offline
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, body: dict) -> None:
+        self.status_code = status_code
+        self._body = body
+
+    def json(self) -> dict:
+        return self._body
+
+
+class FakeClient:
+    # answers the discovery requests from 'resources', by group version
+    def __init__(self) -> None:
+        self.crds: list[str] = []
+        self.resources: dict[str, Optional[list[dict]]] = {
+            "v1": [],
+            "example.com/v1": [],
+        }
+
+    def get(self, version: str, **kwargs: Any) -> FakeResponse:
+        if kwargs.get("base") == "/version":
+            return FakeResponse(200, {"gitVersion": "v1.30.0"})
+        if kwargs.get("url") == "customresourcedefinitions":
+            items = [{"metadata": {"name": crd}} for crd in self.crds]
+            return FakeResponse(200, {"items": items})
+        if version == "/apis":
+            return FakeResponse(
+                200, {"groups": [{"versions": [{"groupVersion": "example.com/v1"}]}]}
+            )
+        resources = self.resources[version]
+        if resources is None:
+            return FakeResponse(503, {})
+        return FakeResponse(200, {"resources": resources})
+
+    def raise_for_status(self, resp: FakeResponse) -> None:
+        if resp.status_code >= 400:
+            raise HTTPError(resp.status_code, "unavailable")
+
+
+def _resource(kind: str, name: str) -> dict:
+    return {"kind": kind, "name": name, "namespaced": True}
+
+
+def _mapper(client: FakeClient, cache_dir: Path) -> RestMapper:
+    return RestMapper(cast(pykube.HTTPClient, client), str(cache_dir))
+
+
+def test_crd_added_to_a_known_group_version(tmp_path: Path) -> None:
+    client = FakeClient()
+    client.resources["example.com/v1"] = [
+        _resource("Example", "examples"),
+        _resource("Example", "examples/status"),
+    ]
+    mapper = _mapper(client, tmp_path)
+    assert mapper.get("example.com/v1", "Example") == RestMapping("examples", True)
+    assert mapper.find("example.com/v1", "Other") is None
+    client.crds.append("others.example.com")
+    client.resources["example.com/v1"] = [_resource("Other", "others")]
+    assert mapper.get("example.com/v1", "Other") == RestMapping("others", True)
+    # the saved results of the new set of CRDs have the new kind too
+    assert _mapper(client, tmp_path).get("example.com/v1", "Other") is not None
+
+
+def test_partial_discovery_isnt_saved(tmp_path: Path) -> None:
+    client = FakeClient()
+    client.resources["v1"] = [_resource("ConfigMap", "configmaps")]
+    client.resources["example.com/v1"] = None
+    mapper = _mapper(client, tmp_path)
+    # what was discovered is still used
+    assert mapper.get("v1", "ConfigMap") == RestMapping("configmaps", True)
+    assert list(tmp_path.iterdir()) == []
+    # and the discovery runs again on the next miss
+    client.resources["example.com/v1"] = [_resource("Example", "examples")]
+    assert mapper.get("example.com/v1", "Example") == RestMapping("examples", True)
+    assert len(list(tmp_path.iterdir())) == 1
@@ -0,0 +1,226 @@
+import io
+import json
+import sys
+import urllib.error
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+import schema_validation
+from cache_dir import GITOPS_CACHE_DIR_ENV_VAR_NAME
+from schema_validation import (
+    DEFINITIONS_FILE_NAME,
+    MISSING_SCHEMA_SUFFIX,
+    ValidatorStore,
+    _bundle,
+    main,
+    vendor_schemas,
+)
+
+pytestmark = pytest.mark.offline
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "data": {"$ref": "_definitions.json#/definitions/data"},
+        "metadata": {"$ref": "_definitions.json#/definitions/meta"},
+    },
+}
+DEFINITIONS = {
+    "definitions": {
+        "data": {"type": "object", "additionalProperties": {"type": "string"}},
+        "meta": {
+            "type": "object",
+            "properties": {"labels": {"$ref": "#/definitions/data"}},
+        },
+        "unused": {"type": "string"},
+    }
+}
+MANIFESTS = """apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: a
+data:
+  key: value
+---
+apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: b
+  namespace: default
+data:
+  key: 1
+---
+apiVersion: example.com/v1
+kind: Example
+metadata:
+  name: c
+---
+- not an object
+"""
+
+
+@pytest.fixture
+def schema_dir(tmp_path: Path) -> Path:
+    schema_dir = tmp_path / "schemas"
+    schema_dir.mkdir()
+    (schema_dir / "configmap-v1.json").write_text(json.dumps(SCHEMA))
+    (schema_dir / DEFINITIONS_FILE_NAME).write_text(json.dumps(DEFINITIONS))
+    return schema_dir
+
+
+def test_bundle(schema_dir: Path) -> None:
+    bundled = _bundle(SCHEMA, str(schema_dir))
+    assert bundled["properties"]["data"] == {"$ref": "#/definitions/data"}
+    # references inside the definitions file are rewritten too, and only what's used is inlined
+    assert bundled["definitions"] == {
+        "data": DEFINITIONS["definitions"]["data"],
+        "meta": {
+            "type": "object",
+            "properties": {"labels": {"$ref": "#/definitions/data"}},
+        },
+    }
+
+
+def test_validator_cache(
+    schema_dir: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    bundles: list[Any] = []
+    bundle = schema_validation._bundle
+
+    def counting_bundle(schema: Any, directory: str) -> Any:
+        bundles.append(schema)
+        return bundle(schema, directory)
+
+    monkeypatch.setattr(schema_validation, "_bundle", counting_bundle)
+
+    def validator() -> Any:
+        store = ValidatorStore(str(schema_dir), str(tmp_path))
+        return store.get("v1", "ConfigMap")
+
+    assert validator().is_valid({"data": {"key": "value"}})
+    assert validator() is not None
+    assert len(bundles) == 1
+    # changing the definitions the schema was bundled with invalidates it
+    definitions = json.loads(json.dumps(DEFINITIONS))
+    definitions["definitions"]["data"]["additionalProperties"] = {"type": "integer"}
+    (schema_dir / DEFINITIONS_FILE_NAME).write_text(json.dumps(definitions))
+    assert validator().is_valid({"data": {"key": 1}})
+    assert len(bundles) == 2
+    assert ValidatorStore(str(schema_dir), str(tmp_path)).get("v1", "Example") is None
+
+
+def _urlopen(responses: list[str]) -> Any:
+    # answers with the next of 'responses': a schema, 'missing' for a 404 or 'down' for a network error
+    def urlopen(url: str, timeout: int) -> Any:
+        response = responses.pop(0)
+        if response == "missing":
+            raise urllib.error.HTTPError(url, 404, "Not Found", {}, None)  # type: ignore[arg-type]
+        if response == "down":
+            raise urllib.error.URLError("unreachable")
+        return io.BytesIO(response.encode())
+
+    return urlopen
+
+
+def test_vendor_missing_markers(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    manifests = tmp_path / "manifests.yaml"
+    manifests.write_text("apiVersion: example.com/v1\nkind: Example\n")
+    schema_dir = tmp_path / "schemas"
+    (tmp_path / "schemas").mkdir()
+    (schema_dir / DEFINITIONS_FILE_NAME).write_text("{}")
+    marker = schema_dir / ("example-example-v1.json" + MISSING_SCHEMA_SUFFIX)
+
+    def vendor(responses: list[str], retry_missing: bool = False) -> list[str]:
+        monkeypatch.setattr(
+            schema_validation.urllib.request, "urlopen", _urlopen(responses)
+        )
+        missing = vendor_schemas([str(manifests)], str(schema_dir), retry_missing)
+        assert responses == []
+        return missing
+
+    # unreachable repositories don't mark the schema as missing
+    assert vendor(["down"]) == ["example-example-v1.json"]
+    assert not marker.exists()
+    # none of the repositories has it
+    assert vendor(["missing", "missing"]) == ["example-example-v1.json"]
+    assert marker.exists()
+    # and it isn't looked for again, unless asked to
+    assert vendor([]) == ["example-example-v1.json"]
+    assert vendor(["missing", "{}"], retry_missing=True) == []
+    assert not marker.exists()
+    assert (schema_dir / "example-example-v1.json").read_text() == "{}"
+
+
+@pytest.fixture
+def validate(
+    schema_dir: Path,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture,
+) -> Any:
+    manifests = tmp_path / "manifests.yaml"
+    manifests.write_text(MANIFESTS)
+    monkeypatch.setenv(GITOPS_CACHE_DIR_ENV_VAR_NAME, str(tmp_path / "cache"))
+
+    def run(output_format: str) -> tuple[int, str, str]:
+        monkeypatch.setattr(
+            sys,
+            "argv",
+            [
+                "schema_validation.py",
+                "--schema-dir",
+                str(schema_dir),
+                "validate",
+                "--workers",
+                "1",
+                "--format",
+                output_format,
+                str(manifests),
+            ],
+        )
+        return main(), capsys.readouterr().out, str(manifests)
+
+    return run
+
+
+def test_text_output(validate: Any) -> None:
+    code, out, file = validate("text")
+    assert code == 2
+    assert out.splitlines() == [
+        f"{file}: 4 documents, 1 without schema, 2 errors",
+        "  document 1 (ConfigMap 'default/b') .data.key: 1 is not of type 'string'",
+        "  document 3 .: missing 'apiVersion' or 'kind'",
+    ]
+
+
+def test_json_output(validate: Any) -> None:
+    code, out, file = validate("json")
+    assert code == 2
+    [summary] = json.loads(out)
+    assert (summary["file"], summary["documents"], summary["skipped"]) == (file, 4, 1)
+    assert summary["errors"] == [
+        {
+            "file": file,
+            "document": 1,
+            "api_version": "v1",
+            "kind": "ConfigMap",
+            "name": "b",
+            "namespace": "default",
+            "path": ".data.key",
+            "message": "1 is not of type 'string'",
+        },
+        {
+            "file": file,
+            "document": 3,
+            "api_version": "",
+            "kind": "",
+            "name": "",
+            "namespace": "",
+            "path": "",
+            "message": "missing 'apiVersion' or 'kind'",
+        },
+    ]
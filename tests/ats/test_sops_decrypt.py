@@ -0,0 +1,171 @@
+import subprocess  # nosec B404 - only faked here
+from pathlib import Path
+from typing import Any, Optional
+
+import pytest
+import yaml
+
+import sops_decrypt
+from kustomization_index import FluxKustomization
+from postbuild_substitution import compile_substitution
+from sops_decrypt import PGP_PRIVATE_KEY_HEADER, SopsDecryptor
+
+pytestmark = pytest.mark.offline
+
+WC_KEY = f"{PGP_PRIVATE_KEY_HEADER}\nwc\n"
+
+ENCRYPTED = """apiVersion: v1
+kind: Secret
+metadata:
+  name: first
+data:
+  value: ENC[AES256_GCM,data:abc,type:str]
+sops:
+  mac: first-mac
+---
+apiVersion: v1
+kind: Secret
+metadata:
+  name: wc-key
+stringData:
+  key: ENC[AES256_GCM,data:def,type:str]
+sops:
+  mac: wc-key-mac
+"""
+DECRYPTED = """apiVersion: v1
+kind: Secret
+metadata:
+  name: first
+data:
+  value: ${cluster}-$${cluster}
+---
+apiVersion: v1
+kind: Secret
+metadata:
+  name: wc-key
+stringData:
+  key: |
+""" + "".join(
+    f"    {line}\n" for line in WC_KEY.splitlines()
+)
+WC_ENCRYPTED = """apiVersion: v1
+kind: Secret
+metadata:
+  name: wc
+stringData:
+  value: ENC[AES256_GCM,data:ghi,type:str]
+sops:
+  mac: wc-mac
+"""
+WC_DECRYPTED = """apiVersion: v1
+kind: Secret
+metadata:
+  name: wc
+stringData:
+  value: wc-secret
+"""
+
+
+class FakeTools:
+    # stands in for 'sops' and 'gpg': 'wc.enc.yaml' can only be decrypted once the key of the workload cluster,
+    # found in 'secrets.enc.yaml', was imported
+    def __init__(self) -> None:
+        self.decrypted: list[str] = []
+        self.imported: list[bytes] = []
+
+    def run(self, args: list[str], input: bytes, **_: Any) -> Any:
+        stdout = b""
+        if args[0] == "gpg":
+            self.imported.append(input)
+        elif input.decode() == ENCRYPTED:
+            stdout = DECRYPTED.encode()
+        elif input.decode() == WC_ENCRYPTED and any(
+            WC_KEY.encode() in k for k in self.imported
+        ):
+            stdout = WC_DECRYPTED.encode()
+        if args[0] == "sops":
+            self.decrypted.append(
+                yaml.safe_load(input.decode().split("---")[0])["metadata"]["name"]
+            )
+        return subprocess.CompletedProcess(
+            args, 0 if stdout or args[0] == "gpg" else 1, stdout, b""
+        )
+
+
+@pytest.fixture
+def tools(monkeypatch: pytest.MonkeyPatch) -> FakeTools:
+    tools = FakeTools()
+    monkeypatch.setattr(sops_decrypt.subprocess, "run", tools.run)
+    monkeypatch.setattr(sops_decrypt.shutil, "which", lambda name: f"/usr/bin/{name}")
+    return tools
+
+
+@pytest.fixture
+def decryptor(tmp_path: Path, tools: FakeTools) -> SopsDecryptor:
+    files = {
+        "management-clusters/mc/secrets/secrets.enc.yaml": ENCRYPTED,
+        # the same ciphertext in another place
+        "bases/copy/secrets.enc.yaml": ENCRYPTED,
+        "management-clusters/mc/secrets/wc.enc.yaml": WC_ENCRYPTED,
+        "management-clusters/mc/secrets/plain.yaml": "kind: ConfigMap\n",
+    }
+    for file, content in files.items():
+        (tmp_path / file).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / file).write_text(content)
+    return SopsDecryptor(str(tmp_path), [b"master key"], workers=2).load()
+
+
+def _decrypt(
+    decryptor: SopsDecryptor, document: str, substitute: Any = None
+) -> Optional[dict]:
+    decrypted = decryptor.decrypt_document(document, substitute)
+    return None if decrypted is None else yaml.safe_load(decrypted)
+
+
+def test_decrypted_once_per_ciphertext(
+    decryptor: SopsDecryptor, tools: FakeTools
+) -> None:
+    # both copies of 'secrets.enc.yaml' are one ciphertext, 'wc.enc.yaml' is tried again after the key import
+    assert sorted(tools.decrypted) == ["first", "wc", "wc"]
+    assert tools.imported[0] == b"master key"
+    assert WC_KEY.encode() in tools.imported[-1]
+    assert _decrypt(decryptor, WC_ENCRYPTED) == yaml.safe_load(WC_DECRYPTED)
+
+
+def test_matched_by_mac(decryptor: SopsDecryptor) -> None:
+    # rendered with another namespace and labels, those are kept
+    rendered = ENCRYPTED.split("---\n")[0].replace(
+        "  name: first\n", "  name: first\n  namespace: org-a\n  labels:\n    a: b\n"
+    )
+    assert _decrypt(decryptor, rendered) == {
+        "apiVersion": "v1",
+        "kind": "Secret",
+        "metadata": {"name": "first", "namespace": "org-a", "labels": {"a": "b"}},
+        "data": {"value": "${cluster}-$${cluster}"},
+    }
+    assert _decrypt(decryptor, rendered.replace("first-mac", "other-mac")) is None
+    assert _decrypt(decryptor, "kind: ConfigMap\nmetadata:\n  name: sops\n") is None
+
+
+def test_substitutes_only_the_decrypted_fields(decryptor: SopsDecryptor) -> None:
+    rendered = ENCRYPTED.split("---\n")[0].replace(
+        "name: first", "name: first-$${cluster}"
+    )
+    substitution = compile_substitution(
+        FluxKustomization(
+            "./ks.yaml", "ks", "default", "./app", {"substitute": {"cluster": "mc"}}
+        ),
+        lambda *_: None,
+    )
+    substituted: list[str] = []
+
+    def substitute(text: str) -> str:
+        substituted.append(text)
+        return substitution.apply(text)
+
+    decrypted = _decrypt(decryptor, rendered, substitute)
+    assert decrypted is not None
+    assert substituted == ["data:\n  value: ${cluster}-$${cluster}\n"]
+    assert decrypted["data"] == {"value": "mc-${cluster}"}
+    # the rest of the document was substituted when it was rendered
+    assert decrypted["metadata"]["name"] == "first-$${cluster}"
@@ -0,0 +1,77 @@
+from typing import Any
+
+import pytest
+from deepdiff import DeepDiff
+
+from subset_match import is_subset
+
+pytestmark = pytest.mark.offline
+
+
+def deepdiff_is_subset(expected: Any, actual: Any) -> bool:
+    # what 'assert_objects' accepted when it used DeepDiff: only keys added on the real object
+    diff = DeepDiff(expected, actual, ignore_order=True)
+    return len(diff) == 0 or list(diff.keys()) == ["dictionary_item_added"]
+
+
+@pytest.mark.parametrize(
+    "expected,actual",
+    [
+        ({"a": 1}, {"a": 1}),
+        ({"a": 1}, {"a": 1, "b": 2}),
+        ({"a": {"b": 1}}, {"a": {"b": 1, "c": 2}}),
+        ({"a": 1}, {"a": 2}),
+        ({"a": 1}, {"a": "1"}),
+        ({"a": 1, "b": 2}, {"a": 1}),
+        ([1, 2, 3], [3, 1, 2]),
+        ([1, 2], [1, 2, 3]),
+        ([1, 2, 3], [1, 2]),
+        ([[1, 2], [3]], [[3], [2, 1]]),
+        ([{"name": "a"}], [{"name": "b"}]),
+        (
+            {"spec": {"values": "a: 1\n", "suspend": False}},
+            {"spec": {"values": "a: 1\n", "suspend": False}},
+        ),
+        ({"spec": {"suspend": False}}, {"spec": {"suspend": None}}),
+    ],
+)
+def test_same_as_deepdiff(expected: Any, actual: Any) -> None:
+    assert is_subset(expected, actual) == deepdiff_is_subset(expected, actual)
+
+
+@pytest.mark.parametrize(
+    "expected,actual,result",
+    [
+        # DeepDiff pairs list items by similarity and rejects these, though each expected item has its own match
+        (
+            [{"a": 1}, {"a": 1, "b": 2}],
+            [{"a": 1, "b": 2, "c": 3}, {"a": 1, "b": 3}],
+            True,
+        ),
+        (
+            [{"a": 1, "b": 2}, {"a": 1}],
+            [{"a": 1, "b": 3}, {"a": 1, "b": 2, "c": 3}],
+            True,
+        ),
+        ([{"n": "a"}, {"n": "b"}], [{"n": "b", "v": 1}, {"n": "a", "v": 2}], True),
+        ([{"a": 1}, {"a": 2}], [{"a": 1, "b": 2}, {"a": 1}], False),
+        # DeepDiff ignores repetitions with 'ignore_order', lists are multisets here
+        ([1, 2, 2], [2, 1, 2], True),
+        ([1, 2, 2], [1, 1, 2], False),
+        ({"a": [1]}, {"a": [1, 1]}, False),
+        ([{"a": 1}, {"a": 1}], [{"a": 1, "b": 1}, {"a": 1, "b": 2}], True),
+        ([{"a": 1}, {"a": 1}], [{"a": 1, "b": 1}, {"b": 2}], False),
+    ],
+)
+def test_lists_are_matched_as_multisets(
+    expected: Any, actual: Any, result: bool
+) -> None:
+    assert is_subset(expected, actual) is result
+
+
+def test_every_assignment_is_tried() -> None:
+    # every expected item fits the first real item, but only one assignment matches them all
+    actual = [{f"k{j}": j for j in range(i, 6)} | {"i": i} for i in range(6)]
+    expected = [{f"k{j}": j for j in range(i, 6)} for i in reversed(range(6))]
+    assert is_subset(expected, actual)
+    assert not is_subset(expected + [{"k0": 0}], actual + [{"k": 0}])
@@ -0,0 +1,198 @@
+import os
+from pathlib import Path
+from typing import Any
+
+import pytest
+import yaml
+
+import file_watcher
+import watch
+from cache_dir import GITOPS_CACHE_DIR_ENV_VAR_NAME
+from file_watcher import PollingWatcher, create_watcher
+from render import Renderer
+from watch import ResultSink, WatchSession
+
+pytestmark = pytest.mark.offline
+
+MC = """apiVersion: kustomize.toolkit.fluxcd.io/v1
+kind: Kustomization
+metadata:
+  name: apps
+  namespace: default
+spec:
+  path: ./management-clusters/mc/apps
+  postBuild:
+    substituteFrom:
+      - kind: ConfigMap
+        name: vars
+---
+apiVersion: kustomize.toolkit.fluxcd.io/v1
+kind: Kustomization
+metadata:
+  name: other
+  namespace: default
+spec:
+  path: ./management-clusters/mc/other
+"""
+FILES = {
+    "management-clusters/mc/mc.yaml": MC,
+    "management-clusters/mc/vars/vars.yaml": """apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: vars
+  namespace: default
+data:
+  cluster: mc
+""",
+    "management-clusters/mc/apps/a.yaml": "kind: ConfigMap\n",
+    "management-clusters/mc/other/b.yaml": "kind: ConfigMap\n",
+    "README.md": "# repo\n",
+}
+
+
+class NameRenderer(Renderer):
+    # every build is a ConfigMap named after the variable 'cluster', instead of running kustomize
+    def _run(self, *args: str) -> str:
+        return "v5.0.0"
+
+    def build(self, path: str) -> str:
+        files = sorted(os.listdir(path))
+        return f"kind: ConfigMap\nmetadata:\n  name: ${{cluster:=none}}\ndata:\n  files: '{len(files)}'\n"
+
+
+class RecordingSink(ResultSink):
+    def __init__(self) -> None:
+        super().__init__()
+        self.events: list[dict[str, Any]] = []
+
+    def emit(self, event: dict[str, Any], lines: list[str]) -> None:
+        self.events.append(event)
+
+
+@pytest.fixture
+def repo(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    repo = tmp_path / "repo"
+    for file, content in FILES.items():
+        (repo / file).parent.mkdir(parents=True, exist_ok=True)
+        (repo / file).write_text(content)
+    monkeypatch.setenv(GITOPS_CACHE_DIR_ENV_VAR_NAME, str(tmp_path / "cache"))
+    monkeypatch.setattr(watch, "Renderer", NameRenderer)
+    return repo
+
+
+@pytest.fixture
+def session(repo: Path) -> WatchSession:
+    return WatchSession(str(repo), RecordingSink(), workers=2, validate=False)
+
+
+def _write(repo: Path, file: str, content: str) -> str:
+    (repo / file).parent.mkdir(parents=True, exist_ok=True)
+    (repo / file).write_text(content)
+    return file
+
+
+def _affected(session: WatchSession, *files: str) -> list[str]:
+    return [k.name for k in session._affected(set(files))]
+
+
+def test_changed_inputs(repo: Path, session: WatchSession) -> None:
+    assert _affected(session, "management-clusters/mc/apps/a.yaml") == ["apps"]
+    assert _affected(session, "README.md") == []
+    # new files in a directory the kustomization.yaml is generated from
+    new = _write(repo, "management-clusters/mc/other/c.yaml", "kind: ConfigMap\n")
+    assert _affected(session, new) == ["other"]
+    os.unlink(repo / new)
+    assert _affected(session, new) == ["other"]
+
+
+def test_changed_definitions(repo: Path, session: WatchSession) -> None:
+    mc = "management-clusters/mc/mc.yaml"
+    # the file declaring the Kustomizations is an input of both
+    _write(repo, mc, MC.replace("/other", "/apps"))
+    assert _affected(session, mc) == ["apps", "other"]
+    assert (
+        "management-clusters/mc/apps/a.yaml"
+        in session._graph.inputs[("default", "other")]
+    )
+    # removed Kustomizations aren't rendered
+    _write(repo, mc, MC.split("---\n")[0])
+    assert _affected(session, mc) == ["apps"]
+
+
+def test_changed_values(repo: Path, session: WatchSession) -> None:
+    # values in a file the graph didn't know, for a Kustomization that didn't use them
+    extra = _write(
+        repo,
+        "management-clusters/mc/vars/extra.yaml",
+        "apiVersion: v1\nkind: ConfigMap\nmetadata:\n  name: extra\n  namespace: default\n"
+        "data:\n  cluster: extra\n",
+    )
+    _write(
+        repo,
+        "management-clusters/mc/mc.yaml",
+        MC
+        + "  postBuild:\n    substituteFrom:\n      - kind: ConfigMap\n        name: extra\n",
+    )
+    assert _affected(session, extra, "management-clusters/mc/mc.yaml") == [
+        "apps",
+        "other",
+    ]
+    vars_file = _write(
+        repo,
+        "management-clusters/mc/vars/vars.yaml",
+        FILES["management-clusters/mc/vars/vars.yaml"].replace("mc", "mc-2"),
+    )
+    assert _affected(session, vars_file) == ["apps"]
+
+
+def _rendered_names(session: WatchSession) -> dict[str, int]:
+    sink = session._sink
+    assert isinstance(sink, RecordingSink)
+    results = [e for e in sink.events if e["type"] == "result"]
+    sink.events.clear()
+    assert all(e["status"] == "ok" for e in results)
+    return {e["kustomization"]: e["documents"] for e in results}
+
+
+def test_handle(repo: Path, session: WatchSession) -> None:
+    session.run_all()
+    assert _rendered_names(session) == {"default/apps": 1, "default/other": 1}
+    vars_file = _write(
+        repo,
+        "management-clusters/mc/vars/vars.yaml",
+        FILES["management-clusters/mc/vars/vars.yaml"].replace("mc", "mc-2"),
+    )
+    session.handle({vars_file})
+    summary = session._sink.events[-1]  # type: ignore[attr-defined]
+    assert (summary["type"], summary["changed"]) == ("summary", [vars_file])
+    assert _rendered_names(session) == {"default/apps": 1}
+    # the new values are the ones rendered
+    [result] = session._renderer.render_all(
+        [k for k in session._index if k.name == "apps"]
+    )
+    assert yaml.safe_load(result.manifests)["metadata"]["name"] == "mc-2"
+
+
+def test_polling_watcher(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(file_watcher, "POLL_INTERVAL_SEC", 0.01)
+    (tmp_path / "a.yaml").write_text("a: 1\n")
+    (tmp_path / "b.yaml").write_text("b: 1\n")
+    (tmp_path / ".git").mkdir()
+    watcher = PollingWatcher(str(tmp_path))
+    assert watcher.wait(0.05) == set()
+    (tmp_path / "a.yaml").write_text("a: 22\n")
+    (tmp_path / "b.yaml").unlink()
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "c.yaml").write_text("c: 1\n")
+    (tmp_path / "a.yaml.swp").write_text("")
+    (tmp_path / ".git" / "index").write_text("")
+    assert watcher.wait(1) == {"a.yaml", "b.yaml", os.path.join("sub", "c.yaml")}
+    assert watcher.wait(0.05) == set()
+
+
+def test_falls_back_to_polling(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    def no_inotify(root: str) -> None:
+        raise OSError(24, "Too many open files")
+
+    monkeypatch.setattr(file_watcher, "InotifyWatcher", no_inotify)
+    assert isinstance(create_watcher(str(tmp_path)), PollingWatcher)
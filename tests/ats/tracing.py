@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, NamedTuple, Optional
+
+import pytest
+
+GITOPS_TRACE_FILE_ENV_VAR_NAME = "GITOPS_TRACE_FILE"
+TRACE_PLUGIN_NAME = "gitops-trace"
+SUMMARY_SIZE = 20
+# categories of spans
+FIXTURE_CATEGORY = "fixture"
+TEST_CATEGORY = "test"
+STEP_CATEGORY = "step"
+# spans of a single object, listed in the summary of the slowest objects
+FLUX_OBJECT_CATEGORY = "flux-object"
+ASSERTION_CATEGORY = "assertion"
+OBJECT_CATEGORIES = (FLUX_OBJECT_CATEGORY, ASSERTION_CATEGORY)
+
+
+class Span(NamedTuple):
+    name: str
+    category: str
+    # seconds since the tracer was created
+    start: float
+    duration: float
+    thread_id: int
+    args: dict[str, Any]
+
+
+class Tracer:
+    # Collects spans from any thread. Disabled by default, so instrumented code costs next to nothing when
+    # nobody asked for a trace.
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._origin = time.monotonic()
+        self._spans: list[Span] = []
+        self._thread_names: dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self, name: str, category: str, start: float, duration: float, **args: Any
+    ) -> None:
+        # 'start' is a 'time.monotonic()' value
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        with self._lock:
+            self._thread_names[thread.ident or 0] = thread.name
+            self._spans.append(
+                Span(
+                    name,
+                    category,
+                    start - self._origin,
+                    duration,
+                    thread.ident or 0,
+                    args,
+                )
+            )
+
+    @contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[dict[str, Any]]:
+        # the yielded dict can be filled with more args while the span is open, like a number of retries
+        start = time.monotonic()
+        try:
+            yield args
+        finally:
+            self.record(name, category, start, time.monotonic() - start, **args)
+
+    def spans(self, categories: Optional[tuple[str, ...]] = None) -> list[Span]:
+        with self._lock:
+            spans = list(self._spans)
+        if categories is None:
+            return spans
+        return [s for s in spans if s.category in categories]
+
+    def chrome_trace(self) -> dict:
+        # https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+        pid = os.getpid()
+        with self._lock:
+            thread_names = dict(self._thread_names)
+        events: list[dict] = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": n},
+            }
+            for tid, n in thread_names.items()
+        ]
+        events += [
+            {
+                "name": s.name,
+                "cat": s.category,
+                "ph": "X",
+                "ts": round(s.start * 1e6),
+                "dur": round(s.duration * 1e6),
+                "pid": pid,
+                "tid": s.thread_id,
+                "args": s.args,
+            }
+            for s in self.spans()
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path: str) -> None:
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        os.replace(tmp_file, path)
+
+
+# the tracer used by all the modules of the test suite
+tracer = Tracer()
+
+
+def _format_args(args: dict[str, Any]) -> str:
+    return ", ".join(f"{k}={v}" for k, v in args.items())
+
+
+class TracePlugin:
+    # Records a span for every fixture set up and every test run, writes all the spans in the Chrome trace event
+    # format (to open in 'chrome://tracing' or https://ui.perfetto.dev) and prints the slowest ones at the end.
+
+    def __init__(self, trace_file: str) -> None:
+        self._trace_file = trace_file
+        tracer.enabled = True
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_fixture_setup(
+        self, fixturedef: pytest.FixtureDef, request: pytest.FixtureRequest
+    ) -> Iterator[None]:
+        with tracer.span(fixturedef.argname, FIXTURE_CATEGORY, scope=fixturedef.scope):
+            yield
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item: pytest.Item) -> Iterator[None]:
+        with tracer.span(item.nodeid, TEST_CATEGORY):
+            yield
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_teardown(self, item: pytest.Item) -> Iterator[None]:
+        # module scoped fixtures are torn down here, after the last test of the module
+        with tracer.span(f"teardown {item.nodeid}", TEST_CATEGORY):
+            yield
+
+    def pytest_sessionfinish(self, session: pytest.Session) -> None:
+        tracer.write(self._trace_file)
+
+    def _write_table(
+        self, terminalreporter: Any, title: str, spans: list[Span]
+    ) -> None:
+        if not spans:
+            return
+        terminalreporter.write_sep("-", title)
+        for s in sorted(spans, key=lambda s: s.duration, reverse=True)[:SUMMARY_SIZE]:
+            terminalreporter.write_line(
+                f"{s.duration:9.2f}s  {s.category:<12} {s.name}  {_format_args(s.args)}".rstrip()
+            )
+
+    def pytest_terminal_summary(self, terminalreporter: Any) -> None:
+        phases = [s for s in tracer.spans() if s.category not in OBJECT_CATEGORIES]
+        self._write_table(terminalreporter, "slowest phases", phases)
+        self._write_table(
+            terminalreporter, "slowest objects", tracer.spans(OBJECT_CATEGORIES)
+        )
+        terminalreporter.write_line(f"Trace written to '{self._trace_file}'.")
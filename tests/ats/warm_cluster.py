@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import threading
+from typing import Callable, Optional
+
+import pykube
+from pykube.exceptions import HTTPError
+
+WARM_CLUSTER_CONFIG_MAP_NAME = "gitops-ats-warm-cluster"
+WARM_CLUSTER_CONFIG_MAP_NAMESPACE = "default"
+# creating the ConfigMap can race with another test run doing the same
+UPDATE_ATTEMPTS = 3
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(*parts: str) -> str:
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(part.encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+class WarmCluster:
+    # Remembers in a ConfigMap what the bootstrap fixtures installed in the test cluster, as a fingerprint of
+    # everything that decides the result of the installation (versions, manifests' content). When enabled, a
+    # fixture finding a matching fingerprint, and a probe confirming the installation is still there, skips
+    # both the installation and the teardown, so the next run can reuse the cluster as it is.
+
+    def __init__(self, kube_client: pykube.HTTPClient, enabled: bool) -> None:
+        self._kube_client = kube_client
+        self.enabled = enabled
+        # bootstrap fixtures run in parallel threads
+        self._lock = threading.Lock()
+
+    def _config_map(self) -> Optional[pykube.ConfigMap]:
+        return (
+            pykube.ConfigMap.objects(self._kube_client)
+            .filter(namespace=WARM_CLUSTER_CONFIG_MAP_NAMESPACE)
+            .get_or_none(name=WARM_CLUSTER_CONFIG_MAP_NAME)
+        )
+
+    def installed_fingerprint(self, component: str) -> Optional[str]:
+        config_map = self._config_map()
+        if config_map is None:
+            return None
+        return (config_map.obj.get("data") or {}).get(component)
+
+    def is_installed(
+        self, component: str, expected_fingerprint: str, probe: Callable[[], bool]
+    ) -> bool:
+        if not self.enabled:
+            return False
+        if self.installed_fingerprint(component) != expected_fingerprint:
+            return False
+        # the cluster might have been changed by hand since the fingerprint was saved
+        if not probe():
+            logger.info(
+                f"'{component}' has a matching fingerprint, but isn't in the cluster anymore."
+            )
+            return False
+        logger.info(f"Reusing '{component}' already installed in the cluster.")
+        return True
+
+    def _patch_data(self, data: dict[str, Optional[str]]) -> None:
+        # A JSON merge patch of the given keys only, without a resourceVersion, so components marked at the same
+        # time don't overwrite each other or fail with a conflict. A None value removes the key.
+        metadata = {
+            "name": WARM_CLUSTER_CONFIG_MAP_NAME,
+            "namespace": WARM_CLUSTER_CONFIG_MAP_NAMESPACE,
+        }
+        with self._lock:
+            for _ in range(UPDATE_ATTEMPTS):
+                try:
+                    pykube.ConfigMap(self._kube_client, {"metadata": metadata}).patch(
+                        {"data": data}
+                    )
+                    return
+                except HTTPError as err:
+                    if err.code != 404:
+                        raise
+                values = {k: v for k, v in data.items() if v is not None}
+                if not values:
+                    # nothing to remove from a ConfigMap that doesn't exist
+                    return
+                try:
+                    pykube.ConfigMap(
+                        self._kube_client, {"metadata": metadata, "data": values}
+                    ).create()
+                    return
+                except HTTPError as err:
+                    # 409 when created by another run in the meantime, patch it then
+                    if err.code != 409:
+                        raise
+        msg = f"Can't update the '{WARM_CLUSTER_CONFIG_MAP_NAME}' ConfigMap, it keeps changing."
+        logger.error(msg)
+        raise Exception(msg)
+
+    def mark_installed(self, component: str, installed_fingerprint: str) -> None:
+        if not self.enabled:
+            return
+        self._patch_data({component: installed_fingerprint})
+
+    def forget(self, component: str) -> None:
+        self._patch_data({component: None})
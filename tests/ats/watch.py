@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import os
+import socket
+import stat
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Optional
+
+from dependency_graph import DependencyGraph, kustomization_key
+from file_watcher import create_watcher
+from kustomization_index import DEFAULT_SCAN_DIRS, FluxKustomization, KustomizationIndex
+from postbuild_substitution import (
+    VALUES_KIND_RE,
+    RepoValuesResolver,
+    compile_substitution,
+    split_documents,
+)
+from render import KUSTOMIZATION_FILE_NAMES, Renderer, RenderResult
+from render_cache import RenderCache
+from schema_validation import DocumentError, validate_documents, validator_pool
+
+# (namespace, name) of a Kustomization
+KustomizationKey = tuple[str, str]
+
+logger = logging.getLogger(__name__)
+
+
+class ResultSink:
+    # Prints results to the terminal and streams them as JSON lines to every client of a unix socket, so an
+    # editor or another terminal can follow them.
+
+    def __init__(self, socket_path: Optional[str] = None) -> None:
+        self._socket_path = socket_path
+        self._clients: list[socket.socket] = []
+        self._lock = threading.Lock()
+        self._server: Optional[socket.socket] = None
+        if not socket_path:
+            return
+        if os.path.exists(socket_path):
+            if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                msg = f"'{socket_path}' exists and isn't a socket."
+                logger.error(msg)
+                raise Exception(msg)
+            # left by a previous run
+            os.unlink(socket_path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(socket_path)
+        self._server.listen()
+        threading.Thread(target=self._accept, name="watch-socket", daemon=True).start()
+
+    def _accept(self) -> None:
+        assert self._server is not None  # nosec B101 - started only with a server
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._clients.append(client)
+
+    def emit(self, event: dict[str, Any], lines: list[str]) -> None:
+        for line in lines:
+            print(line, flush=True)
+        data = (json.dumps(event) + "\n").encode()
+        with self._lock:
+            for client in list(self._clients):
+                try:
+                    client.sendall(data)
+                except OSError:
+                    client.close()
+                    self._clients.remove(client)
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        with self._lock:
+            for client in self._clients:
+                client.close()
+        if self._socket_path and os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+
+
+def _error_line(err: DocumentError) -> str:
+    name = f"{err.namespace}/{err.name}" if err.namespace else err.name
+    obj = f"{err.kind} '{name}' " if err.kind else ""
+    return f"    document {err.document} {obj}{err.path or '.'}: {err.message}"
+
+
+class WatchSession:
+    # Keeps the Kustomization index, the dependency graph and the variables of 'substituteFrom' in memory and
+    # updates them from the changed files only. Each change renders and validates the Kustomizations it
+    # affects: the ones built from a changed file, the ones whose definition changed and the ones whose
+    # variables changed. Validators stay loaded in a pool of worker processes between changes.
+
+    def __init__(
+        self,
+        repo_root: str,
+        sink: ResultSink,
+        workers: Optional[int] = None,
+        use_flux: bool = False,
+        validate: bool = True,
+    ) -> None:
+        self._repo_root = os.path.abspath(repo_root)
+        self._sink = sink
+        self._index = KustomizationIndex(self._repo_root).load()
+        self._graph = DependencyGraph(self._repo_root, self._index).build()
+        self._values = RepoValuesResolver(self._repo_root)
+        self._renderer = Renderer(
+            self._repo_root,
+            workers,
+            # the values are loaded again when a ConfigMap or a Secret changes
+            resolver=lambda kind, namespace, name: self._values(kind, namespace, name),
+            cache=RenderCache(),
+            use_flux=use_flux,
+        )
+        self._pool: Optional[ProcessPoolExecutor] = None
+        if validate:
+            self._pool = validator_pool(workers=workers)
+
+    def _in_scan_dirs(self, file: str) -> bool:
+        return file.split(os.sep, 1)[0] in DEFAULT_SCAN_DIRS
+
+    def _values_changed(self, changed: set[str]) -> bool:
+        # ConfigMaps and Secrets 'substituteFrom' can use are looked for in the scanned directories only
+        for file in changed:
+            if not file.endswith(".yaml") or not self._in_scan_dirs(file):
+                continue
+            try:
+                with open(os.path.join(self._repo_root, file), "rb") as f:
+                    if VALUES_KIND_RE.search(f.read()):
+                        return True
+            except OSError:
+                # deleted, it may have held values
+                return True
+        return False
+
+    def _graph_changed(self, changed: set[str]) -> bool:
+        # new files and kustomization.yaml edits change what builds read, not only what they render
+        return any(
+            os.path.basename(f) in KUSTOMIZATION_FILE_NAMES
+            or (
+                f.endswith(".yaml")
+                and self._in_scan_dirs(f)
+                and not self._graph.knows(f)
+            )
+            for f in changed
+        )
+
+    def _variables(self) -> dict[KustomizationKey, dict[str, str]]:
+        return {
+            kustomization_key(k): compile_substitution(k, self._values).variables
+            for k in self._index
+            if k.post_build.get("substituteFrom")
+        }
+
+    def _affected(self, changed: set[str]) -> list[FluxKustomization]:
+        affected = {kustomization_key(k) for k in self._graph.affected(changed)}
+        old = {kustomization_key(k): k for k in self._index}
+        self._index = KustomizationIndex(self._repo_root).load()
+        new = {kustomization_key(k): k for k in self._index}
+        affected |= {key for key, k in new.items() if old.get(key) != k}
+        if self._values_changed(changed):
+            variables = self._variables()
+            self._values = RepoValuesResolver(self._repo_root)
+            affected |= {
+                key for key, v in self._variables().items() if variables.get(key) != v
+            }
+        if old != new or self._graph_changed(changed):
+            self._graph = DependencyGraph(self._repo_root, self._index).build()
+            affected |= {kustomization_key(k) for k in self._graph.affected(changed)}
+        # Kustomizations that don't exist anymore aren't rendered
+        return [k for k in self._index if kustomization_key(k) in affected]
+
+    def _report(
+        self, result: RenderResult, validation: Optional[Future]
+    ) -> tuple[dict[str, Any], list[str]]:
+        k = result.kustomization
+        event: dict[str, Any] = {
+            "kustomization": f"{k.namespace}/{k.name}",
+            "status": "ok",
+        }
+        if result.error:
+            event |= {"status": "render-failed", "error": result.error}
+            return event, [f"  FAILED   {event['kustomization']}: {result.error}"]
+        documents = len(split_documents(result.manifests))
+        event["documents"] = documents
+        if validation is None:
+            return event, [
+                f"  OK       {event['kustomization']}: {documents} documents"
+            ]
+        skipped, errors = validation.result()
+        event |= {"skipped": skipped, "errors": [e._asdict() for e in errors]}
+        summary = (
+            f"{event['kustomization']}: {documents} documents, {skipped} without schema"
+        )
+        if not errors:
+            return event, [f"  OK       {summary}"]
+        event["status"] = "invalid"
+        return event, [f"  INVALID  {summary}, {len(errors)} errors"] + [
+            _error_line(e) for e in errors
+        ]
+
+    def run(self, kustomizations: list[FluxKustomization], changed: list[str]) -> None:
+        start = time.monotonic()
+        results = self._renderer.render_all(kustomizations)
+        validations = [
+            (
+                self._pool.submit(
+                    validate_documents,
+                    f"{r.kustomization.namespace}/{r.kustomization.name}",
+                    0,
+                    split_documents(r.manifests),
+                )
+                if self._pool is not None and not r.error
+                else None
+            )
+            for r in results
+        ]
+        reports = [self._report(r, v) for r, v in zip(results, validations)]
+        duration = time.monotonic() - start
+        for event, lines in reports:
+            self._sink.emit(event | {"type": "result"}, lines)
+        failed = sum(1 for event, _ in reports if event["status"] != "ok")
+        self._sink.emit(
+            {
+                "type": "summary",
+                "changed": changed,
+                "kustomizations": len(reports),
+                "failed": failed,
+                "seconds": duration,
+            },
+            [
+                f"[{datetime.now():%H:%M:%S}] {len(changed)} changed files, {len(reports)} Kustomizations, "
+                f"{failed} failed, in {duration:.2f}s"
+            ],
+        )
+
+    def run_all(self) -> None:
+        self.run(list(self._index), [])
+
+    def handle(self, changed: set[str]) -> None:
+        self._renderer.forget(changed)
+        self.run(self._affected(changed), sorted(changed))
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Renders and validates again the flux Kustomizations affected by every saved file."
+    )
+    parser.add_argument("--root", default=".", help="repository root directory")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of parallel renders and validations (default: CPU count)",
+    )
+    parser.add_argument(
+        "--use-flux",
+        action="store_true",
+        help="render with 'flux build kustomization' instead of kustomize",
+    )
+    parser.add_argument(
+        "--no-validate", action="store_true", help="only render, don't validate"
+    )
+    parser.add_argument(
+        "--socket", help="also stream the results as JSON lines on this unix socket"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    sink = ResultSink(args.socket)
+    session = WatchSession(
+        args.root, sink, args.workers, args.use_flux, not args.no_validate
+    )
+    watcher = create_watcher(args.root)
+    try:
+        session.run_all()
+        print("Watching for changes, press Ctrl+C to stop.", flush=True)
+        while True:
+            changed = watcher.wait()
+            try:
+                session.handle(changed)
+            except Exception as err:
+                # a half saved file shouldn't stop the watch
+                logger.error(f"Handling the changes failed: {err}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        session.close()
+        sink.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())